@@ -55,18 +55,28 @@ def _print_load_error(error):
     print('Please contact tsalxam@gmail.com with the above error details.')
 
 
-def nuke_menu_setup(nuke_menu=False, node_menu=False, pane_menu=True):
+def nuke_menu_setup(nuke_menu=False, node_menu=False, pane_menu=True,
+                    capture_streams=True):
     """ If in Nuke, set up menu.
 
     :param nuke_menu: `bool` Add menu items to the main Nuke menu.
     :param node_menu: `bool` Add menu item to the Node menu.
     :param pane_menu: `bool` Add menu item to the Pane menu.
+    :param capture_streams: `bool` Redirect sys.stdout and sys.stderr
+    now, so the Terminal shows output from before it was opened.
     """
     try:
         import nuke
     except ImportError:
         return
 
+    if capture_streams:
+        try:
+            from PythonEditor.core import streams
+            streams.capture()
+        except Exception as e:
+            _print_load_error(e)
+
     try:
         from PythonEditor.app.nukefeatures import nukeinit
         nukeinit.setup(nuke_menu=nuke_menu, node_menu=node_menu, pane_menu=pane_menu)
@@ -0,0 +1,260 @@
+""" Execution of code on a worker thread, so that long
+running scripts don't block the user interface and can
+be cancelled. Output is printed as usual, and reaches the
+Terminal through streams.Speaker as it is written.
+
+Code running on the worker thread must not touch Qt widgets
+(or Nuke's node graph) directly. It can pass those calls
+back to the main thread with run_in_main_thread:
+
+    from PythonEditor.core.background import run_in_main_thread
+    node = run_in_main_thread(nuke.createNode, 'Blur')
+"""
+from __future__ import print_function
+import os
+import sys
+import time
+import ctypes
+import threading
+
+from PythonEditor.ui.Qt import QtCore
+from PythonEditor.core import execute
+
+
+# set to 1 to execute on a worker thread by default.
+ENABLED = os.getenv('PYTHONEDITOR_BACKGROUND_EXECUTION', '0') == '1'
+# seconds between checks for cancellation while
+# waiting for the main thread.
+POLL_INTERVAL = 0.05
+
+
+class ExecutionCancelled(KeyboardInterrupt):
+    """ Raised in the worker thread to cancel
+    the code it is running.
+    """
+
+
+def set_async_exc(ident, exception):
+    """ Raise the exception in the thread with the given
+    ident, the next time it runs python bytecode.
+    Returns True if the thread was found.
+
+    :param ident: `int` the thread's ident
+    :param exception: `type` exception class, or None to clear it
+    """
+    if sys.version_info >= (3, 7):
+        thread_id = ctypes.c_ulong(ident)
+    else:
+        thread_id = ctypes.c_long(ident)
+    if exception is None:
+        exc = ctypes.c_void_p(None)
+    else:
+        exc = ctypes.py_object(exception)
+    count = ctypes.pythonapi.PyThreadState_SetAsyncExc(thread_id, exc)
+    if count > 1:
+        # more than one thread state was changed; undo it.
+        ctypes.pythonapi.PyThreadState_SetAsyncExc(
+            thread_id,
+            ctypes.c_void_p(None)
+        )
+        return False
+    return count == 1
+
+
+def in_main_thread():
+    """ Return True if called from the thread
+    the QApplication runs in (or if there is none).
+    """
+    app = QtCore.QCoreApplication.instance()
+    if app is None:
+        return True
+    return QtCore.QThread.currentThread() == app.thread()
+
+
+class Invoker(QtCore.QObject):
+    """ Calls functions sent from other threads
+    in the thread this object lives in.
+    """
+    call = QtCore.Signal(object)
+
+    def __init__(self):
+        super(Invoker, self).__init__()
+        self.setObjectName('Invoker')
+        self.call.connect(self.invoke, QtCore.Qt.QueuedConnection)
+
+    @QtCore.Slot(object)
+    def invoke(self, job):
+        try:
+            job['result'] = job['func'](*job['args'], **job['kwargs'])
+        except Exception as error:
+            job['error'] = error
+        job['event'].set()
+
+
+_invoker = None
+
+
+def run_in_main_thread(func, *args, **kwargs):
+    """ Call func in the main thread and return its
+    result, re-raising any exception it raised.
+    Waits for the main thread to be free, so this
+    must not be used by code the main thread waits on.
+
+    :param func: `callable` to run in the main thread.
+    """
+    if in_main_thread() or _invoker is None:
+        return func(*args, **kwargs)
+    job = {
+        'func'   : func,
+        'args'   : args,
+        'kwargs' : kwargs,
+        'event'  : threading.Event(),
+    }
+    _invoker.call.emit(job)
+    # wait in short intervals so that an
+    # ExecutionCancelled can be raised here.
+    while not job['event'].wait(POLL_INTERVAL):
+        pass
+    if 'error' in job:
+        raise job['error']
+    return job.get('result')
+
+
+class Runner(QtCore.QObject):
+    """ Runs code with execute.mainexec on a worker thread,
+    one script at a time, in the __main__ namespace.
+    Must be created in the main thread.
+
+    :signal started: the code has started running.
+    :signal finished: `object` the line numbers of
+    any errors (or None), once the code has stopped.
+    """
+    started = QtCore.Signal()
+    finished = QtCore.Signal(object)
+    done = QtCore.Signal(object)
+
+    def __init__(self):
+        super(Runner, self).__init__()
+        self.setObjectName('BackgroundRunner')
+        self.enabled = ENABLED
+        self.thread = None
+        self.start_time = None
+        self.callback = None
+        # whether cancel() may raise in the thread. Cleared
+        # under the lock once the code has stopped running.
+        self.cancellable = False
+        self.lock = threading.Lock()
+        self.done.connect(self.complete, QtCore.Qt.QueuedConnection)
+
+        global _invoker
+        if _invoker is None:
+            _invoker = Invoker()
+
+    def is_running(self):
+        return self.thread is not None
+
+    def elapsed(self):
+        """ Seconds since the current script started. """
+        if self.start_time is None:
+            return 0.0
+        return time.time() - self.start_time
+
+    def execute(self, text, whole_text, verbosity=execute.VERBOSITY_LOW,
+                callback=None, line_offset=0):
+        """ Start running the text on a worker thread.
+        Returns False if a script is already running.
+
+        :param text: `str` code to execute
+        :param whole_text: `str` all text in the document
+        :param callback: `callable` called in the main
+        thread with the error line numbers when done.
+        :param line_offset: `int` lines before the text.
+        """
+        if self.is_running():
+            print('# A script is already running in the background.')
+            return False
+        self.callback = callback
+        self.start_time = time.time()
+        self.thread = threading.Thread(
+            target=self.run,
+            args=(text, whole_text, verbosity, line_offset),
+            name='PythonEditorExecution'
+        )
+        self.thread.daemon = True
+        self.cancellable = True
+        self.thread.start()
+        self.started.emit()
+        return True
+
+    def run(self, text, whole_text, verbosity, line_offset):
+        error_line_numbers = None
+        try:
+            error_line_numbers = execute.mainexec(
+                text,
+                whole_text,
+                verbosity,
+                line_offset
+            )
+        except ExecutionCancelled:
+            print('# Cancelled after {0:.1f}s'.format(self.elapsed()))
+        except BaseException as error:
+            print('# {0}: {1}'.format(type(error).__name__, error))
+        finally:
+            self.stop_cancelling()
+            self.done.emit(error_line_numbers)
+
+    def stop_cancelling(self):
+        """ Stop cancel() from raising in the worker thread,
+        and drop an ExecutionCancelled that arrived after
+        the code had stopped, so that done is always emitted.
+        """
+        ident = threading.current_thread().ident
+        while True:
+            try:
+                with self.lock:
+                    self.cancellable = False
+                set_async_exc(ident, None)
+                return
+            except ExecutionCancelled:
+                pass
+
+    @QtCore.Slot(object)
+    def complete(self, error_line_numbers):
+        thread = self.thread
+        if thread is not None:
+            thread.join()
+        self.thread = None
+        self.start_time = None
+        callback, self.callback = self.callback, None
+        if callback is not None and error_line_numbers:
+            callback(error_line_numbers)
+        self.finished.emit(error_line_numbers)
+
+    def cancel(self):
+        """ Raise ExecutionCancelled in the running script.
+        Code blocked in a call outside of python (such as a
+        long sleep or a network read) is only interrupted
+        when that call returns.
+        """
+        thread = self.thread
+        if thread is None or not thread.is_alive():
+            return False
+        with self.lock:
+            if not self.cancellable:
+                # the code has already stopped.
+                return False
+            return set_async_exc(thread.ident, ExecutionCancelled)
+
+
+_runner = None
+
+
+def runner():
+    """ Return the Runner shared by all editors,
+    creating it on first use. As all scripts share
+    the __main__ namespace, only one runs at a time.
+    """
+    global _runner
+    if _runner is None:
+        _runner = Runner()
+    return _runner
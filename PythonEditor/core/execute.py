@@ -1,13 +1,131 @@
 import __main__
 import traceback
+import hashlib
+import ast
+import os
 import re
+from collections import OrderedDict
 
 
 FILENAME = '<Python Editor Contents>'
 VERBOSITY_LOW = 0
 VERBOSITY_HIGH = 1
 
-def mainexec(text, whole_text, verbosity=VERBOSITY_LOW):
+# the number of compiled code objects to keep.
+try:
+    CODE_CACHE_SIZE = int(os.getenv('PYTHONEDITOR_CODE_CACHE_SIZE', 128))
+except ValueError:
+    CODE_CACHE_SIZE = 128
+# longer sources are compiled every time.
+CODE_CACHE_MAX_CHARS = 4*1024*1024
+# the number of the latest execution, so that
+# output can be tagged with the one that printed it.
+EXECUTION = 0
+
+
+def compile_code(text, mode, line_offset=0):
+    """
+    Compile the text as if it started on the line after
+    line_offset, so that tracebacks refer to lines in the
+    document it came from. The offset is added to the
+    line numbers of the parsed tree, so the cost doesn't
+    depend on where the text is in the document.
+
+    :param text: code to compile
+    :param mode: 'exec' or 'single'
+    :param line_offset: number of lines before the text
+    :type text: str
+    :type mode: str
+    :type line_offset: int
+    """
+    if not line_offset:
+        return compile(text, FILENAME, mode)
+    try:
+        tree = compile(text, FILENAME, mode, ast.PyCF_ONLY_AST)
+    except SyntaxError as error:
+        if error.lineno is not None:
+            error.lineno += line_offset
+        raise
+    ast.increment_lineno(tree, line_offset)
+    return compile(tree, FILENAME, mode)
+
+
+def compile_mode(text):
+    """ Return 'single' for one line of code, which
+    prints the values of expressions, else 'exec'.
+    """
+    if len(text.strip().split('\n')) == 1:
+        return 'single'
+    return 'exec'
+
+
+def split_offset(text, line_offset=0):
+    """
+    Return the text without leading newlines, which
+    callers used to pad the text with to offset its
+    line numbers, and the offset including them.
+    """
+    source = text.lstrip('\n')
+    return source, line_offset + len(text) - len(source)
+
+
+class CodeCache(object):
+    """
+    Least recently used cache of code objects, so that
+    running the same unchanged text again (as when
+    tweaking knobs and re-running a cell) skips compiling.
+
+    Code is keyed by a hash of the source, the compile
+    mode and the line offset.
+    """
+    def __init__(self, size=CODE_CACHE_SIZE, max_chars=CODE_CACHE_MAX_CHARS):
+        self.size = size
+        self.max_chars = max_chars
+        self.codes = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, text, mode, line_offset=0):
+        data = text.encode('utf-8', 'replace')
+        return hashlib.sha1(data).hexdigest(), mode, line_offset
+
+    def compile(self, text, mode, line_offset=0):
+        """ Return the code object for the text,
+        compiling it if it isn't cached. Raises
+        SyntaxError like compile().
+        """
+        text, line_offset = split_offset(text, line_offset)
+        if self.size <= 0 or len(text) > self.max_chars:
+            return compile_code(text, mode, line_offset)
+        key = self.key(text, mode, line_offset)
+        codes = self.codes
+        code = codes.pop(key, None)
+        if code is None:
+            self.misses += 1
+            code = compile_code(text, mode, line_offset)
+            while len(codes) >= self.size:
+                codes.popitem(last=False)
+        else:
+            self.hits += 1
+        codes[key] = code
+        return code
+
+    def clear(self):
+        self.codes.clear()
+
+    def stats(self):
+        return {
+            'entries' : len(self.codes),
+            'size'    : self.size,
+            'hits'    : self.hits,
+            'misses'  : self.misses,
+        }
+
+
+CODE_CACHE = CodeCache()
+
+
+def mainexec(text, whole_text, verbosity=VERBOSITY_LOW, line_offset=0):
     """
     Code execution in top level namespace.
     Reformats exceptions to remove
@@ -15,15 +133,18 @@ def mainexec(text, whole_text, verbosity=VERBOSITY_LOW):
 
     :param text: code to execute
     :param whole_text: all text in document
+    :param line_offset: number of lines in the
+    document before the text.
     :type text: str
     :type whole_text: str
+    :type line_offset: int
     """
-    if len(text.strip().split('\n')) == 1:
-        mode = 'single'
-    else:
-        mode = 'exec'
+    global EXECUTION
+    EXECUTION += 1
+
+    mode = compile_mode(text)
     try:
-        _code = compile(text, FILENAME, mode)
+        _code = CODE_CACHE.compile(text, mode, line_offset)
     except SyntaxError:
         error_line_numbers = print_syntax_traceback()
         return error_line_numbers
@@ -82,18 +203,29 @@ def mainexec(text, whole_text, verbosity=VERBOSITY_LOW):
             return None
 
 
-def print_syntax_traceback():
+def print_syntax_traceback(error_message=None):
     """
     Print traceback without lines of
     the error that refer to this file.
+
+    :param error_message: the formatted traceback,
+    if not the exception currently being handled.
     """
+    global FILENAME
+    if error_message is None:
+        error_message = traceback.format_exc()
     print('# Python Editor SyntaxError')
-    formatted_lines = traceback.format_exc().splitlines()
+    formatted_lines = error_message.splitlines()
     print(formatted_lines[0])
-    print('\n'.join(formatted_lines[3:]))
+    # leave out the frames that compiled the code.
+    start = 3
+    for index, line in enumerate(formatted_lines):
+        if FILENAME in line:
+            start = index
+            break
+    print('\n'.join(formatted_lines[start:]))
 
     error_line_numbers = []
-    global FILENAME
     pattern = r'(?<="{0}",\sline\s)(\d+)'.format(FILENAME)
     for line in formatted_lines:
         result = re.search(pattern, line)
@@ -103,7 +235,7 @@ def print_syntax_traceback():
     return error_line_numbers
 
 
-def print_traceback(whole_text, error):
+def print_traceback(whole_text, error, error_message=None):
     """
     Print traceback ignoring lines that refer to the
     external execution python file, using the whole
@@ -112,13 +244,18 @@ def print_traceback(whole_text, error):
 
     :param whole_text: all text in document
     :param error: python exception object
+    :param error_message: the formatted traceback,
+    if not the exception currently being handled.
     :type whole_text: str
     :type error: exceptions.Exception
+    :type error_message: str
     """
-    text_lines = whole_text.split('\n')
-    num_lines = len(text_lines)
+    # only split the document if the
+    # traceback refers to lines in it.
+    text_lines = None
 
-    error_message = traceback.format_exc()
+    if error_message is None:
+        error_message = traceback.format_exc()
 
     global FILENAME
     pattern = r'(?<="{0}",\sline\s)(\d+)'.format(FILENAME)
@@ -138,6 +275,9 @@ def print_traceback(whole_text, error):
         result = re.search(pattern, line)
         if result:
             lineno = int(result.group())
+            if text_lines is None:
+                text_lines = whole_text.split('\n')
+                num_lines = len(text_lines)
             while lineno >= num_lines:
                 # FIXME: this exists to patch a logical fault
                 # When text is selected and there is no newline
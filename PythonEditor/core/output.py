@@ -0,0 +1,167 @@
+""" Output kept as records of what was written, rather than
+only as text in the Terminal. Each record is a streams.Chunk,
+holding the stream, time, thread and execution it came from.
+The traceback frames in its text are parsed once, when it is
+added, so that finding an execution's output or the last
+traceback is a lookup in an index instead of a scan of the text.
+"""
+import os
+import re
+import bisect
+from collections import OrderedDict
+
+
+# the most records kept, dropping the oldest.
+try:
+    MAX_RECORDS = int(os.getenv('PYTHONEDITOR_OUTPUT_RECORDS', 200000))
+except ValueError:
+    MAX_RECORDS = 200000
+TRACEBACK = 'Traceback (most recent call last)'
+# the most records looked through for a traceback's frames.
+TRACEBACK_RECORDS = 200
+FRAME_PATTERN = re.compile(r'File "([^"]+)", line (\d+)')
+
+
+def parse_frames(text):
+    """ Return the (line in the text, path, line number)
+    of each traceback frame in the text.
+    """
+    if 'File "' not in text:
+        return ()
+    frames = []
+    for match in FRAME_PATTERN.finditer(text):
+        line = text.count('\n', 0, match.start())
+        frames.append((line, match.group(1), int(match.group(2))))
+    return tuple(frames)
+
+
+class OutputLog(object):
+    """ The records of output, in the order it was written.
+    Records are referred to by their index, counted from
+    the first record ever added, so indexes stay valid
+    when the oldest records are dropped.
+
+    :param max_records: `int` the most records kept.
+    """
+    def __init__(self, max_records=MAX_RECORDS):
+        self.max_records = max_records
+        self.clear()
+
+    def clear(self):
+        self.records = []
+        # the index of records[0].
+        self.start = 0
+        # execution number to the indexes of its records.
+        self.executions = OrderedDict()
+        # indexes of records where a traceback starts.
+        self.tracebacks = []
+        # index to the frames in the record's text,
+        # for records that have any.
+        self.frames = {}
+
+    def __len__(self):
+        return len(self.records)
+
+    def end(self):
+        """ The index the next record will have. """
+        return self.start + len(self.records)
+
+    def add(self, chunks):
+        """ Add streams.Chunks as records, and return
+        the index of the first one.
+        """
+        first = self.end()
+        self.records.extend(chunks)
+        execution = indexes = None
+        for index, chunk in enumerate(chunks, first):
+            if chunk.execution != execution:
+                execution = chunk.execution
+                indexes = self.executions.get(execution)
+                if indexes is None:
+                    indexes = self.executions[execution] = []
+            indexes.append(index)
+            text = chunk.text
+            if 'File "' in text:
+                frames = parse_frames(text)
+                if frames:
+                    self.frames[index] = frames
+            if TRACEBACK in text:
+                self.tracebacks.append(index)
+        # trimmed in steps, rather than on every add.
+        if self.max_records and len(self.records) > self.max_records*1.1:
+            self.trim(len(self.records) - self.max_records)
+        return first
+
+    def trim(self, count):
+        """ Drop the oldest count records. """
+        del self.records[:count]
+        self.start += count
+        start = self.start
+        del self.tracebacks[:bisect.bisect_left(self.tracebacks, start)]
+        for index in [index for index in self.frames if index < start]:
+            del self.frames[index]
+        for execution in list(self.executions):
+            indexes = self.executions[execution]
+            del indexes[:bisect.bisect_left(indexes, start)]
+            if not indexes:
+                del self.executions[execution]
+
+    def get(self, index):
+        """ Return the record with the index,
+        or None if it was dropped.
+        """
+        if self.start <= index < self.end():
+            return self.records[index - self.start]
+        return None
+
+    def items(self, first=None):
+        """ Return (index, record) pairs from
+        the first index, or for all records.
+        """
+        if first is None or first < self.start:
+            first = self.start
+        return enumerate(self.records[first - self.start:], first)
+
+    def frames_of(self, index):
+        """ Return the (line in the text, path, line number)
+        of each traceback frame in the record's text.
+        """
+        return self.frames.get(index, ())
+
+    def execution(self, execution):
+        """ Return the indexes of the records
+        written during an execution.
+        """
+        return list(self.executions.get(execution, ()))
+
+    def last_traceback(self):
+        """ Return the index of the record where
+        the last traceback starts, or None.
+        """
+        if not self.tracebacks:
+            return None
+        return self.tracebacks[-1]
+
+    def traceback_frames(self, index):
+        """ Return the (path, line number) of the frames
+        of the traceback starting at the index. They may
+        be spread over the records that follow it, up to
+        the next traceback or the next execution (and at
+        most TRACEBACK_RECORDS).
+        """
+        first = self.get(index)
+        if first is None:
+            return []
+        position = bisect.bisect_right(self.tracebacks, index)
+        if position < len(self.tracebacks):
+            stop = self.tracebacks[position]
+        else:
+            stop = self.end()
+        stop = min(stop, index + TRACEBACK_RECORDS)
+        frames = []
+        for index in range(index, stop):
+            if self.get(index).execution != first.execution:
+                break
+            for line, path, lineno in self.frames_of(index):
+                frames.append((path, lineno))
+        return frames
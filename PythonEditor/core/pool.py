@@ -0,0 +1,288 @@
+""" Execution of code in a pool of worker python processes,
+outside of the host interpreter. Useful for heavy batch work,
+code that may crash the interpreter, or running several
+scripts in parallel. Each job runs in a fresh namespace, but
+workers are reused, so modules they have already imported
+don't need to be imported again.
+
+Output is written to sys.stdout and sys.stderr as it arrives,
+and tracebacks are printed with execute.print_traceback, so
+the line numbers refer to the editor's document.
+"""
+from __future__ import print_function
+import os
+import sys
+import json
+import time
+import threading
+import subprocess
+from collections import deque
+from functools import partial
+
+from PythonEditor.ui.Qt import QtCore
+from PythonEditor.core import execute
+
+
+# the number of worker processes to run jobs in parallel.
+try:
+    SIZE = int(os.getenv('PYTHONEDITOR_SUBPROCESS_WORKERS', 2))
+except ValueError:
+    SIZE = 2
+WORKER_SCRIPT = os.path.join(os.path.dirname(__file__), 'worker.py')
+
+
+def is_python(path):
+    """ Return True if the file looks like a python
+    interpreter, rather than an application embedding one.
+    """
+    if not path or not os.path.isfile(path):
+        return False
+    name = os.path.basename(path).lower()
+    return name.startswith('python')
+
+
+def which(name):
+    """ Return the path of the program on PATH, or None. """
+    for folder in os.getenv('PATH', '').split(os.pathsep):
+        path = os.path.join(folder, name)
+        if os.path.isfile(path) and os.access(path, os.X_OK):
+            return path
+    return None
+
+
+def find_python():
+    """ Return the path of a python interpreter to run
+    workers with, or None if none can be found. Inside
+    hosts such as Nuke, sys.executable is the host
+    application, so the python next to it (or on PATH)
+    is used instead.
+    """
+    path = os.getenv('PYTHONEDITOR_SUBPROCESS_PYTHON')
+    if path:
+        return path
+    for path in sys.executable, getattr(sys, '_base_executable', None):
+        if is_python(path):
+            return path
+    major, minor = sys.version_info[:2]
+    names = [
+        'python{0}.{1}'.format(major, minor),
+        'python{0}'.format(major),
+        'python',
+    ]
+    if sys.platform == 'win32':
+        names = [name + '.exe' for name in names]
+    folder = os.path.dirname(sys.executable)
+    for name in names:
+        path = os.path.join(folder, name)
+        if is_python(path):
+            return path
+    for name in names:
+        path = which(name)
+        if path is not None:
+            return path
+    return None
+
+
+# the python interpreter to run workers with.
+EXECUTABLE = find_python()
+
+
+class Worker(QtCore.QObject):
+    """ A python process running worker.py. Records it
+    sends are emitted by the received signal, from the
+    threads that read the process' output.
+
+    :signal received: `object` a dictionary record.
+    """
+    received = QtCore.Signal(object)
+
+    def __init__(self, executable=EXECUTABLE):
+        super(Worker, self).__init__()
+        self.job = None
+        self.process = subprocess.Popen(
+            [executable, '-u', WORKER_SCRIPT],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+        )
+        for target in self.read_records, self.read_errors:
+            thread = threading.Thread(target=target)
+            thread.daemon = True
+            thread.start()
+
+    def read_records(self):
+        for line in iter(self.process.stdout.readline, b''):
+            try:
+                record = json.loads(line.decode('utf-8'))
+            except ValueError:
+                continue
+            self.received.emit(record)
+        self.process.wait()
+        self.received.emit({'exit': self.process.returncode})
+
+    def read_errors(self):
+        # output written directly to the process' file
+        # descriptors, rather than to sys.stdout or sys.stderr.
+        for line in iter(self.process.stderr.readline, b''):
+            text = line.decode('utf-8', 'replace')
+            self.received.emit({'stream': 'stderr', 'text': text})
+
+    def send(self, job):
+        """ Start running the job. """
+        self.job = job
+        data = json.dumps({
+            'id'     : job['id'],
+            'text'   : job['text'],
+            'offset' : job['offset'],
+        })
+        self.process.stdin.write(data.encode('utf-8') + b'\n')
+        self.process.stdin.flush()
+
+    def stop(self):
+        """ Stop the process, even if it is running a job. """
+        if self.process.poll() is None:
+            self.process.kill()
+
+
+class WorkerPool(QtCore.QObject):
+    """ Runs jobs in up to size worker processes, queueing
+    them when all workers are busy. Must be created in
+    the main thread.
+
+    :signal finished: `object` the job's dictionary,
+    with the line numbers of any errors as 'errors'.
+    """
+    finished = QtCore.Signal(object)
+
+    def __init__(self, size=SIZE, executable=EXECUTABLE):
+        super(WorkerPool, self).__init__()
+        self.setObjectName('WorkerPool')
+        self.size = max(size, 1)
+        self.executable = executable
+        self.workers = []
+        self.queue = deque()
+        self.count = 0
+
+    def submit(self, text, whole_text, callback=None, line_offset=0):
+        """ Queue the text to run in a worker process,
+        and return the job's id.
+
+        :param text: `str` code to execute
+        :param whole_text: `str` all text in the document
+        :param callback: `callable` called with the line
+        numbers of any errors when the job is done.
+        :param line_offset: `int` lines before the text.
+        :return: `int` the job's id, or None if there is no
+        python interpreter to run it with.
+        """
+        if self.executable is None:
+            print(
+                '# No python interpreter was found to run subprocesses'
+                ' with. Set PYTHONEDITOR_SUBPROCESS_PYTHON to its path.'
+            )
+            return None
+        text, line_offset = execute.split_offset(text, line_offset)
+        self.count += 1
+        job = {
+            'id'         : self.count,
+            'text'       : text,
+            'offset'     : line_offset,
+            'whole_text' : whole_text,
+            'callback'   : callback,
+            'start'      : None,
+        }
+        self.queue.append(job)
+        self.dispatch()
+        return job['id']
+
+    def busy(self):
+        """ Return the number of jobs running or queued. """
+        running = [w for w in self.workers if w.job is not None]
+        return len(running) + len(self.queue)
+
+    def dispatch(self):
+        """ Send queued jobs to idle workers, starting
+        new workers while there are fewer than size.
+        """
+        while self.queue:
+            idle = [w for w in self.workers if w.job is None]
+            if idle:
+                worker = idle[0]
+            elif len(self.workers) < self.size:
+                worker = Worker(self.executable)
+                worker.received.connect(partial(self.receive, worker))
+                self.workers.append(worker)
+            else:
+                break
+            job = self.queue.popleft()
+            job['start'] = time.time()
+            worker.send(job)
+
+    def receive(self, worker, record):
+        """ Handle a record sent by a worker. """
+        if 'stream' in record:
+            stream = sys.stderr if record['stream'] == 'stderr' else sys.stdout
+            stream.write(record['text'])
+        elif 'done' in record:
+            job, worker.job = worker.job, None
+            if job is not None:
+                self.complete(job, record)
+            self.dispatch()
+        elif 'exit' in record:
+            if worker in self.workers:
+                self.workers.remove(worker)
+            job, worker.job = worker.job, None
+            if job is not None:
+                print('# Job {0}: worker exited with code {1}'.format(
+                    job['id'], record['exit']
+                ))
+                self.complete(job, {})
+            worker.deleteLater()
+            self.dispatch()
+
+    def complete(self, job, record):
+        """ Print the job's traceback, if any, with line
+        numbers from the document it came from.
+        """
+        error = record.get('error')
+        if error == 'syntax':
+            errors = execute.print_syntax_traceback(record['traceback'])
+        elif error == 'exception':
+            errors = execute.print_traceback(
+                job['whole_text'],
+                None,
+                record['traceback']
+            )
+        else:
+            errors = None
+        print('# Job {0} finished in {1:.2f}s'.format(
+            job['id'],
+            time.time() - job['start']
+        ))
+        job['errors'] = errors
+        if errors and job['callback'] is not None:
+            job['callback'](errors)
+        self.finished.emit(job)
+
+    def stop(self):
+        """ Stop all workers and clear the queue. """
+        self.queue.clear()
+        workers, self.workers = self.workers, []
+        for worker in workers:
+            worker.stop()
+
+
+_pool = None
+
+
+def pool():
+    """ Return the WorkerPool shared by all
+    editors, creating it on first use.
+    """
+    global _pool
+    if _pool is None:
+        _pool = WorkerPool()
+        app = QtCore.QCoreApplication.instance()
+        if app is not None:
+            app.aboutToQuit.connect(_pool.stop)
+    return _pool
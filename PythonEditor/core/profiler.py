@@ -0,0 +1,175 @@
+""" Profiling of executed code. The code is run with
+execute.mainexec under cProfile, which times each function
+called, while a thread samples the line being run in the
+document, so that time can also be shown per line.
+"""
+from __future__ import print_function
+import os
+import sys
+import time
+import pstats
+import cProfile
+import threading
+
+from PythonEditor.core import execute
+
+
+# seconds between samples of the running line.
+SAMPLE_INTERVAL = 0.001
+# the number of hot spots printed to the terminal.
+REPORT_ROWS = 10
+# functions from these files are left out of the results.
+IGNORED_FILES = (
+    os.path.splitext(execute.__file__)[0],
+    os.path.splitext(__file__)[0],
+)
+IGNORED_FUNCTIONS = (
+    '<built-in method builtins.exec>',
+    '<built-in method exec>',
+    "<method 'disable' of '_lsprof.Profiler' objects>",
+)
+
+
+class LineSampler(threading.Thread):
+    """ Samples the stack of another thread, adding the
+    time between samples to each line of the document
+    in it (once per sample, so recursion isn't counted
+    twice).
+
+    :param ident: `int` the ident of the thread to sample.
+    """
+    def __init__(self, ident, interval=SAMPLE_INTERVAL):
+        super(LineSampler, self).__init__()
+        self.daemon = True
+        self.ident_to_sample = ident
+        self.interval = interval
+        self.line_times = {}
+        self.running = threading.Event()
+
+    def run(self):
+        self.running.set()
+        line_times = self.line_times
+        last = time.time()
+        while self.running.is_set():
+            time.sleep(self.interval)
+            now = time.time()
+            elapsed, last = now - last, now
+            frame = sys._current_frames().get(self.ident_to_sample)
+            lines = set()
+            while frame is not None:
+                if frame.f_code.co_filename == execute.FILENAME:
+                    lines.add(frame.f_lineno)
+                frame = frame.f_back
+            for lineno in lines:
+                line_times[lineno] = line_times.get(lineno, 0.0) + elapsed
+
+    def stop(self):
+        self.running.clear()
+        self.join()
+
+
+class ProfileResult(object):
+    """ The results of profiling an execution.
+
+    :attr rows: list of dictionaries, one per function,
+    with 'function', 'filename', 'line', 'calls', 'own'
+    and 'total' keys, by descending total time.
+    :attr line_times: dictionary of line numbers in
+    the document to the seconds spent on them.
+    :attr total: `float` seconds taken by the execution.
+    :attr errors: line numbers of any errors, or None.
+    """
+    def __init__(self, rows, line_times, total, errors):
+        self.rows = rows
+        self.line_times = line_times
+        self.total = total
+        self.errors = errors
+
+    def report(self, count=REPORT_ROWS):
+        """ Return the top rows as text. """
+        lines = ['# Profile: {0:.3f}s'.format(self.total)]
+        lines.append('# {0:>9} {1:>9} {2:>8}  {3}'.format(
+            'total', 'own', 'calls', 'function'
+        ))
+        for row in self.rows[:count]:
+            lines.append('# {0:>9.4f} {1:>9.4f} {2:>8}  {3} ({4})'.format(
+                row['total'],
+                row['own'],
+                row['calls'],
+                row['function'],
+                location(row),
+            ))
+        return '\n'.join(lines)
+
+
+def location(row):
+    """ Return a row's file and line as text. """
+    if row['filename'] == execute.FILENAME:
+        return 'line {0}'.format(row['line'])
+    if not row['line']:
+        return row['filename']
+    return '{0}:{1}'.format(row['filename'], row['line'])
+
+
+def hot_spots(profile):
+    """ Return the rows of a cProfile.Profile's
+    stats, by descending total time.
+    """
+    stats = pstats.Stats(profile).stats
+    rows = []
+    for (filename, line, function), values in stats.items():
+        if os.path.splitext(filename)[0] in IGNORED_FILES:
+            continue
+        primitive_calls, calls, own, total, callers = values
+        if function in IGNORED_FUNCTIONS:
+            continue
+        rows.append({
+            'function' : function,
+            'filename' : filename,
+            'line'     : line,
+            'calls'    : calls,
+            'own'      : own,
+            'total'    : total,
+        })
+    rows.sort(key=lambda row: row['total'], reverse=True)
+    return rows
+
+
+def profile_exec(text, whole_text, line_offset=0):
+    """ Execute the text with execute.mainexec
+    in this thread, and return a ProfileResult.
+
+    :param text: `str` code to execute
+    :param whole_text: `str` all text in the document
+    :param line_offset: `int` lines before the text.
+    """
+    # compile first, so that only running the code is profiled.
+    mode = execute.compile_mode(text)
+    try:
+        execute.CODE_CACHE.compile(text, mode, line_offset)
+    except SyntaxError:
+        # mainexec will print it.
+        pass
+
+    sampler = LineSampler(threading.current_thread().ident)
+    sampler.start()
+    sampler.running.wait()
+    profile = cProfile.Profile()
+    start = time.time()
+    profile.enable()
+    try:
+        errors = execute.mainexec(
+            text,
+            whole_text,
+            line_offset=line_offset
+        )
+    finally:
+        profile.disable()
+        total = time.time() - start
+        sampler.stop()
+    return ProfileResult(
+        hot_spots(profile),
+        sampler.line_times,
+        total,
+        errors
+    )
@@ -4,9 +4,16 @@ These redirectors also output to Nuke's original outputRedirector
 and stderrRedirector which display text in the native Script Editor.
 """
 from __future__ import print_function
+import os
 import sys
+import time
+import heapq
+import threading
+import itertools
+from collections import deque, namedtuple
 
 from PythonEditor.ui.Qt import QtCore
+from PythonEditor.core import execute
 from PythonEditor.utils.debug import debug
 
 
@@ -62,10 +69,136 @@ class PySingleton(object):
         return cls._the_instance
 
 
+# the most chunks kept for each thread until a reader
+# attaches, dropping the oldest, so that output captured
+# before a Terminal exists takes bounded memory.
+try:
+    MAX_CHUNKS = int(os.getenv('PYTHONEDITOR_STREAM_BUFFER_CHUNKS', 100000))
+except ValueError:
+    MAX_CHUNKS = 100000
+
+
+# text written to a stream, tagged with the order it was
+# written in, the time, the name of the thread that wrote
+# it, the name of the stream and the number of the
+# execution that was running (see execute.EXECUTION).
+Chunk = namedtuple('Chunk', 'sequence time thread stream text execution')
+
+
 class Speaker(QtCore.QObject):
     """ Used to relay sys stdout, stderr, stdin
+
+    Text written is tagged and added to a queue of the
+    writing thread, so that writers don't wait on each
+    other. ready is emitted when the queues stop being
+    empty, so that a reader can take the chunks out in
+    batches with read(), in the order they were written.
+
+    Until a reader calls attach(), each queue keeps at
+    most max_chunks, and read() reports how many were
+    dropped.
     """
     emitter = QtCore.Signal(str)
+    ready = QtCore.Signal()
+
+    def __init__(self, max_chunks=MAX_CHUNKS):
+        super(Speaker, self).__init__()
+        self.max_chunks = max_chunks or None
+        self.dropped = 0
+        self.local = threading.local()
+        # (thread, queue) pairs. The lock is only
+        # taken to add a thread or remove a dead one.
+        self.queues = []
+        self.lock = threading.Lock()
+        self.sequence = itertools.count()
+        self.notified = False
+
+    def new_queue(self):
+        """ Add a queue for the calling thread. """
+        queue = self.local.queue = deque()
+        with self.lock:
+            self.queues.append((threading.current_thread(), queue))
+        return queue
+
+    def write(self, text, name='stdout'):
+        """ Add text written to the stream with
+        the given name to the thread's queue.
+        """
+        try:
+            queue = self.local.queue
+        except AttributeError:
+            queue = self.new_queue()
+        # deque.append and next(count) are atomic. The
+        # thread's name is added when the text is read.
+        queue.append((
+            next(self.sequence),
+            time.time(),
+            name,
+            text,
+            execute.EXECUTION
+        ))
+        if self.max_chunks is not None and len(queue) > self.max_chunks:
+            queue.popleft()
+            self.dropped += 1
+        if not self.notified:
+            self.notified = True
+            self.ready.emit()
+
+    def attach(self):
+        """ Called by a reader that will read all output,
+        so that no more is dropped however much is queued.
+        """
+        self.max_chunks = None
+
+    def read(self, max_chars=None):
+        """ Take the queued chunks out, oldest first,
+        up to about max_chars characters.
+        """
+        # cleared first, so that writes from here on notify.
+        self.notified = False
+        chunks = []
+        if self.dropped:
+            dropped, self.dropped = self.dropped, 0
+            text = '# {0} chunks of output were dropped before the'
+            text += ' Terminal opened (see PYTHONEDITOR_STREAM_BUFFER_CHUNKS)\n'
+            chunks.append(Chunk(
+                -1, time.time(), 'MainThread', 'stderr',
+                text.format(dropped), 0
+            ))
+        with self.lock:
+            threads = list(self.queues)
+        queues = [queue for thread, queue in threads]
+        heap = [(queue[0][0], index) for index, queue in enumerate(queues) if queue]
+        heapq.heapify(heap)
+        size = 0
+        while heap:
+            if max_chars is not None and size >= max_chars:
+                # the rest are read next time.
+                self.notified = True
+                break
+            sequence, index = heapq.heappop(heap)
+            queue = queues[index]
+            sequence, when, stream, text, execution = queue.popleft()
+            thread = threads[index][0].name
+            chunks.append(Chunk(sequence, when, thread, stream, text, execution))
+            size += len(text)
+            if queue:
+                heapq.heappush(heap, (queue[0][0], index))
+        self.remove_dead_queues()
+        return chunks
+
+    def remove_dead_queues(self):
+        with self.lock:
+            self.queues = [
+                (thread, queue) for thread, queue in self.queues
+                if queue or thread.is_alive()
+            ]
+
+    def pending(self):
+        for thread, queue in self.queues:
+            if queue:
+                return True
+        return False
 
 
 class SERedirector(object):
@@ -122,7 +255,7 @@ class SESysStdOut(SERedirector, PySingleton):
 
     def write(self, text):
         if self._signal is not None:
-            self._signal.emitter.emit(text)
+            self._signal.write(text, 'stdout')
 
         if hasattr(sys, 'outputRedirector'):
             sys.outputRedirector(text)
@@ -140,7 +273,7 @@ class SESysStdErr(SERedirector, PySingleton):
 
     def write(self, text):
         if self._signal is not None:
-            self._signal.emitter.emit(text)
+            self._signal.write(text, 'stderr')
 
         if hasattr(sys, 'stderrRedirector'):
             sys.stderrRedirector(text)
@@ -151,6 +284,20 @@ class SESysStdErr(SERedirector, PySingleton):
                 pass
 
 
+def capture():
+    """ Redirect sys.stdout and sys.stderr to a Speaker,
+    unless they already are, and return it. Output is
+    queued until a Terminal reads it, so this can be
+    called at startup, before any Terminal is created.
+    """
+    if hasattr(sys.stdout, '_signal'):
+        return sys.stdout._signal
+    speaker = Speaker()
+    sys.stdout = SESysStdOut(sys.stdout, speaker)
+    sys.stderr = SESysStdErr(sys.stderr, speaker)
+    return speaker
+
+
 # we need these functions to be registered in the sys module
 try:
     sys.outputRedirector = lambda x: None
@@ -0,0 +1,118 @@
+""" A worker process for the subprocess execution engine
+(see PythonEditor.core.pool). Jobs are read from stdin as
+lines of JSON, and the output they print and the result
+of running them are written back as lines of JSON.
+
+This module is run as a script, and imports neither
+PythonEditor nor Qt so that it starts quickly in any
+python interpreter.
+"""
+from __future__ import print_function
+import os
+import ast
+import sys
+import json
+import threading
+import traceback
+
+
+FILENAME = '<Python Editor Contents>'
+
+
+class Stream(object):
+    """ Sends text written to it as output of a job. """
+    def __init__(self, send, job, name):
+        self.send = send
+        self.job = job
+        self.name = name
+
+    def write(self, text):
+        if text:
+            self.send({'id': self.job, 'stream': self.name, 'text': text})
+
+    def writelines(self, lines):
+        for line in lines:
+            self.write(line)
+
+    def flush(self):
+        pass
+
+    def isatty(self):
+        return False
+
+
+def compile_code(text, mode, line_offset):
+    """ Compile the text with its line numbers offset
+    by line_offset, like execute.compile_code.
+    """
+    if not line_offset:
+        return compile(text, FILENAME, mode)
+    try:
+        tree = compile(text, FILENAME, mode, ast.PyCF_ONLY_AST)
+    except SyntaxError as error:
+        if error.lineno is not None:
+            error.lineno += line_offset
+        raise
+    ast.increment_lineno(tree, line_offset)
+    return compile(tree, FILENAME, mode)
+
+
+def execute(text, line_offset=0):
+    """ Execute the text in a new __main__ namespace.
+    Returns the kind of error ('syntax' or 'exception')
+    and its traceback, or (None, None).
+    """
+    if len(text.strip().split('\n')) == 1:
+        mode = 'single'
+    else:
+        mode = 'exec'
+    try:
+        code = compile_code(text, mode, line_offset)
+    except SyntaxError:
+        return 'syntax', traceback.format_exc()
+
+    namespace = {'__name__': '__main__', '__builtins__': __builtins__}
+    print('# Result: ')
+    try:
+        exec(code, namespace)
+    except (Exception, SystemExit):
+        etype, value, tb = sys.exc_info()
+        # leave out this function's frame.
+        lines = traceback.format_exception(etype, value, tb.tb_next)
+        return 'exception', ''.join(lines)
+    return None, None
+
+
+def run(job, send):
+    stdout, stderr = sys.stdout, sys.stderr
+    sys.stdout = Stream(send, job['id'], 'stdout')
+    sys.stderr = Stream(send, job['id'], 'stderr')
+    try:
+        error, text = execute(job['text'], job.get('offset', 0))
+    finally:
+        sys.stdout, sys.stderr = stdout, stderr
+    send({'id': job['id'], 'done': True, 'error': error, 'traceback': text})
+
+
+def main():
+    # keep the original stdout for the protocol, and send
+    # anything else written to it (by C extensions, say)
+    # to stderr, which is shown as plain text.
+    protocol = os.fdopen(os.dup(1), 'w')
+    os.dup2(2, 1)
+    lock = threading.Lock()
+
+    def send(record):
+        with lock:
+            protocol.write(json.dumps(record) + '\n')
+            protocol.flush()
+
+    send({'ready': os.getpid()})
+    for line in iter(sys.stdin.readline, ''):
+        line = line.strip()
+        if line:
+            run(json.loads(line), send)
+
+
+if __name__ == '__main__':
+    main()
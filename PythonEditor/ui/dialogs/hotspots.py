@@ -0,0 +1,61 @@
+from PythonEditor.ui.Qt import QtWidgets, QtCore
+from PythonEditor.core import execute
+from PythonEditor.core import profiler
+from PythonEditor.utils.goto import goto_line
+
+
+COLUMNS = ['Function', 'Location', 'Calls', 'Own (s)', 'Total (s)']
+# the most rows shown in the table.
+MAX_ROWS = 500
+
+
+class HotSpots(QtWidgets.QTreeWidget):
+    """
+    A sortable table of the functions called by profiled
+    code. Clicking a function defined in the editor's
+    document jumps to its line.
+    """
+    def __init__(self, editor):
+        super(HotSpots, self).__init__()
+        self.setObjectName('HotSpots')
+        self.setWindowTitle('Profile')
+        self.setWindowFlags(QtCore.Qt.WindowStaysOnTopHint)
+        self.editor = editor
+        self.setColumnCount(len(COLUMNS))
+        self.setHeaderLabels(COLUMNS)
+        self.setRootIsDecorated(False)
+        self.setUniformRowHeights(True)
+        self.setSortingEnabled(True)
+        self.resize(800, 400)
+        self.itemClicked.connect(self.goto_item)
+
+    def set_result(self, result):
+        """ Show the rows of a profiler.ProfileResult,
+        sorted by total time.
+        """
+        self.setSortingEnabled(False)
+        self.clear()
+        self.setWindowTitle('Profile: {0:.3f}s'.format(result.total))
+        items = []
+        for row in result.rows[:MAX_ROWS]:
+            item = QtWidgets.QTreeWidgetItem()
+            item.setText(0, row['function'])
+            item.setText(1, profiler.location(row))
+            # numbers, so that the columns sort numerically.
+            item.setData(2, QtCore.Qt.DisplayRole, row['calls'])
+            item.setData(3, QtCore.Qt.DisplayRole, round(row['own'], 4))
+            item.setData(4, QtCore.Qt.DisplayRole, round(row['total'], 4))
+            if row['filename'] == execute.FILENAME:
+                item.setData(0, QtCore.Qt.UserRole, row['line'])
+            items.append(item)
+        self.addTopLevelItems(items)
+        self.setSortingEnabled(True)
+        self.sortByColumn(4, QtCore.Qt.DescendingOrder)
+        for column in range(len(COLUMNS)):
+            self.resizeColumnToContents(column)
+
+    def goto_item(self, item, column=0):
+        line = item.data(0, QtCore.Qt.UserRole)
+        if line:
+            goto_line(self.editor, line)
+            self.editor.setFocus(QtCore.Qt.MouseFocusReason)
@@ -18,10 +18,13 @@ from PythonEditor.ui.Qt.QtCore import (
 
 from PythonEditor import six
 from PythonEditor.utils import constants
+from PythonEditor.utils.digest import text_digest
 from PythonEditor.ui.features import actions
 from PythonEditor.ui.features import shortcuts
 from PythonEditor.ui.features import linenumberarea
 from PythonEditor.ui.features import syntaxhighlighter
+from PythonEditor.ui.features import occurrences
+from PythonEditor.ui.features import semantics
 from PythonEditor.ui.features import autocompletion
 from PythonEditor.ui.features import contextmenu
 
@@ -83,6 +86,7 @@ class Editor(QPlainTextEdit):
     relay_clear_output_signal = Signal()
     editingFinished           = Signal()
     text_changed_signal       = Signal()
+    text_edited_signal        = Signal()
     selection_stopped         = Signal()
 
     def __init__(
@@ -127,7 +131,13 @@ class Editor(QPlainTextEdit):
         self.textChanged.connect(
             self._handle_textChanged)
 
-        self._selection_timer = QTimer()
+        # digest of the document text, computed
+        # on demand and dropped on each edit.
+        self._digest = None
+        self.document().contentsChange.connect(
+            self._handle_contentsChange)
+
+        self._selection_timer = QTimer(self)
         self._selection_timer.setInterval(1000)
         self._selection_timer.setSingleShot(True)
         self._selection_timer.timeout.connect(
@@ -156,6 +166,12 @@ class Editor(QPlainTextEdit):
             self.emit_text_changed = True
         QTimer.singleShot(0, set_text_changed_enabled)
 
+        OH = occurrences.OccurrenceHighlighter
+        self.occurrences = OH(self)
+        if semantics.ENABLED:
+            SH = semantics.SemanticHighlighter
+            self.semantics = SH(self)
+
         CM = contextmenu.ContextMenu
         self.contextmenu = CM(self)
 
@@ -177,6 +193,24 @@ class Editor(QPlainTextEdit):
         if self.emit_text_changed:
             self.text_changed_signal.emit()
 
+    @Slot(int, int, int)
+    def _handle_contentsChange(self, position, removed, added):
+        # highlighting only changes formats and
+        # reports no removed or added characters.
+        if removed or added:
+            self._digest = None
+            self.text_edited_signal.emit()
+
+    def text_digest(self):
+        """ Return the digest of the editor text.
+        Computed at most once between edits, so
+        repeated comparisons don't each need a
+        copy of the whole document.
+        """
+        if self._digest is None:
+            self._digest = text_digest(self.toPlainText())
+        return self._digest
+
     @Slot()
     def _handle_selectionChanged(self):
         """Emit a selection_stopped signal once
@@ -19,7 +19,7 @@ import __main__
 import subprocess
 from functools import wraps
 from datetime import datetime
-from shutil import copyfile
+from shutil import copyfile, copytree
 from pprint import pprint
 
 from PythonEditor.ui.Qt import QtWidgets
@@ -29,10 +29,14 @@ from PythonEditor.ui.Qt import QtCore
 from PythonEditor.utils import save
 from PythonEditor.utils import constants
 from PythonEditor.core import execute
+from PythonEditor.core import background
+from PythonEditor.core import pool
+from PythonEditor.core import profiler
 from PythonEditor.ui.features import search
 from PythonEditor.ui.features import autocompletion
 from PythonEditor.ui.dialogs import popups
 from PythonEditor.ui.dialogs import popupline
+from PythonEditor.ui.dialogs import hotspots
 from PythonEditor.utils.constants import NUKE_DIR
 from PythonEditor.utils.goto import goto_position
 from PythonEditor.utils.goto import goto_line
@@ -100,6 +104,9 @@ class Actions(QtCore.QObject):
     :param terminal: optional `QPlainTextEdit` or `Terminal` class.
     """
     actions = {}
+    # None, 'background', 'subprocess' or 'profile',
+    # to override how exec_text runs the code.
+    exec_mode = None
     def __init__(
             self,
             pythoneditor=None,
@@ -167,36 +174,160 @@ class Actions(QtCore.QObject):
     # ---------------         -------------- #
     # ---------------         -------------- #
     # -------------------------------------- #
-    def offset_for_traceback(self, text=None):
-        """ Return text with prepended newlines
-        to get proper line ref in tracebacks.
+    def offset_for_traceback(self):
+        """ Return the number of lines before the
+        selection (or cursor), to get proper line
+        ref in tracebacks.
         """
         cursor = self.editor.textCursor()
-
-        if text is None:
-            text = cursor.selection().toPlainText()
-
         selection_offset = cursor.selectionStart()
         doc = self.editor.document()
         block = doc.findBlock(selection_offset)
-        block_num = block.blockNumber()
-        text = str('\n' * block_num) + text
-        return text
+        return block.blockNumber()
 
-    def exec_text(self, text, whole_text):
+    def exec_text(
+            self,
+            text,
+            whole_text,
+            verbosity=execute.VERBOSITY_LOW,
+            line_offset=0
+        ):
         """ Execute `text` as code. Highlight
         any lines on which errors were detected.
+        In background execution mode, the code
+        runs on a worker thread instead, and in
+        subprocess mode, in a worker process.
 
         :text: the actual text to be executed
         :whole_text: the whole text for context
         and full traceback
-        """
-        error_line_numbers = execute.mainexec(text, whole_text)
+        :line_offset: the number of lines in
+        the document before the text
+        """
+        if self.exec_mode == 'profile':
+            result = profiler.profile_exec(
+                text,
+                whole_text,
+                line_offset=line_offset
+            )
+            self.show_profile(result)
+            if result.errors:
+                self.highlight_errored_lines(result.errors)
+            return
+
+        if self.exec_mode == 'subprocess':
+            pool.pool().submit(
+                text,
+                whole_text,
+                callback=self.highlight_errored_lines,
+                line_offset=line_offset
+            )
+            return
+
+        runner = background.runner()
+        if runner.enabled or self.exec_mode == 'background':
+            runner.execute(
+                text,
+                whole_text,
+                verbosity=verbosity,
+                callback=self.highlight_errored_lines,
+                line_offset=line_offset
+            )
+            return
+
+        error_line_numbers = execute.mainexec(
+            text,
+            whole_text,
+            verbosity=verbosity,
+            line_offset=line_offset
+        )
         if error_line_numbers is None:
             return
         else:
             self.highlight_errored_lines(error_line_numbers)
 
+    def exec_in_background(self):
+        """ Execute the selection, cell or document
+        (as with Ctrl+Enter) on a worker thread,
+        so that the interface stays responsive.
+        """
+        self.exec_mode = 'background'
+        try:
+            self.exec_handler()
+        finally:
+            self.exec_mode = None
+
+    def exec_in_subprocess(self):
+        """ Execute the selection, cell or document
+        (as with Ctrl+Enter) in a separate python
+        process, from a pool of reusable workers.
+        Several scripts can run at the same time.
+        """
+        self.exec_mode = 'subprocess'
+        try:
+            self.exec_handler()
+        finally:
+            self.exec_mode = None
+
+    def exec_with_profiler(self):
+        """ Execute the selection, cell or document
+        (as with Ctrl+Enter) under the profiler, then
+        show a table of the functions it called and
+        the time spent on each line in the gutter.
+        """
+        self.exec_mode = 'profile'
+        try:
+            self.exec_handler()
+        finally:
+            self.exec_mode = None
+
+    def show_profile(self, result):
+        """ Print the hot spots of a profiler.ProfileResult,
+        show them in a table and show the time
+        spent on each line in the line number area.
+        """
+        print(result.report())
+
+        area = self.editor.findChild(QtWidgets.QWidget, 'LineNumberArea')
+        if area is not None:
+            area.set_line_times(result.line_times)
+
+        table = getattr(self, 'hotspots', None)
+        if table is None:
+            table = hotspots.HotSpots(self.editor)
+            self.hotspots = table
+        table.set_result(result)
+        table.show()
+        table.raise_()
+
+    def stop_subprocesses(self):
+        """ Stop the worker processes, along with
+        any scripts running or queued in them.
+        """
+        workers = pool.pool()
+        if workers.busy():
+            print('# Stopping {0} subprocess job(s).'.format(workers.busy()))
+        workers.stop()
+
+    def cancel_execution(self):
+        """ Stop the script running in the background. """
+        runner = background.runner()
+        if not runner.is_running():
+            return
+        if not runner.cancel():
+            print('# Could not cancel the running script.')
+
+    def toggle_background_execution(self):
+        """ Switch between executing code in the main
+        thread and on a worker thread by default.
+        """
+        runner = background.runner()
+        runner.enabled = not runner.enabled
+        if runner.enabled:
+            print('# Executing code in the background.')
+        else:
+            print('# Executing code in the main thread.')
+
     def exec_handler(self):
         """ Handles trigger for execution of code
         (typically Ctrl+Enter).
@@ -225,8 +356,12 @@ class Actions(QtCore.QObject):
             multiline_text = ('\n' in text)
             if not multiline_text:
                 whole_text = '\n'+whole_text
-            text = self.offset_for_traceback()
-            return self.exec_text(text, whole_text)
+            line_offset = self.offset_for_traceback()
+            return self.exec_text(
+                text,
+                whole_text,
+                line_offset=line_offset
+            )
 
         # if there are cells (marked by '\n#&&')
         # execute current cell
@@ -263,12 +398,11 @@ class Actions(QtCore.QObject):
             return
         doc = self.editor.document()
         block_num = doc.findBlock(symbol_pos).blockNumber()
-        cell_text = '\n' * block_num + cell_text
 
         # check that the cell doesn't just have comments.
         if self.just_comments(cell_text):
             return
-        self.exec_text(cell_text, whole_text)
+        self.exec_text(cell_text, whole_text, line_offset=block_num)
 
     def exec_current_line(self):
         """
@@ -297,18 +431,15 @@ class Actions(QtCore.QObject):
                 text = text[:-1]
             text = text.strip()
 
-        text = self.offset_for_traceback(text=text)
+        line_offset = self.offset_for_traceback()
 
         whole_text = '\n'+whole_text
-        error_line_numbers = execute.mainexec(
+        self.exec_text(
             text,
             whole_text,
-            verbosity=1
+            verbosity=execute.VERBOSITY_HIGH,
+            line_offset=line_offset
         )
-        if error_line_numbers is None:
-            return
-
-        self.highlight_errored_lines(error_line_numbers)
 
     def just_comments(self, text):
         """ Check that the given text
@@ -1040,17 +1171,12 @@ class Actions(QtCore.QObject):
         since = time.time()-self._last_call_time
         if since < 0.05:
             # this will trigger a delay timer on the
-            # syntaxhighlighter to rehighlight later
+            # occurrence highlighter to highlight later
             self.editor.selectionChanged.emit()
         else:
             # now that the selection has changed,
-            # re-highlight the document
-            document = self.editor.document()
-            highlighter = document.findChild(
-                QtGui.QSyntaxHighlighter,
-                'Highlight'
-            )
-            highlighter.highlight_same_words()
+            # highlight the other occurences.
+            self.editor.occurrences.highlight_same_words()
 
         self._last_call_time = time.time()
 
@@ -1696,6 +1822,26 @@ class Actions(QtCore.QObject):
         if hasattr(self, 'terminal'):
             self.terminal.clear()
 
+    def load_older_output(self):
+        """ Load output trimmed from the terminal's
+        scrollback back from the spill log
+        (see PYTHONEDITOR_TERMINAL_LOG).
+        """
+        if not hasattr(self.terminal, 'load_older'):
+            return
+        if self.terminal.spill_log is None:
+            print('# Set PYTHONEDITOR_TERMINAL_LOG to keep trimmed output.')
+            return
+        self.terminal.load_older()
+
+    def goto_last_traceback(self):
+        """ Scroll the terminal to the start
+        of the last traceback printed.
+        """
+        if not hasattr(self.terminal, 'goto_last_traceback'):
+            return
+        self.terminal.goto_last_traceback()
+
     def jump_to_start(self):
         """ Jump to first non-whitespace character
         in line. If at first character, jump to
@@ -1933,7 +2079,7 @@ def open_action(tabs, editor, path=''):
             continue
 
         # try to avoid more costly 2nd comparison
-        if data.get('text') == text:
+        if tabs.tab_text(index) == text:
             tabs.setCurrentIndex(index)
             return
 
@@ -2103,6 +2249,18 @@ def backup_pythoneditor_history(in_tmp=False):
     dst = os.path.join(folder, new_name)
 
     copyfile(src, dst)
+
+    # recent changes may not have been
+    # compacted into the xml file yet.
+    journal = src + '.journal'
+    if os.path.isfile(journal):
+        copyfile(journal, dst + '.journal')
+
+    # large tabs may be stored separately.
+    blobs = src + '.blobs'
+    if os.path.isdir(blobs):
+        copytree(blobs, dst + '.blobs')
+
     print('Backup of Python Editor History created:')
     print(dst)
     return dst
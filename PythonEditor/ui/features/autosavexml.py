@@ -6,22 +6,57 @@ Functions that write to the autosave file:
 - create_empty_autosave
 - writexml
 - fix_broken_xml
+- AutoSaveWriter (on a background thread)
+
+Changes to individual subscripts made through the
+AutoSaveStore are appended to a journal file that
+sits next to the xml (PythonEditorHistory.xml.journal)
+and are folded back into the xml by AutoSaveStore.compact.
+
+Optionally, large subscript bodies are kept in compressed
+files in a folder next to the xml (PythonEditorHistory.xml.blobs)
+with only their file name stored in the xml, see SPILL_SIZE.
 """
 from __future__ import unicode_literals
 from __future__ import print_function
 
 import os
 import io
-import unicodedata
+import re
+import copy
+import json
+import time
+import uuid
+import zlib
+import atexit
+import itertools
+import shutil
+import threading
+import codecs
 import warnings
 import tempfile
 import difflib
 from functools import partial
 from xml.etree import cElementTree as ETree
+try:
+    import lzma
+except ImportError:
+    # python 2
+    lzma = None
+try:
+    import fcntl
+except ImportError:
+    # windows
+    fcntl = None
+try:
+    import msvcrt
+except ImportError:
+    msvcrt = None
 
 from PythonEditor.ui.Qt import QtCore, QtWidgets
 from PythonEditor.ui import editor
 from PythonEditor.utils.signals import connect
+from PythonEditor.utils.digest import text_digest
 from PythonEditor.utils.debug import debug
 from PythonEditor.utils.constants import NUKE_DIR
 
@@ -35,6 +70,69 @@ def is_file(path):
         return False
 
 
+def file_signature(path):
+    """ Return a tuple that changes whenever the
+    file at path is modified or replaced, or None
+    if there is no file.
+    """
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return (st.st_mtime, st.st_size, st.st_ino)
+
+
+class FileLock(object):
+    """ Advisory lock shared by all PythonEditor
+    instances using the same autosave, held for
+    the duration of a `with` block. Uses flock
+    (fcntl) where available, msvcrt.locking on
+    Windows. If the lock file can't be opened,
+    the block runs without a lock.
+
+    Locks are not re-entrant; a thread holding
+    the lock must not try to take it again.
+
+    :param path: `str` path to the lock file.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.file = None
+
+    def __enter__(self):
+        try:
+            self.file = open(self.path, 'a+b')
+        except (IOError, OSError) as e:
+            print("Couldn't lock {0}: {1}".format(self.path, e))
+            self.file = None
+            return self
+        if fcntl is not None:
+            fcntl.flock(self.file.fileno(), fcntl.LOCK_EX)
+        elif msvcrt is not None:
+            self.file.seek(0)
+            while True:
+                try:
+                    msvcrt.locking(self.file.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except (IOError, OSError):
+                    # LK_LOCK gives up after 10 seconds.
+                    continue
+        return self
+
+    def __exit__(self, *args):
+        if self.file is None:
+            return
+        try:
+            if fcntl is not None:
+                fcntl.flock(self.file.fileno(), fcntl.LOCK_UN)
+            elif msvcrt is not None:
+                self.file.seek(0)
+                msvcrt.locking(self.file.fileno(), msvcrt.LK_UNLCK, 1)
+        finally:
+            self.file.close()
+            self.file = None
+
+
 def parent_isdir(file_path):
     return os.path.isdir(
     os.path.dirname(file_path)
@@ -75,6 +173,44 @@ def define_autosave_path():
 
 AUTOSAVE_FILE = define_autosave_path()
 XML_HEADER = '<?xml version="1.0" encoding="UTF-8"?>'
+JOURNAL_SUFFIX = '.journal'
+LOCK_SUFFIX = '.lock'
+
+# the journal is folded back into the xml once it grows
+# past this many bytes (or half the size of the xml,
+# whichever is larger).
+try:
+    COMPACT_SIZE = int(os.getenv(
+        'PYTHONEDITOR_AUTOSAVE_COMPACT_SIZE',
+        1024*1024
+    ))
+except ValueError:
+    COMPACT_SIZE = 1024*1024
+
+# subscript bodies of at least this many characters are
+# written to compressed blob files instead of the xml.
+# 0 (the default) keeps all text inside the xml, which
+# older versions of PythonEditor can read.
+try:
+    SPILL_SIZE = int(os.getenv(
+        'PYTHONEDITOR_AUTOSAVE_SPILL_SIZE',
+        0
+    ))
+except ValueError:
+    SPILL_SIZE = 0
+
+BLOB_SUFFIX = '.blobs'
+# 'zlib' or 'lzma' (if available)
+BLOB_COMPRESSION = os.getenv(
+    'PYTHONEDITOR_AUTOSAVE_COMPRESSION',
+    'zlib'
+)
+# unreferenced blobs younger than this (in seconds) are
+# kept, as another instance may be about to use them.
+BLOB_EXPIRY = 60*60
+# seconds refresh() waits for queued writes before the files
+# have to be parsed again, before keeping the state it has.
+REFRESH_TIMEOUT = 0.1
 
 
 class AutoSaveManager(QtCore.QObject):
@@ -113,13 +249,16 @@ class AutoSaveManager(QtCore.QObject):
 
         self.setObjectName('AutoSaveManager')
         self.autosave_timer_waiting = False
+        self.synced_tab_indices = None
         self.setup_save_timer(interval=1000)
+        self.setup_compact_timer()
 
         self.tabeditor = tabs
         self.editor = tabs.editor
         self.tabs = tabs.tabs
         self.setParent(tabs)
 
+        self.store = get_store()
         self.readautosave()
         self.connect_signals()
 
@@ -171,12 +310,46 @@ class AutoSaveManager(QtCore.QObject):
         if self.editor.document().isModified():
             self.autosave()
 
+    def setup_compact_timer(self, interval=5000):
+        """ Initialise the timer that folds the
+        autosave journal back into the xml file
+        once typing has paused for a while.
+        :param interval: compact interval in milliseconds
+        :type interval: int
+        """
+        self.compact_timer = QtCore.QTimer(self)
+        self.compact_timer.setSingleShot(True)
+        self.compact_timer.setInterval(interval)
+        self.compact_timer.timeout.connect(self.compact_handler)
+
+    def request_compact(self):
+        """ Restart the compact timer if the
+        store's journal has grown too large.
+        """
+        if not self.store.needs_compaction():
+            return
+        self.compact_timer.start()
+
+    def compact_handler(self):
+        """ Compact timeout triggers this.
+        """
+        if self.autosave_timer_waiting:
+            # still typing, try again later.
+            self.compact_timer.start()
+            return
+        self.store.compact()
+
     def readautosave(self):
         """ Sets editor text content. First checks the
-        autosave file for <subscript> elements and
+        autosave store for <subscript> elements and
         creates a tab per element.
+
+        Tabs only hold a handle to their subscript
+        (the text is left as None), the text itself
+        is fetched from the store by Tabs.tab_text
+        when the tab is shown.
         """
-        _, subscripts = parsexml('subscript')
+        subscripts = self.store.subscript_elements()
         if len(subscripts) == 0:
             return
         subscripts = sorted(
@@ -198,21 +371,18 @@ class AutoSaveManager(QtCore.QObject):
             name = s.attrib.get('name')
             data = s.attrib.copy()
 
-            data['text'] = s.text
+            data['text'] = None
+            if 'blob' in s.attrib:
+                data['size'] = int(s.attrib.get('size', 0))
+            else:
+                data['size'] = len(s.text or '')
             # if there's no text saved,
-            # but there is a path, try and
-            # get the file contents
-            if not s.text:
+            # but there is a path, the file
+            # contents will be read when
+            # the tab is first shown.
+            if not has_text(s):
                 path = s.attrib.get('path')
                 if is_file(path):
-                    with open(path, 'r') as f:
-                        text = f.read()
-                    data['text'] = text
-                    # set original text property
-                    # to allow reverting back to
-                    # the original, or comparison
-                    # on file save/tab close.
-                    data['original_text'] = text
                     data['saved'] = True
 
             tab_name = name
@@ -224,12 +394,13 @@ class AutoSaveManager(QtCore.QObject):
 
         # try and get the index of the current tab from the last session
         index = self.tabs.count()-1
-        root, index_elements = parsexml('current_index')
-        for index_element in index_elements:
-            current_index = int(index_element.text)
-            if current_index in range(0, index):
-                index = current_index
-                break
+        current_index = self.store.element_text('current_index')
+        try:
+            current_index = int(current_index)
+        except (TypeError, ValueError):
+            current_index = -1
+        if current_index in range(0, index):
+            index = current_index
 
         # set tab and editor contents.
         self.tabs.setCurrentIndex(index)
@@ -287,11 +458,16 @@ class AutoSaveManager(QtCore.QObject):
         if tabs.currentIndex() == -1:
             return
 
-        # read the autosave file
-        _, subscripts = parsexml('subscript')
+        # re-read the autosave file, in case
+        # another instance has written to it.
+        self.store.refresh()
+        tab_uid = tabs.get_current_tab_property('uuid')
+        subscripts = []
+        subscript = self.store.subscripts.get(tab_uid)
+        if subscript is not None:
+            subscripts.append(subscript)
 
         # sync tab names from the autosave
-        tab_uid = tabs.get_current_tab_property('uuid')
         for s in subscripts:
             uid = s.attrib.get('uuid')
             if uid != tab_uid:
@@ -303,21 +479,28 @@ class AutoSaveManager(QtCore.QObject):
             self.tabs.setTabText(index, xml_tab_name)
             self.tabs.set_current_tab_property('name', xml_tab_name)
 
+        # only offer to update the tab if another
+        # instance has changed it, until the user
+        # has chosen which version to keep.
+        if tab_uid not in self.store.changed_by_others:
+            return
+
         # find all subscripts with a
         # matching uid for our current tab
         not_matching = []
-        editor_text = self.editor.toPlainText()
+        editor_digest = self.editor.text_digest()
         for s in subscripts:
-            if s.text is None:
+            if s.text is None and 'blob' not in s.attrib:
                 continue
             uid = s.attrib.get('uuid')
             if uid != tab_uid:
                 continue
-            if s.text != editor_text:
+            if self.store.digest(uid) != editor_digest:
                 not_matching.append((s, uid))
 
         mismatch_count = len(not_matching)
         if mismatch_count == 0:
+            self.store.changed_by_others.discard(tab_uid)
             return
         # print('number of mismatches:',mismatch_count,not_matching)
 
@@ -357,8 +540,7 @@ class AutoSaveManager(QtCore.QObject):
         with open(path, 'r') as f:
             text = f.read()
 
-        editor_text = self.editor.toPlainText()
-        if text == editor_text:
+        if text_digest(text) == self.editor.text_digest():
             return
 
         self.tabs.set_current_tab_property('saved', False)
@@ -407,6 +589,10 @@ class AutoSaveManager(QtCore.QObject):
             self.remove_existing_popups,
             name
         )
+        resolved = partial(
+            self.store.changed_by_others.discard,
+            subscript.attrib.get('uuid')
+        )
 
         layout = self.tabeditor.layout()
         layout.insertWidget(1, popup_bar)
@@ -432,22 +618,25 @@ class AutoSaveManager(QtCore.QObject):
         )
         new_button.clicked.connect(new)
         new_button.clicked.connect(remove)
+        new_button.clicked.connect(resolved)
         save = partial(
             self.save_this_version,
             subscript
         )
         save_button.clicked.connect(save)
         save_button.clicked.connect(remove)
+        save_button.clicked.connect(resolved)
         update = partial(
             self.update_from_autosave,
             subscript
         )
         update_button.clicked.connect(update)
         update_button.clicked.connect(remove)
+        update_button.clicked.connect(resolved)
 
         show_diff = partial(
             self.show_diff_text,
-            subscript.text
+            self.store.text(subscript.attrib.get('uuid'))
         )
         diff_button.clicked.connect(show_diff)
 
@@ -513,8 +702,9 @@ class AutoSaveManager(QtCore.QObject):
 
     def load_into_new_tab(self, s):
         text = self.editor.toPlainText()
-        self.editor.replace_text(s.text)
-        self.tabs.set_current_tab_property('text', s.text)
+        autosave_text = self.store.text(s.attrib.get('uuid'))
+        self.editor.replace_text(autosave_text)
+        self.tabs.set_current_tab_property('text', autosave_text)
         self.autosave()
 
         self.tabs.new_tab(
@@ -528,13 +718,13 @@ class AutoSaveManager(QtCore.QObject):
 
     def save_this_version(self, subscript):
         text = self.editor.toPlainText()
-        subscript.text = text
         self.tabs.set_current_tab_property('text', text)
         self.autosave()
 
     def update_from_autosave(self, subscript):
-        self.editor.replace_text(subscript.text)
-        self.tabs.set_current_tab_property('text', subscript.text)
+        text = self.store.text(subscript.attrib.get('uuid'))
+        self.editor.replace_text(text)
+        self.tabs.set_current_tab_property('text', text)
         self.autosave()
 
     def check_diff_modified(self):
@@ -547,16 +737,30 @@ class AutoSaveManager(QtCore.QObject):
         """
         Synchronise the tab_index saved in <subscript>
         elements and the tab indices of all tabs in the QTabBar.
+        Only subscripts whose index has changed are written,
+        and nothing is checked unless tabs have been inserted,
+        removed or moved, subscripts added, or the store reloaded
+        since the last time.
         """
-        root, subscripts = parsexml('subscript')
+        store = self.store
+        key = (
+            self.tabs.layout_changes,
+            len(store.subscripts),
+            store.cache_misses,
+        )
+        if key == self.synced_tab_indices:
+            self.request_compact()
+            return
+        self.synced_tab_indices = key
         for i in range(self.tabs.count()):
             data = self.tabs.tabData(i)
-            for s in subscripts:
-                if s.attrib.get('uuid') != data['uuid']:
-                    continue
-                s.attrib['tab_index'] = str(i)
-                break
-        writexml(root)
+            s = store.subscripts.get(data['uuid'])
+            if s is None:
+                continue
+            if s.attrib.get('tab_index') == str(i):
+                continue
+            store.update(data['uuid'], {'tab_index': str(i)})
+        self.request_compact()
 
     @QtCore.Slot()
     def autosave(self):
@@ -580,25 +784,16 @@ class AutoSaveManager(QtCore.QObject):
     def save_by_uuid(self, uid, name, text, index, path=None):
         """ Create/update a specific subscript given by uuid.
         """
-        root, subscripts = parsexml('subscript')
-
-        for s in subscripts:
-            if s.attrib.get('uuid') == uid:
-                sub = s
-                break
-        else:
-            sub = ETree.Element('subscript')
-            root.append(sub)
-
-        sub.attrib['uuid'] = uid
-        sub.attrib['name'] = name
-        sub.text = text
-        sub.attrib['tab_index'] = index
-
+        attrib = {
+            'uuid'      : uid,
+            'name'      : name,
+            'tab_index' : index,
+        }
         if path is not None:
-            sub.attrib['path'] = path
+            attrib['path'] = path
 
-        writexml(root)
+        self.store.update(uid, attrib, text=text)
+        self.request_compact()
 
     def store_current_index(self):
         """
@@ -606,14 +801,10 @@ class AutoSaveManager(QtCore.QObject):
         to restore the current index on readautosave.
         (if present, for backwards compatibility).
         """
-        root, index_elements = parsexml('current_index')
-        if len(index_elements) == 0:
-            ci = ETree.Element('current_index')
-            root.append(ci)
-        else:
-            ci = index_elements[0]
-        ci.text = str(self.tabs.currentIndex())
-        writexml(root)
+        index = str(self.tabs.currentIndex())
+        if self.store.element_text('current_index') == index:
+            return
+        self.store.set_element('current_index', index)
 
     @QtCore.Slot(int, int)
     def update_tab_index(self, from_index, to_index):
@@ -626,7 +817,7 @@ class AutoSaveManager(QtCore.QObject):
             self.save_by_uuid(
                 data['uuid'],
                 data['name'],
-                data['text'],
+                data.get('text'), # None leaves the text as is
                 str(i),
                 data.get('path')
             )
@@ -648,35 +839,18 @@ class AutoSaveManager(QtCore.QObject):
         """
         # find the tab by uid
         uid = str(uid)
-        index = -1
-        if self.tabs.get_current_tab_property('uuid') != uid:
-            for i in range(self.tabs.count()):
-                data = self.tabs.tabData(i)
-                if data.get('uuid') != uid:
-                    continue
-                index = i
-                break
-            else:
-                return
-        else:
-            index = self.tabs.currentIndex()
-            data = self.tabs.tabData(index)
+        index = self.tabs.index_for_uuid(uid)
+        if index == -1:
+            return
+        data = self.tabs.tabData(index)
 
         path = data.get('path')
         if not is_file(path):
             return
 
-        root, subscripts = parsexml('subscript')
         # we first look for an existing
         # subscript that matches the uid
-        for s in subscripts:
-            if s.attrib.get('uuid') != uid:
-                continue
-            # and modify it
-            s.attrib['path'] = path
-            s.attrib['name'] = data.get('name')
-            break
-        else:
+        if uid not in self.store.subscripts:
             # if none is found we create
             # a new subscript
             index = self.tabs.currentIndex()
@@ -693,9 +867,14 @@ class AutoSaveManager(QtCore.QObject):
             # FIXME: 'saved' attrib of the tab is modified by self.tabs.save_text_in_tab after this, triggered by the editor text_changed_signal
             self.tabs.setTabData(index, data)
             return
+
+        # and modify it
+        self.store.update(uid, {
+            'path' : path,
+            'name' : data.get('name'),
+        })
         data['saved'] = True
         self.tabs.setTabData(index, data)
-        writexml(root)
 
     @QtCore.Slot(object, int)
     def handle_tab_moved(self, editor, tab_index):
@@ -714,15 +893,11 @@ class AutoSaveManager(QtCore.QObject):
         """
         Remove subscripts if they are empty.
         """
-        root, subscripts = parsexml('subscript')
-
-        for s in subscripts:
-            notext = not s.text
+        for s in self.store.subscript_elements():
+            notext = not has_text(s)
             nopath = s.attrib.get('path') is None
             if notext and nopath:
-                root.remove(s)
-
-        writexml(root)
+                self.store.remove(s.attrib.get('uuid'))
 
     @QtCore.Slot(str)
     def remove_subscript(self, uid):
@@ -738,80 +913,989 @@ class AutoSaveManager(QtCore.QObject):
         :param uid: Unique Identifier of
                     subscript to remove
         """
-        root, subscripts = parsexml('subscript')
-
-        item_removed = False
-        for s in subscripts:
-            if s.attrib.get('uuid') == uid:
-                root.remove(s)
-                item_removed = True
-
-        if item_removed:
-            writexml(root)
+        self.store.remove(uid)
+        self.request_compact()
 
     @QtCore.Slot()
     def clear_subscripts(self):
         """
         Remove all subscripts.
         """
-        root, subscripts = parsexml('subscript')
+        self.store.clear()
+        self.store.compact()
+
+
+class AutoSaveStore(object):
+    """ In-memory index of the autosave file,
+    keyed by uuid.
+
+    The xml is parsed once into self.root,
+    with self.subscripts mapping each uuid to
+    its <subscript> element. Instead of
+    rewriting the whole xml file, every change
+    is appended as a single JSON record to a
+    journal that sits next to it. On load, the
+    journal is replayed on top of the xml, and
+    compact() writes the xml in full and empties
+    the journal again.
+
+    Digests of subscript text are kept in memory
+    only (an older PythonEditor rewriting the
+    xml would leave a stored digest stale), and
+    are computed the first time they're asked for.
+    Each subscript also has a version number that
+    changes whenever its text may have changed, so
+    that copies of the text held elsewhere can be
+    checked without comparing them.
+
+    Text of at least spill_size characters is
+    written to a compressed blob, and the subscript
+    is left empty with 'blob' (the blob's file name)
+    and 'size' attributes. Use text() rather than
+    the element's text to read a subscript.
+
+    Other PythonEditor instances may share the
+    same files. Each record is tagged with the
+    instance that wrote it, and refresh() applies
+    the records that have been appended to the
+    journal since it was last read, in the order
+    they were written. The files are only parsed
+    again when another instance has compacted them.
+    The uuids of subscripts whose text was last
+    changed by another instance are collected in
+    changed_by_others.
+
+    Records in the journal are plain assignments,
+    so replaying them over an xml file that
+    already contains them is harmless - a crash
+    between writing the xml and emptying the
+    journal loses nothing.
+
+    :param path: `str` path to the xml file.
+    """
+    def __init__(self, path=None):
+        if path is None:
+            path = AUTOSAVE_FILE
+        self.path = path
+        self.journal_path = path + JOURNAL_SUFFIX
+        self.blob_path = path + BLOB_SUFFIX
+        self.spill_size = SPILL_SIZE
+        self.writer = AutoSaveWriter(path, self.journal_path)
+        self.instance = uuid.uuid4().hex
+        # numbers our records, so that those not yet
+        # written can be told from those on disk.
+        self.sequence = itertools.count(1)
+        self.root = None
+        self.subscripts = {}
+        self.digests = {}
+        # per-uuid version numbers of this process' copy of
+        # the text, used as cache keys (see Tabs.cache_text).
+        # Writes are ordered across instances by the journal
+        # (appended under a FileLock) and each record's src
+        # and seq, not by these.
+        self.versions = {}
+        self.version = 0
+        self.changed_by_others = set()
+        self.journal_size = 0
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.merges = 0
+        self.load()
+
+    def refresh(self):
+        """ Bring the store up to date with changes
+        other instances have made to the files on disk.
+
+        Doesn't wait for our own queued writes to reach
+        the disk, unless the files must be parsed again.
+
+        :return: `bool` True if anything was read.
+        """
+        xml_signature = file_signature(self.path)
+        journal_signature = file_signature(self.journal_path)
+        if self.writer.is_up_to_date(xml_signature, journal_signature):
+            self.cache_hits += 1
+            return False
+
+        writer = self.writer
+        with writer.condition:
+            offset = writer.journal_offset
+            inode = writer.journal_inode
+        appended = (
+            xml_signature == writer.xml_signature
+            and journal_signature is not None
+            and inode in (None, journal_signature[2])
+            and (inode is not None or offset == 0)
+            and journal_signature[1] > offset
+        )
+        if appended:
+            return self.merge_journal(offset, journal_signature)
+        # load() needs our writes on disk. If they are slow
+        # (on a network drive, say) try again next time.
+        writer.flush(timeout=REFRESH_TIMEOUT)
+        if writer.queue_depth() or writer.busy:
+            return False
+        self.load()
+        return True
 
-        for s in subscripts:
-            root.remove(s)
+    def load(self):
+        """ Read the xml file and replay the
+        journal on top of it.
+        """
+        # give what we've queued a chance to reach the
+        # disk. Whatever hasn't is applied again below.
+        self.writer.flush(timeout=REFRESH_TIMEOUT)
+        self.cache_misses += 1
+
+        previous = self.subscripts
+        with FileLock(self.writer.lock_path):
+            xml_signature = file_signature(self.path)
+            root, subscripts = parsexml('subscript', path=self.path)
+            self.root = root
+            self.subscripts = {}
+            self.digests = {}
+            self.versions = {}
+            for s in subscripts:
+                uid = s.attrib.get('uuid')
+                if uid is None:
+                    continue
+                if uid in self.subscripts:
+                    continue
+                self.subscripts[uid] = s
+                self.bump_version(uid)
+            offset, inode, written = self.replay_journal()
+            self.writer.set_position(xml_signature, offset, inode)
+        self.apply_pending(written)
+
+        # everything we had written has been applied,
+        # so any other differences are someone else's.
+        for uid, s in self.subscripts.items():
+            old = previous.get(uid)
+            if old is None:
+                continue
+            if (old.text != s.text
+                    or old.attrib.get('blob') != s.attrib.get('blob')):
+                self.changed_by_others.add(uid)
+
+    def replay_journal(self):
+        """ Apply all records found in the journal
+        to the in-memory tree. Incomplete records
+        (e.g. from a crash mid-write) are skipped.
+
+        :return: `tuple` of the number of bytes read up to
+        the last complete record, the journal's inode and
+        the highest sequence number of our records in it.
+        """
+        self.journal_size = 0
+        written = 0
+        if not is_file(self.journal_path):
+            return 0, None, written
+        with open(self.journal_path, 'rb') as f:
+            inode = os.fstat(f.fileno()).st_ino
+            for line in f:
+                if not line.endswith(b'\n'):
+                    # still being written
+                    break
+                self.journal_size += len(line)
+                record = self.apply_line(line)
+                if record is not None and record.get('src') == self.instance:
+                    written = max(written, record.get('seq', 0))
+        return self.journal_size, inode, written
+
+    def merge_journal(self, offset, journal_signature):
+        """ Apply the records appended to the journal
+        since offset. Our own records are applied too, as
+        they may be interleaved with newer records from
+        other instances - applying them again is harmless.
+
+        :return: `bool` True if any records were read.
+        """
+        size = journal_signature[1]
+        with open(self.journal_path, 'rb') as f:
+            f.seek(offset)
+            data = f.read(size - offset)
+        # only read up to the last complete record
+        end = data.rfind(b'\n')
+        if end == -1:
+            return False
+        data = data[:end+1]
+        # the instance that last wrote the text of each uuid.
+        sources = {}
+        written = 0
+        for line in data.splitlines(True):
+            record = self.apply_line(line)
+            if record is None:
+                continue
+            if record.get('src') == self.instance:
+                written = max(written, record.get('seq', 0))
+            if record.get('op') == 'clear':
+                sources.clear()
+                self.changed_by_others.clear()
+            elif 'text' in record and 'uuid' in record:
+                sources[record['uuid']] = record.get('src')
+        for record in self.apply_pending(written):
+            if record.get('op') == 'clear':
+                sources.clear()
+                self.changed_by_others.clear()
+            elif 'text' in record and 'uuid' in record:
+                sources[record['uuid']] = self.instance
+        for uid, source in sources.items():
+            if source == self.instance:
+                self.changed_by_others.discard(uid)
+            else:
+                self.changed_by_others.add(uid)
+        self.journal_size += len(data)
+        self.merges += 1
+        with self.writer.condition:
+            if self.writer.journal_offset == offset:
+                self.writer.journal_offset = offset + len(data)
+                self.writer.journal_inode = journal_signature[2]
+        return True
+
+    def apply_pending(self, written):
+        """ Apply our records that aren't on disk yet again,
+        as they are newer than everything read from it.
+
+        :param written: `int` the highest sequence number
+        of our records that was read from the disk.
+        :return: `list` of the records applied.
+        """
+        applied = []
+        for record in self.writer.pending_records():
+            if record.get('seq', 0) <= written:
+                continue
+            self.apply(record)
+            applied.append(record)
+        return applied
+
+    def apply_line(self, line):
+        """ Apply a line of the journal.
+
+        :return: `dict` the record applied, or None.
+        """
+        try:
+            record = json.loads(line.decode('utf-8'))
+        except ValueError:
+            return None
+        if not isinstance(record, dict):
+            return None
+        self.apply(record)
+        return record
+
+    def apply(self, record):
+        """ Apply a single journal record
+        to the in-memory tree.
+
+        :param record: `dict` with an 'op' key.
+        """
+        op = record.get('op')
+        if op == 'update':
+            uid = record['uuid']
+            sub = self.subscripts.get(uid)
+            if sub is None:
+                sub = ETree.Element('subscript')
+                self.root.append(sub)
+                self.subscripts[uid] = sub
+                self.bump_version(uid)
+            attrib = record.get('attrib', {})
+            sub.attrib.update(attrib)
+            sub.attrib['uuid'] = uid
+            if 'text' in record:
+                sub.text = record['text']
+                if 'blob' not in attrib:
+                    sub.attrib.pop('blob', None)
+                    sub.attrib.pop('size', None)
+                self.digests.pop(uid, None)
+                self.bump_version(uid)
+        elif op == 'remove':
+            sub = self.subscripts.pop(record['uuid'], None)
+            self.digests.pop(record['uuid'], None)
+            self.versions.pop(record['uuid'], None)
+            if sub is not None:
+                self.root.remove(sub)
+        elif op == 'clear':
+            for sub in self.root.findall('subscript'):
+                self.root.remove(sub)
+            self.subscripts = {}
+            self.digests = {}
+            self.versions = {}
+        elif op == 'element':
+            tag = record['tag']
+            elements = self.root.findall(tag)
+            text = record.get('text')
+            if text is None:
+                for element in elements:
+                    self.root.remove(element)
+                return
+            if elements:
+                element = elements[0]
+            else:
+                element = ETree.Element(tag)
+                self.root.append(element)
+            element.text = text
+
+    def bump_version(self, uid):
+        """ Give the subscript for uid a new
+        version number. Numbers are never reused,
+        even across reloads, but are only
+        meaningful within this process.
+        """
+        self.version += 1
+        self.versions[uid] = self.version
 
-        writexml(root)
+    def write(self, record):
+        """ Apply a record and queue it to be
+        appended to the journal.
+
+        :param record: `dict` with an 'op' key.
+        """
+        record['src'] = self.instance
+        record['seq'] = next(self.sequence)
+        self.apply(record)
+        self.writer.append(record)
+        # a rough estimate is enough to decide
+        # when to compact.
+        self.journal_size += len(record.get('text') or '') + 200
+
+    def update(self, uid, attrib, text=None):
+        """ Create or update the subscript for uid.
+
+        :param uid: `str` Unique Identifier of subscript
+        :param attrib: `dict` of attributes to set
+        :param text: `str` new text, or None to leave unchanged.
+        """
+        digest = None
+        if (text is not None
+                and self.spill_size
+                and len(text) >= self.spill_size):
+            digest = text_digest(text)
+            name = blob_name(digest)
+            self.writer.write_blob(
+                os.path.join(self.blob_path, name),
+                text
+            )
+            attrib = dict(attrib)
+            attrib['blob'] = name
+            attrib['size'] = str(len(text))
+            text = ''
+        record = {
+            'op'     : 'update',
+            'uuid'   : uid,
+            'attrib' : attrib,
+        }
+        if text is not None:
+            record['text'] = text
+        self.write(record)
+        if digest is not None:
+            self.digests[uid] = digest
+
+    def remove(self, uid):
+        """ Remove the subscript for uid, if present.
+        """
+        if uid not in self.subscripts:
+            return
+        self.write({'op': 'remove', 'uuid': uid})
+
+    def clear(self):
+        """ Remove all subscripts.
+        """
+        self.write({'op': 'clear'})
+
+    def set_element(self, tag, text):
+        """ Set the text of the first <tag> element
+        under the root, creating it if necessary.
+        If text is None, all <tag> elements are removed.
+        """
+        self.write({'op': 'element', 'tag': tag, 'text': text})
+
+    def text(self, uid):
+        """ Return the text of the subscript
+        for uid, or None if there is no such
+        subscript (or it has no text).
+        """
+        sub = self.subscripts.get(uid)
+        if sub is None:
+            return None
+        name = sub.attrib.get('blob')
+        if name is None:
+            return sub.text
+        path = os.path.join(self.blob_path, name)
+        text = self.writer.pending_text(path)
+        if text is None:
+            text = read_blob(path)
+        return text
+
+    def digest(self, uid):
+        """ Return the digest of the text of the
+        subscript for uid, or None if there is
+        no such subscript.
+        """
+        digest = self.digests.get(uid)
+        if digest is not None:
+            return digest
+        sub = self.subscripts.get(uid)
+        if sub is None:
+            return None
+        name = sub.attrib.get('blob')
+        if name is not None:
+            # blobs are named after their digest
+            digest = name.split('.')[0]
+        else:
+            digest = text_digest(sub.text)
+        self.digests[uid] = digest
+        return digest
+
+    def element_text(self, tag):
+        """ Return the text of the first <tag>
+        element under the root, or None.
+        """
+        element = self.root.find(tag)
+        if element is None:
+            return None
+        return element.text
+
+    def subscript_elements(self):
+        """ Return the <subscript> elements
+        in the order they appear in the xml.
+        """
+        return self.root.findall('subscript')
+
+    def needs_compaction(self):
+        """ Return True if the journal has grown
+        large enough to be worth folding into the xml,
+        or if writing to the journal has failed.
+        """
+        if self.writer.failed:
+            return True
+        if self.journal_size == 0:
+            return False
+        try:
+            xml_size = os.path.getsize(self.path)
+        except OSError:
+            xml_size = 0
+        return self.journal_size > max(COMPACT_SIZE, xml_size//2)
+
+    def compact(self):
+        """ Queue the whole tree to be written
+        into the xml file, emptying the journal.
+        Blobs that are no longer used are removed
+        after the xml has been written.
+
+        Only a snapshot of the tree is taken here, it
+        is serialized and written by the writer's thread.
+        """
+        # include whatever other instances have
+        # written, so that it isn't overwritten.
+        self.refresh()
+        keep_blobs = set()
+        for sub in self.subscripts.values():
+            name = sub.attrib.get('blob')
+            if name is not None:
+                keep_blobs.add(os.path.join(self.blob_path, name))
+        self.writer.replace(snapshot(self.root), keep_blobs)
+        self.journal_size = 0
+
+    def stats(self):
+        """ Return a dictionary describing
+        the state of the store and its writer.
+        """
+        return {
+            'subscripts'         : len(self.subscripts),
+            'journal_size'       : self.journal_size,
+            'queue_depth'        : self.writer.queue_depth(),
+            'last_write_latency' : self.writer.last_write_latency,
+            'writes'             : self.writer.writes,
+            'coalesced'          : self.writer.coalesced,
+            'cache_hits'         : self.cache_hits,
+            'cache_misses'       : self.cache_misses,
+            'merges'             : self.merges,
+            'conflicts'          : self.writer.conflicts,
+            'bytes_written'      : self.writer.bytes_written,
+            'last_write_bytes'   : self.writer.last_write_bytes,
+        }
+
+    def export_xml(self, path):
+        """ Write the current contents of the
+        store to a standalone xml file, with
+        the text of any blobs included.
+        """
+        root = copy.deepcopy(self.root)
+        for sub in root.findall('subscript'):
+            if 'blob' not in sub.attrib:
+                continue
+            sub.text = self.text(sub.attrib.get('uuid'))
+            del sub.attrib['blob']
+            sub.attrib.pop('size', None)
+        writexml(root, path)
+
+    def import_xml(self, path):
+        """ Add (or update) the subscripts found in
+        an xml file written by PythonEditor.
+
+        :return: `list` of imported uuids.
+        """
+        xmlp = ETree.XMLParser(encoding="utf-8")
+        root = ETree.parse(path, xmlp).getroot()
+        uids = []
+        for s in root.findall('subscript'):
+            uid = s.attrib.get('uuid')
+            if uid is None:
+                continue
+            attrib = dict(s.attrib)
+            attrib.pop('blob', None)
+            attrib.pop('size', None)
+            self.update(uid, attrib, text=s.text or '')
+            uids.append(uid)
+        return uids
+
+
+class AutoSaveWriter(object):
+    """ Writes the autosave journal and xml
+    file on a background thread, so that slow
+    (e.g. network) file systems don't block
+    the interface.
+
+    Records queued with append() are coalesced -
+    successive updates to the same subscript or
+    element become a single record - and written
+    to the journal in one go. The xml contents
+    queued with replace() are written atomically
+    through replace_file, after which the journal
+    is removed; any records queued before it are
+    dropped, as they are part of the new file.
+
+    Blobs queued with write_blob() are compressed
+    and written before anything else, so that no
+    record can refer to a blob that isn't on disk.
+    Until then, their text is kept in self.pending_blobs.
+
+    Other PythonEditor instances may share the same
+    files, so writes are made while holding a FileLock.
+    The writer keeps track of how much of the files the
+    store has read: xml_signature is the signature of
+    the xml file it was read from, and journal_offset
+    and journal_inode the part of the journal that
+    has been applied. Records appended while the store
+    is up to date move the offset past them. The xml
+    is only replaced if no other instance has written
+    since - otherwise the records it would have replaced
+    are appended to the journal instead.
+
+    :param path: `str` path to the xml file.
+    :param journal_path: `str` path to the journal file.
+    """
+    def __init__(self, path, journal_path):
+        self.path = path
+        self.journal_path = journal_path
+        self.lock_path = path + LOCK_SUFFIX
+        self.xml_signature = None
+        self.journal_offset = 0
+        self.journal_inode = None
+        self.condition = threading.Condition()
+        self.records = []
+        self.replaced_records = []
+        # records taken from the queue
+        # that are being written.
+        self.writing = []
+        self.replacement = None
+        self.keep_blobs = None
+        self.blobs = []
+        self.pending_blobs = {}
+        self.busy = False
+        self.failed = False
+        self.thread = None
+
+        # statistics
+        self.writes = 0
+        self.coalesced = 0
+        self.last_write_latency = 0.0
+        self.bytes_written = 0
+        self.last_write_bytes = 0
+        self.conflicts = 0
+
+    def start(self):
+        """ Start the writer thread if it isn't running.
+        """
+        if self.thread is not None and self.thread.is_alive():
+            return
+        self.thread = threading.Thread(
+            target=self.run,
+            name='PythonEditorAutoSaveWriter'
+        )
+        self.thread.daemon = True
+        self.thread.start()
+
+    def append(self, record):
+        """ Queue a record to be appended to the journal.
+
+        :param record: `dict` with an 'op' key.
+        """
+        with self.condition:
+            if self.merge(record):
+                self.coalesced += 1
+            else:
+                self.records.append(record)
+            self.start()
+            self.condition.notify_all()
+
+    def merge(self, record):
+        """ Fold the record into a queued record for the
+        same subscript or element. Return True if merged.
+        """
+        op = record.get('op')
+        if op not in ('update', 'element'):
+            return False
+        for pending in reversed(self.records):
+            pending_op = pending.get('op')
+            if pending_op == 'clear':
+                return False
+            if op == 'update' and pending.get('uuid') == record['uuid']:
+                if pending_op != 'update':
+                    return False
+                attrib = dict(pending.get('attrib', {}))
+                attrib.update(record.get('attrib', {}))
+                pending['seq'] = record.get('seq')
+                if 'text' in record:
+                    pending['text'] = record['text']
+                    if 'blob' not in record.get('attrib', {}):
+                        attrib.pop('blob', None)
+                        attrib.pop('size', None)
+                pending['attrib'] = attrib
+                return True
+            if (op == 'element'
+                    and pending_op == 'element'
+                    and pending['tag'] == record['tag']):
+                pending['text'] = record.get('text')
+                pending['seq'] = record.get('seq')
+                return True
+        return False
+
+    def replace(self, data, keep_blobs=None):
+        """ Queue the contents of the xml file to be
+        replaced, removing the journal afterwards.
+
+        :param data: `tuple` a snapshot() of the new
+        contents of the file, serialized by the writer.
+        :param keep_blobs: `set` of blob paths referenced
+        by the new file. If given, older blobs that are not
+        in it are removed once the file has been written.
+        """
+        with self.condition:
+            # kept in case the replacement
+            # can't be written after all.
+            self.replaced_records.extend(self.records)
+            self.records = []
+            self.replacement = data
+            self.keep_blobs = keep_blobs
+            self.start()
+            self.condition.notify_all()
+
+    def write_blob(self, path, text):
+        """ Queue text to be compressed and written to path.
+
+        :param path: `str` path to the blob file.
+        :param text: `str` text to store in the blob.
+        """
+        with self.condition:
+            self.blobs.append((path, text))
+            self.pending_blobs[path] = text
+            self.start()
+            self.condition.notify_all()
+
+    def pending_text(self, path):
+        """ Return the text of a blob that has been
+        queued but not yet written, or None.
+        """
+        with self.condition:
+            return self.pending_blobs.get(path)
+
+    def set_position(self, xml_signature, offset, inode):
+        """ Record how much of the files on
+        disk the store has read.
+        """
+        with self.condition:
+            self.xml_signature = xml_signature
+            self.journal_offset = offset
+            self.journal_inode = inode
+
+    def is_up_to_date(self, xml_signature, journal_signature):
+        """ Return True if the store has read all of the
+        files with the given signatures (from file_signature).
+        """
+        with self.condition:
+            if xml_signature != self.xml_signature:
+                return False
+            if journal_signature is None:
+                return self.journal_offset == 0
+            if journal_signature[2] != self.journal_inode:
+                return False
+            return journal_signature[1] == self.journal_offset
+
+    def pending_records(self):
+        """ Return the records that have been queued
+        but not yet written, oldest first.
+        """
+        with self.condition:
+            return self.writing + self.replaced_records + self.records
+
+    def queue_depth(self):
+        """ Return the number of writes waiting to be written.
+        """
+        with self.condition:
+            depth = len(self.records) + len(self.blobs)
+            if self.replacement is not None:
+                depth += 1
+            return depth
+
+    def flush(self, timeout=None):
+        """ Block until all queued writes have been written,
+        or until timeout (in seconds) has passed.
+        """
+        deadline = None
+        if timeout is not None:
+            deadline = time.time() + timeout
+        with self.condition:
+            while (self.records
+                    or self.replacement is not None
+                    or self.blobs
+                    or self.busy):
+                if self.thread is None or not self.thread.is_alive():
+                    break
+                if deadline is None:
+                    self.condition.wait()
+                    continue
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    break
+                self.condition.wait(remaining)
+
+    def run(self):
+        while True:
+            with self.condition:
+                while not (self.records
+                        or self.replacement
+                        or self.blobs):
+                    self.condition.wait()
+                records, self.records = self.records, []
+                replaced, self.replaced_records = self.replaced_records, []
+                replacement, self.replacement = self.replacement, None
+                keep_blobs, self.keep_blobs = self.keep_blobs, None
+                blobs, self.blobs = self.blobs, []
+                self.writing = replaced + records
+                self.busy = True
+
+            start = time.time()
+            self.last_write_bytes = 0
+            try:
+                if blobs:
+                    self.write_blobs(blobs)
+                if replacement is not None:
+                    data = xml_data(snapshot_element(replacement))
+                    if self.write_replacement(data):
+                        self.coalesced += len(replaced)
+                        if keep_blobs is not None and not self.failed:
+                            self.remove_blobs(keep_blobs)
+                    else:
+                        self.conflicts += 1
+                        records = replaced + records
+                if records:
+                    self.write_records(records)
+            except Exception as e:
+                print('Autosave writer error:', e)
+            finally:
+                with self.condition:
+                    self.last_write_latency = time.time() - start
+                    self.bytes_written += self.last_write_bytes
+                    self.writes += 1
+                    self.writing = []
+                    self.busy = False
+                    self.condition.notify_all()
+
+    def write_blobs(self, blobs):
+        for path, text in blobs:
+            try:
+                if is_file(path):
+                    # still in use - keep it
+                    # from expiring.
+                    os.utime(path, None)
+                else:
+                    folder = os.path.dirname(path)
+                    if not os.path.isdir(folder):
+                        os.makedirs(folder)
+                    data = compress_blob(path, text)
+                    replace_file(path, data)
+                    self.last_write_bytes += len(data)
+            except (IOError, OSError) as e:
+                msg = "Couldn't write to {0}\n".format(path)
+                msg += "due to the following error:\n{0}".format(e)
+                print(msg)
+                # the text stays in pending_blobs.
+                self.failed = True
+                continue
+            with self.condition:
+                if self.pending_blobs.get(path) is text:
+                    del self.pending_blobs[path]
+
+    def remove_blobs(self, keep_blobs):
+        """ Remove blobs that aren't in keep_blobs
+        and are older than BLOB_EXPIRY.
+        """
+        folder = self.path + BLOB_SUFFIX
+        if not os.path.isdir(folder):
+            return
+        now = time.time()
+        for name in os.listdir(folder):
+            path = os.path.join(folder, name)
+            if path in keep_blobs:
+                continue
+            try:
+                if now - os.path.getmtime(path) < BLOB_EXPIRY:
+                    continue
+                os.remove(path)
+            except OSError:
+                pass
+
+    def write_replacement(self, data):
+        """ Replace the xml file and remove the journal,
+        unless another instance has written to either
+        since the store last read them.
+
+        :return: `bool` False if the files had changed.
+        """
+        with FileLock(self.lock_path):
+            if not self.is_up_to_date(
+                    file_signature(self.path),
+                    file_signature(self.journal_path)):
+                return False
+            if not write_file(self.path, data):
+                # keep the journal, it's still needed.
+                self.failed = True
+                return True
+            self.last_write_bytes += len(data)
+            if is_file(self.journal_path):
+                os.remove(self.journal_path)
+            self.failed = False
+            self.set_position(file_signature(self.path), 0, None)
+        return True
+
+    def write_records(self, records):
+        lines = [json.dumps(r) + '\n' for r in records]
+        data = ''.join(lines).encode('utf-8')
+        try:
+            with FileLock(self.lock_path):
+                self.append_records(data)
+        except (IOError, OSError) as e:
+            msg = "Couldn't write to {0}\n".format(self.journal_path)
+            msg += "due to the following error:\n{0}".format(e)
+            print(msg)
+            # the records are still held in memory
+            # by the store, which will now compact.
+            self.failed = True
+
+    def append_records(self, data):
+        """ Append data to the journal. Must be called
+        while holding the lock.
+        """
+        before = file_signature(self.journal_path)
+        up_to_date = self.is_up_to_date(
+            file_signature(self.path),
+            before
+        )
+        with open(self.journal_path, 'ab') as f:
+            if before is not None and before[1] > 0:
+                # a crash may have left an incomplete
+                # record, which mustn't swallow ours.
+                with open(self.journal_path, 'rb') as last:
+                    last.seek(-1, os.SEEK_END)
+                    if last.read(1) != b'\n':
+                        data = b'\n' + data
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+            after = os.fstat(f.fileno())
+        self.last_write_bytes += len(data)
+        if up_to_date:
+            # nobody else has written, so the store
+            # already has everything in the journal.
+            self.set_position(
+                self.xml_signature,
+                after.st_size,
+                after.st_ino
+            )
+
+
+STORES = {}
+def get_store(path=None):
+    """ Return the AutoSaveStore for the given path,
+    creating it if necessary. Only one store per
+    file should exist, so that its index and journal
+    stay consistent.
+    """
+    if path is None:
+        path = AUTOSAVE_FILE
+    store = STORES.get(path)
+    if store is None:
+        store = AutoSaveStore(path)
+        STORES[path] = store
+    return store
+
+
+@atexit.register
+def flush_stores():
+    """ Give queued autosave writes a chance
+    to finish before the interpreter exits.
+    """
+    for store in list(STORES.values()):
+        store.writer.flush(timeout=10)
 
 
 class CouldNotCreateAutosave(Exception):
     pass
 
 
-def autosave_can_be_parsed():
+def autosave_can_be_parsed(path=AUTOSAVE_FILE):
     """ Return True if the autosave file
     is writable and not corrupted.
     """
-    global AUTOSAVE_FILE
     xmlp = ETree.XMLParser(encoding="utf-8")
     try:
-        parser = ETree.parse(AUTOSAVE_FILE, xmlp)
+        parser = ETree.parse(path, xmlp)
         return True
     except Exception:
         return False
 
 
-def create_autosave_file():
+def create_autosave_file(path=AUTOSAVE_FILE):
     """ Create the autosave file into which
     PythonEditor stores all tab contents.
     """
-    global AUTOSAVE_FILE
-    if autosave_can_be_parsed():
+    if autosave_can_be_parsed(path):
         return True
-    if os.path.isfile(AUTOSAVE_FILE):
-        fix_broken_xml()
-        if autosave_can_be_parsed():
+    if os.path.isfile(path):
+        fix_broken_xml(path)
+        if autosave_can_be_parsed(path):
             return True
         raise CouldNotCreateAutosave()
 
     try:
-        create_empty_autosave()
+        create_empty_autosave(path)
         return True
     except Exception as error:
         raise CouldNotCreateAutosave(error)
 
 
-def create_empty_autosave():
+def create_empty_autosave(path=AUTOSAVE_FILE):
     """ Write the default file header into the xml file.
     Overwrites any existing file.
     """
-    with open(AUTOSAVE_FILE, 'w') as f:
+    with open(path, 'w') as f:
         f.write(XML_HEADER+'<script></script>')
 
 
 def get_editor_xml():
     if not create_autosave_file():
         return
-    parser = ETree.parse(AUTOSAVE_FILE)
-    root = parser.getroot()
+    root = get_store().root
     editor_elements = root.findall('external_editor_path')
     return root, editor_elements
 
@@ -847,10 +1931,6 @@ def set_external_editor_path(path=None, ask_user=False):
     external editor path.
     TODO: Set temp program if none found.
     """
-    root, editor_elements = get_editor_xml()
-    for e in editor_elements:
-        root.remove(e)
-
     if ask_user and not path:
         from PythonEditor.ui.Qt import QtWidgets
         dialog = QtWidgets.QInputDialog()
@@ -872,11 +1952,7 @@ def set_external_editor_path(path=None, ask_user=False):
         editor_path = path
         os.environ['EXTERNAL_EDITOR_PATH'] = editor_path
 
-        element = ETree.Element('external_editor_path')
-        element.text = path
-        root.append(element)
-
-        writexml(root)
+        get_store().set_element('external_editor_path', path)
         return path
 
     elif ask_user:
@@ -891,27 +1967,22 @@ def set_external_editor_path(path=None, ask_user=False):
         return None
 
 
-def not_ctrl(ch):
-    is_ctrl_char = unicodedata.category(ch) == 'Cc'
-    not_newline = ch != '\n'
-    return (is_ctrl_char and not_newline)
+# all characters in the unicode Cc category, except newlines.
+CONTROL_CHARACTERS = re.compile(
+    r'[\x00-\x09\x0b-\x1f\x7f-\x9f]',
+    re.UNICODE
+)
+SANITIZE_CHUNK_SIZE = 1024*1024
 
 
 def remove_control_characters(s):
     """
     Identify and remove any control characters from given string s.
     """
-    cc = ''.join(ch for ch in s if not_ctrl(ch))
-    print('Removing undesirable control characters:', cc)
-
-    def no_cc(ch):
-        if ch == '\n':
-            return True
-        if unicodedata.category(ch) != "Cc":
-            return True
-        return False
-
-    return ''.join(ch for ch in s if no_cc(ch))
+    s, count = CONTROL_CHARACTERS.subn('', s)
+    if count:
+        print('Removed {0} undesirable control characters.'.format(count))
+    return s
 
 
 def sanitize(text):
@@ -919,13 +1990,73 @@ def sanitize(text):
     # TODO: add \t removal from editor module
     return text
 
+
+class PrintProgress(object):
+    """ Progress callback that prints
+    each time another 10% is done.
+    """
+    def __init__(self, label):
+        self.label = label
+        self.printed = -1
+
+    def __call__(self, done, total):
+        if not total:
+            return
+        percent = 100*done // total
+        if percent//10 == self.printed//10:
+            return
+        self.printed = percent
+        print('{0}: {1}%'.format(self.label, percent))
+
+
+def sanitize_file(path, dst, progress=None, chunk_size=SANITIZE_CHUNK_SIZE):
+    """ Copy the utf-8 text file at path to dst, removing
+    control characters. The file is read in chunks, so memory
+    use doesn't depend on the size of the file.
+
+    :param path: `str` file to read.
+    :param dst: `str` file to write.
+    :param progress: callable taking (bytes read, total bytes).
+    :param chunk_size: `int` number of bytes to read at a time.
+    :return: `int` number of characters removed.
+    """
+    total = os.path.getsize(path)
+    decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+    done = 0
+    removed = 0
+    carry = ''
+    with open(path, 'rb') as src, io.open(dst, 'w', encoding='utf-8') as out:
+        while True:
+            data = src.read(chunk_size)
+            final = not data
+            text = carry + decoder.decode(data, final)
+            carry = ''
+            if text.endswith('\r') and not final:
+                # could be the start of \r\n
+                text, carry = text[:-1], text[-1]
+            # universal newlines, as when
+            # reading the file in text mode.
+            text = text.replace('\r\n', '\n').replace('\r', '\n')
+            text, count = CONTROL_CHARACTERS.subn('', text)
+            removed += count
+            out.write(text)
+            done += len(data)
+            if progress is not None and data:
+                progress(done, total)
+            if final:
+                break
+    if removed:
+        print('Removed {0} undesirable control characters.'.format(removed))
+    return removed
+
+
 def parsexml(element_name, path=AUTOSAVE_FILE):
     """ Retrieve the root and a list of <element_name>
     elements from a given xml file.
 
     :param element_name: `str` name of <element>, e.g. "subscript"
     """
-    if not create_autosave_file():
+    if not create_autosave_file(path):
         return
 
     try:
@@ -940,6 +2071,53 @@ def parsexml(element_name, path=AUTOSAVE_FILE):
     return root, elements
 
 
+def snapshot(root):
+    """ Return a copy of the xml element and its children
+    as nested tuples, cheap enough to take on the main
+    thread, so that it can be serialized on another while
+    the tree keeps changing.
+
+    :param root: The xml element to copy.
+    :type  root: <type 'Element'>
+    """
+    return (
+        root.tag,
+        dict(root.attrib),
+        root.text,
+        root.tail,
+        [snapshot(child) for child in root],
+    )
+
+
+def snapshot_element(data):
+    """ Return a new xml element from a snapshot(). """
+    tag, attrib, text, tail, children = data
+    element = ETree.Element(tag, attrib)
+    element.text = text
+    element.tail = tail
+    for child in children:
+        element.append(snapshot_element(child))
+    return element
+
+
+def xml_data(root):
+    """ Return the xml element as utf-8
+    encoded bytes, including the header.
+
+    :param root: The xml element to convert.
+    :type  root: <type 'Element'>
+    """
+    data = ETree.tostring(root)
+    data = data.decode('utf-8')
+
+    # for neatness in the xml file.
+    data = data.replace('><subscript', '>\n<subscript')
+    data = data.replace('</subscript><', '</subscript>\n<')
+
+    data = XML_HEADER+data
+    return data.encode('utf-8', 'ignore')
+
+
 TEMP_FILE = None
 def writexml(root, path=AUTOSAVE_FILE):
     """ Attempt to write xml element
@@ -952,19 +2130,22 @@ def writexml(root, path=AUTOSAVE_FILE):
     :param path: The path to save to.
     :type  path: <type 'str'>
     """
-    data = ETree.tostring(root)
-    data = data.decode('utf-8')
+    write_file(path, xml_data(root))
 
-    # for neatness in the xml file.
-    data = data.replace('><subscript', '>\n<subscript')
-    data = data.replace('</subscript><', '</subscript>\n<')
 
+def write_file(path, data):
+    """ Replace the file at path with data.
+    If the save fails, write to a temporary
+    file instead.
+
+    :param path: `str` The path to save to.
+    :param data: `bytes` The contents of the file.
+    :return: `bool` True if path was written.
+    """
     try:
-        with io.open(
-            path, 'wt', encoding='utf8', errors='ignore'
-        ) as f:
-            f.write(XML_HEADER+data)
-    except IOError as e:
+        replace_file(path, data)
+        return True
+    except (IOError, OSError) as e:
         msg = "Couldn't write to {0}\n".format(path)
         msg += "due to the following error:\n{0}".format(e)
         print(msg)
@@ -977,43 +2158,168 @@ def writexml(root, path=AUTOSAVE_FILE):
             fd, TEMP_FILE = tempfile.mkstemp()
             TEMP_FILE += '.xml'
         print('Writing to {0}'.format(TEMP_FILE))
-        with io.open(
-            TEMP_FILE, 'wt', encoding='utf8', errors='ignore'
-        ) as f:
-            f.write(XML_HEADER+data)
+        with open(TEMP_FILE, 'wb') as f:
+            f.write(data)
+        return False
 
 
-def fix_broken_xml(path=AUTOSAVE_FILE):
+def replace_file(path, data):
+    """ Write data to a temporary file next to
+    path, flush it to disk and rename it over
+    path, so that a crash or network failure
+    mid-write can never leave path half-written.
+
+    :param path: `str` The path to save to.
+    :param data: `bytes` The contents of the file.
+    """
+    folder, name = os.path.split(path)
+    fd, temp_path = tempfile.mkstemp(
+        prefix=name+'.',
+        suffix='.tmp',
+        dir=folder or None
+    )
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        if os.path.isfile(path):
+            shutil.copymode(path, temp_path)
+        else:
+            os.chmod(temp_path, 0o644)
+        rename_over(temp_path, path)
+    except Exception:
+        if os.path.isfile(temp_path):
+            os.remove(temp_path)
+        raise
+
+
+def rename_over(src, dst):
+    """ os.replace, which python 2 lacks.
+    """
+    try:
+        os.replace(src, dst)
+    except AttributeError:
+        if os.name == 'nt' and os.path.isfile(dst):
+            os.remove(dst)
+        os.rename(src, dst)
+
+
+def blob_name(digest):
+    """ Return the file name of the blob for text
+    with the given digest, using BLOB_COMPRESSION.
+    Blobs are named after their contents, so an
+    existing blob never needs to be rewritten.
+    """
+    if BLOB_COMPRESSION == 'lzma' and lzma is not None:
+        return digest + '.xz'
+    return digest + '.zlib'
+
+
+def encode_text(text):
+    """ Return text as utf-8 bytes.
+    """
+    try:
+        return text.encode('utf-8')
+    except UnicodeEncodeError:
+        # lone surrogates can come from Qt
+        return text.encode('utf-8', 'surrogatepass')
+
+
+def compress_blob(path, text):
+    """ Return text compressed with the
+    method given by the extension of path.
+
+    :param path: `str` path to the blob file.
+    :param text: `str` text to compress.
+    :return: `bytes` compressed data.
+    """
+    data = encode_text(text)
+    if path.endswith('.xz'):
+        # higher presets are many times slower
+        # for very little gain on text.
+        return lzma.compress(data, preset=1)
+    return zlib.compress(data, 6)
+
+
+def read_blob(path):
+    """ Read and decompress the text in a blob file.
+
+    :param path: `str` path to the blob file.
+    :return: `str` text, or None if it couldn't be read.
+    """
+    try:
+        with open(path, 'rb') as f:
+            data = f.read()
+        if path.endswith('.xz'):
+            if lzma is None:
+                raise IOError('lzma is not available.')
+            data = lzma.decompress(data)
+        else:
+            data = zlib.decompress(data)
+    except Exception as e:
+        print("Couldn't read autosave blob {0}: {1}".format(path, e))
+        return None
+    try:
+        return data.decode('utf-8')
+    except UnicodeDecodeError:
+        return data.decode('utf-8', 'surrogatepass')
+
+
+def has_text(subscript):
+    """ Return True if the <subscript> element
+    has text, either inline or in a blob.
+    """
+    return bool(subscript.text) or 'blob' in subscript.attrib
+
+
+def fix_broken_xml(path=AUTOSAVE_FILE, progress=None):
     """ Removes unwanted characters and
     (in case necessary in future
     implementations..) fixes other
     parsing errors with the xml file.
-    """
-    with io.open(path, 'r', encoding='utf-8') as f:
-        content = f.read()
-
-    safe_string = remove_control_characters(content)
 
-    with open(path, 'wt') as f:
-        f.write(safe_string)
+    The sanitized file is written next to the
+    original and only replaces it once it can
+    be parsed.
 
-    xmlp = ETree.XMLParser(encoding="utf-8")
+    :param progress: callable taking (bytes read, total bytes),
+    by default progress is printed.
+    """
+    if progress is None:
+        progress = PrintProgress('Sanitizing autosave')
+    folder, name = os.path.split(path)
+    fd, temp_path = tempfile.mkstemp(
+        prefix=name+'.',
+        suffix='.tmp',
+        dir=folder or None
+    )
+    os.close(fd)
     try:
-        parser = ETree.parse(path, xmlp)
+        sanitize_file(path, temp_path, progress=progress)
+        xmlp = ETree.XMLParser(encoding="utf-8")
+        parser = ETree.parse(temp_path, xmlp)
     except ETree.ParseError:
         print('Fatal Error with xml structure. A backup of your autosave has been made.')
-        backup_autosave_file(path, content)
-        create_empty_autosave()
+        os.remove(temp_path)
+        backup_autosave_file(path)
+        create_empty_autosave(path)
         xmlp = ETree.XMLParser(encoding="utf-8")
         parser = ETree.parse(path, xmlp)
         print(parser)
+        return parser
+    except Exception:
+        os.remove(temp_path)
+        raise
+    shutil.copymode(path, temp_path)
+    rename_over(temp_path, path)
     return parser
 
 
-def backup_autosave_file(path, content):
+def backup_autosave_file(path):
     handle, temp_path = tempfile.mkstemp()
-    with open(temp_path, 'w') as f:
-        f.write(content)
+    os.close(handle)
+    shutil.copyfile(path, temp_path)
     print('A backup of %s has been saved here: %s' % (path, temp_path))
 
 
@@ -1022,19 +2328,20 @@ def remove_empty_autosaves():
     Clean autosave file of subscripts with no
     information (no text and invalid or absent path).
     """
-    root, subscripts = parsexml('subscript')
-    for s in subscripts:
-        if s.text:
+    store = get_store()
+    for s in store.subscript_elements():
+        if has_text(s):
             continue
+        uid = s.attrib.get('uuid')
         path = s.attrib.get('path')
         if path is None:
-            root.remove(s)
+            store.remove(uid)
             continue
         if not os.path.isfile(path):
-            root.remove(s)
+            store.remove(uid)
             continue
-        s.attrib['name'] = os.path.basename(path)
-    writexml(root)
+        store.update(uid, {'name': os.path.basename(path)})
+    store.compact()
 
 
 def get_element_tab_index(subscript):
@@ -15,11 +15,15 @@ class LineNumberArea(QtWidgets.QWidget):
         self.editor = editor
         self.setFont(editor.font())
         self.setParent(editor)
+        # seconds spent on each line (numbered from 1)
+        # the last time the document was profiled.
+        self.line_times = {}
         self.setupLineNumbers()
 
     def setupLineNumbers(self):
 
         self.editor.blockCountChanged.connect(self.updateLineNumberAreaWidth)
+        self.editor.blockCountChanged.connect(self.clear_line_times)
         self.editor.updateRequest.connect(self.updateLineNumberArea)
         self.editor.cursorPositionChanged.connect(self.highlightCurrentLine)
         self.editor.resize_signal.connect(self.resizeLineNo, QtCore.Qt.DirectConnection)
@@ -47,10 +51,25 @@ class LineNumberArea(QtWidgets.QWidget):
         current_block = doc.findBlock(p).blockNumber()
 
         height = self.editor.fontMetrics().height()
+        line_times = self.line_times
+        if line_times:
+            slowest = max(line_times.values()) or 1.0
+            heat = QtGui.QColor(255, 80, 0, 110)
         while block.isValid() and (top <= event.rect().bottom()):
             if not block.isVisible():
                 continue
             if block.isVisible() and (bottom >= event.rect().top()):
+                seconds = line_times.get(blockNumber + 1)
+                if seconds:
+                    # a bar as long as the line's share of the slowest.
+                    width = max(2, int(self.width()*seconds/slowest))
+                    mypainter.fillRect(
+                        0,
+                        int(top),
+                        width,
+                        height,
+                        heat
+                    )
                 number = str(blockNumber + 1)
                 colour = QtCore.Qt.darkGray
                 font = self.font()
@@ -74,6 +93,35 @@ class LineNumberArea(QtWidgets.QWidget):
             bottom = top + self.editor.blockBoundingRect(block).height()
             blockNumber += 1
 
+    def set_line_times(self, line_times):
+        """
+        Show the time spent on each line as a bar behind
+        its number, until the number of lines changes.
+
+        :param line_times: `dict` of line numbers to seconds.
+        """
+        self.line_times = dict(line_times)
+        self.update()
+
+    def clear_line_times(self, *args):
+        if self.line_times:
+            self.line_times = {}
+            self.update()
+
+    def event(self, event):
+        if event.type() == QtCore.QEvent.ToolTip and self.line_times:
+            point = QtCore.QPoint(0, event.pos().y())
+            cursor = self.editor.cursorForPosition(point)
+            lineno = cursor.blockNumber() + 1
+            seconds = self.line_times.get(lineno)
+            if seconds:
+                text = 'line {0}: {1:.4f}s'.format(lineno, seconds)
+                QtWidgets.QToolTip.showText(event.globalPos(), text, self)
+            else:
+                QtWidgets.QToolTip.hideText()
+            return True
+        return super(LineNumberArea, self).event(event)
+
     def lineNumberAreaWidth(self):
         digits = 1
         count = max(1, self.editor.blockCount())
@@ -0,0 +1,155 @@
+import re
+
+from PythonEditor.ui.Qt import QtGui
+from PythonEditor.ui.Qt import QtCore
+from PythonEditor.ui.Qt import QtWidgets
+from PythonEditor.ui.features import syntaxhighlighter
+
+
+# marks the extra selections made by the
+# OccurrenceHighlighter, so that the ones
+# made by other features can be kept.
+OCCURRENCE = QtGui.QTextFormat.UserProperty + 1
+
+# only whole words of two or more characters are highlighted.
+WORD = re.compile(r'\w\w+$', re.UNICODE)
+
+
+class OccurrenceHighlighter(QtCore.QObject):
+    """
+    Highlights other occurences of the selected
+    word in the visible part of the editor, using
+    extra selections so that the document's syntax
+    highlighting is left untouched.
+    """
+    def __init__(self, editor):
+        super(OccurrenceHighlighter, self).__init__(editor)
+        self.setObjectName('OccurrenceHighlighter')
+        self.editor = editor
+        self.word = ''
+        self.pattern = None
+        self.selections = []
+        self.connect_signals()
+
+    def connect_signals(self):
+        editor = self.editor
+        # the editor will emit a "selection stopped"
+        # signal after the selection has stopped
+        # changing for a certain time period.
+        editor.selection_stopped.connect(self.highlight_same_words)
+        editor.verticalScrollBar().valueChanged.connect(
+            self.find_occurrences
+        )
+        editor.resize_signal.connect(self.find_occurrences)
+        # the current line highlight replaces
+        # all extra selections when the cursor moves.
+        editor.cursorPositionChanged.connect(self.restore_selections)
+
+    def highlight_same_words(self):
+        """
+        When the selection has changed, if the
+        selection is a single word, highlight the
+        other occurences of that word.
+        """
+        cursor = self.editor.textCursor()
+        word = ''
+        if cursor.hasSelection():
+            text = cursor.selectedText()
+            if WORD.match(text):
+                word = text
+
+        if not (word or self.word):
+            return
+        self.word = word
+        if word:
+            self.pattern = re.compile(
+                r'(?<!\w)' + re.escape(word) + r'(?!\w)',
+                re.UNICODE
+            )
+        else:
+            self.pattern = None
+        self.find_occurrences()
+
+    def visible_blocks(self):
+        """
+        Yield the blocks in the editor's viewport.
+        """
+        editor = self.editor
+        bottom = editor.viewport().rect().bottom()
+        offset = editor.contentOffset()
+        block = editor.firstVisibleBlock()
+        while block.isValid():
+            top = editor.blockBoundingGeometry(block).translated(offset).top()
+            if top > bottom:
+                break
+            if block.isVisible():
+                yield block
+            block = block.next()
+
+    def find_occurrences(self, *args):
+        """
+        Find the occurences of the word in the
+        visible blocks and set them as extra selections.
+        """
+        selections = []
+        if self.pattern is not None:
+            document = self.editor.document()
+            text_format = self.selection_format()
+            for block in self.visible_blocks():
+                position = block.position()
+                for match in self.pattern.finditer(block.text()):
+                    cursor = QtGui.QTextCursor(document)
+                    cursor.setPosition(position+match.start())
+                    cursor.setPosition(
+                        position+match.end(),
+                        QtGui.QTextCursor.KeepAnchor
+                    )
+                    selection = QtWidgets.QTextEdit.ExtraSelection()
+                    selection.cursor = cursor
+                    selection.format = text_format
+                    selections.append(selection)
+
+        if not (selections or self.selections):
+            return
+        self.selections = selections
+        self.set_selections()
+
+    def selection_format(self):
+        """
+        Return the format for occurences, from the
+        syntax highlighter's theme if there is one.
+        """
+        theme = syntaxhighlighter.themes['Monokai']
+        highlighter = self.editor.document().findChild(
+            QtGui.QSyntaxHighlighter,
+            'Highlight'
+        )
+        if highlighter is not None:
+            theme = highlighter.theme
+        rgb, style = theme['selected_word']
+
+        text_format = QtGui.QTextCharFormat()
+        text_format.setForeground(QtCore.Qt.white)
+        text_format.setBackground(QtGui.QColor(*rgb))
+        text_format.setProperty(OCCURRENCE, True)
+        return text_format
+
+    def restore_selections(self):
+        """
+        Add the occurences back after other
+        features have replaced the extra selections.
+        """
+        if self.selections:
+            self.set_selections()
+
+    def set_selections(self):
+        """
+        Replace the previous occurences in the
+        editor's extra selections, keeping the rest.
+        """
+        editor = self.editor
+        selections = [
+            selection for selection in editor.extraSelections()
+            if not selection.format.hasProperty(OCCURRENCE)
+        ]
+        editor.setExtraSelections(selections + self.selections)
@@ -202,8 +202,7 @@ class FindPalette(EditLine):
                 indices = indices[:current_index]+indices[current_index+1:]
                 print(indices)
             for index in indices:
-                data = self.tabs.tabData(index)
-                body = data['text']
+                body = self.tabs.tab_text(index)
                 if not body:
                     continue
                 if text in body:
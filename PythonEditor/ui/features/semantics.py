@@ -0,0 +1,322 @@
+"""
+Semantic highlighting. The editor's text is parsed with
+the ast module on a background thread once edits have
+settled, and the names it defines and uses are passed
+to the syntax highlighter as spans to format.
+"""
+import os
+import re
+import ast
+import threading
+
+from PythonEditor.ui.Qt import QtGui
+from PythonEditor.ui.Qt import QtCore
+
+
+# set to 0 to only use the syntax highlighter's lexer.
+ENABLED = os.getenv('PYTHONEDITOR_SEMANTIC_HIGHLIGHTING', '1') != '0'
+# milliseconds to wait after the last edit before parsing.
+DELAY = 500
+# longer documents are not parsed.
+MAX_LINES = 20000
+
+# the highlighter's style for each kind of name.
+STYLES = {
+    'function'  : 'function_names',
+    'class'     : 'class_names',
+    'parameter' : 'arguments',
+    'import'    : 'imports',
+}
+
+FUNCTIONS = (ast.FunctionDef, ast.Lambda)
+if hasattr(ast, 'AsyncFunctionDef'):
+    FUNCTIONS += (ast.AsyncFunctionDef,)
+
+
+def char_offset(line, offset):
+    """ Convert the utf-8 byte offset given by
+    the ast module to a character offset.
+    """
+    try:
+        data = line.encode('utf-8')
+    except UnicodeError:
+        return offset
+    if len(data) == len(line):
+        return offset
+    return len(data[:offset].decode('utf-8', 'ignore'))
+
+
+class SymbolTable(ast.NodeVisitor):
+    """ The names defined and used in a python document.
+
+    definitions, parameters, locals and imports are lists
+    of (name, line, column) tuples, with lines counted from 0.
+    spans maps line numbers to the (column, length, style)
+    spans to format on that line.
+    """
+    def __init__(self):
+        self.definitions = []
+        self.parameters = []
+        self.locals = []
+        self.imports = []
+        self.spans = {}
+        self.lines = []
+        self.scopes = []
+
+    def parse(self, text):
+        """ Parse the text, raising SyntaxError
+        if it can't be parsed.
+        """
+        tree = ast.parse(text)
+        self.lines = text.split('\n')
+        self.scopes = [{}]
+        self.visit(tree)
+        return self
+
+    def add(self, kind, name, line, column):
+        """ Record the name at the given line
+        and (character) column.
+        """
+        style = STYLES.get(kind)
+        if style is None:
+            return
+        spans = self.spans.setdefault(line, [])
+        spans.append((column, len(name), style))
+
+    def add_node(self, kind, name, node):
+        """ Record a name at the position of an ast node. """
+        line = node.lineno - 1
+        column = char_offset(self.lines[line], node.col_offset)
+        self.add(kind, name, line, column)
+        return line, column
+
+    def find(self, pattern, line, column):
+        """ Return the line and column of the first group
+        of the pattern, searching from line and column.
+        """
+        for number in range(line, len(self.lines)):
+            match = pattern.search(self.lines[number], column)
+            if match is not None:
+                return number, match.start(1)
+            column = 0
+        return None
+
+    def lookup(self, name):
+        """ Return the kind of name the name
+        refers to in the current scope, or None.
+        """
+        for scope in reversed(self.scopes):
+            if name in scope:
+                return scope[name]
+        return None
+
+    def visit_FunctionDef(self, node):
+        self.define(node, 'function', r'\bdef\s+({0})\b')
+        for decorator in node.decorator_list:
+            self.visit(decorator)
+        self.visit_arguments_defaults(node.args)
+        if getattr(node, 'returns', None) is not None:
+            self.visit(node.returns)
+        self.visit_function(node, node.body)
+
+    visit_AsyncFunctionDef = visit_FunctionDef
+
+    def visit_Lambda(self, node):
+        self.visit_arguments_defaults(node.args)
+        self.visit_function(node, [node.body])
+
+    def visit_ClassDef(self, node):
+        self.define(node, 'class', r'\bclass\s+({0})\b')
+        for child in node.decorator_list + node.bases:
+            self.visit(child)
+        for keyword in getattr(node, 'keywords', []):
+            self.visit(keyword.value)
+        self.scopes.append({})
+        for child in node.body:
+            self.visit(child)
+        self.scopes.pop()
+
+    def define(self, node, kind, pattern):
+        """ Record the name of a function or class
+        and add it to the current scope.
+        """
+        pattern = re.compile(pattern.format(re.escape(node.name)))
+        position = self.find(pattern, node.lineno-1, 0)
+        if position is not None:
+            line, column = position
+            self.definitions.append((node.name, line, column))
+            self.add(kind, node.name, line, column)
+        self.scopes[-1][node.name] = kind
+
+    def visit_arguments_defaults(self, args):
+        for default in args.defaults + getattr(args, 'kw_defaults', []):
+            if default is not None:
+                self.visit(default)
+
+    def visit_function(self, node, body):
+        """ Visit the body of a function or lambda in a
+        new scope, holding its parameters and locals.
+        """
+        scope = {}
+        args = node.args
+        params = list(getattr(args, 'posonlyargs', [])) + list(args.args)
+        params += list(getattr(args, 'kwonlyargs', []))
+        for param in (args.vararg, args.kwarg):
+            # in python 2, these are strings.
+            if param is not None and not isinstance(param, str):
+                params.append(param)
+        for param in params:
+            # python 3 arg nodes, or python 2 Name nodes.
+            name = getattr(param, 'arg', None) or getattr(param, 'id', None)
+            if name is None:
+                continue
+            line, column = self.add_node('parameter', name, param)
+            self.parameters.append((name, line, column))
+            scope[name] = 'parameter'
+            annotation = getattr(param, 'annotation', None)
+            if annotation is not None:
+                self.visit(annotation)
+
+        for name in assigned_names(body):
+            if name not in scope:
+                scope[name] = 'local'
+
+        self.scopes.append(scope)
+        for child in body:
+            self.visit(child)
+        self.scopes.pop()
+
+    def visit_Name(self, node):
+        if isinstance(node.ctx, ast.Store) and len(self.scopes) > 1:
+            if self.scopes[-1].get(node.id) == 'local':
+                line = node.lineno - 1
+                column = char_offset(self.lines[line], node.col_offset)
+                self.locals.append((node.id, line, column))
+            return
+        kind = self.lookup(node.id)
+        if kind in ('parameter', 'import'):
+            self.add_node(kind, node.id, node)
+
+    def visit_Import(self, node):
+        line = node.lineno - 1
+        position = self.find(IMPORT, line, 0)
+        if position is None:
+            return
+        line, column = position
+        for alias in node.names:
+            name = alias.asname or alias.name.split('.')[0]
+            pattern = re.compile(r'\b({0})\b'.format(re.escape(name)))
+            position = self.find(pattern, line, column)
+            if position is None:
+                continue
+            line, column = position
+            self.imports.append((name, line, column))
+            self.add('import', name, line, column)
+            self.scopes[-1][name] = 'import'
+            column += len(name)
+
+    visit_ImportFrom = visit_Import
+
+
+IMPORT = re.compile(r'\b(import)\b')
+
+
+def assigned_names(body):
+    """ Yield the names assigned to in the body of
+    a function, without looking into nested
+    functions or classes.
+    """
+    nodes = list(body)
+    while nodes:
+        node = nodes.pop()
+        if isinstance(node, FUNCTIONS + (ast.ClassDef,)):
+            if hasattr(node, 'name'):
+                yield node.name
+            continue
+        if isinstance(node, ast.Name) and isinstance(node.ctx, ast.Store):
+            yield node.id
+        nodes.extend(ast.iter_child_nodes(node))
+
+
+def semantic_spans(text):
+    """ Return a dictionary of line numbers to
+    the line's text and the spans to format on it.
+    Raises SyntaxError if the text can't be parsed.
+    """
+    table = SymbolTable().parse(text)
+    return {
+        line: (table.lines[line], spans)
+        for line, spans in table.spans.items()
+    }
+
+
+class SemanticHighlighter(QtCore.QObject):
+    """
+    Parses the editor's text on a background thread
+    once edits have settled, and passes the spans
+    found to the syntax highlighter.
+    """
+    parsed = QtCore.Signal(object)
+
+    def __init__(self, editor):
+        super(SemanticHighlighter, self).__init__(editor)
+        self.setObjectName('SemanticHighlighter')
+        self.editor = editor
+        self.digest = None
+        self.thread = None
+
+        self.timer = QtCore.QTimer(self)
+        self.timer.setSingleShot(True)
+        self.timer.setInterval(DELAY)
+        self.timer.timeout.connect(self.parse)
+        editor.text_edited_signal.connect(self.schedule)
+        self.parsed.connect(self.apply)
+
+    def schedule(self):
+        """ Parse once the text stops changing. """
+        self.timer.start()
+
+    def parse(self):
+        """ Start parsing the text on a background thread,
+        unless it hasn't changed since it was last parsed.
+        """
+        if self.thread is not None and self.thread.is_alive():
+            # try again when it's done
+            self.timer.start()
+            return
+        digest = self.editor.text_digest()
+        if digest == self.digest:
+            return
+        self.digest = digest
+        document = self.editor.document()
+        if document.blockCount() > MAX_LINES:
+            self.apply((digest, {}))
+            return
+        self.thread = threading.Thread(
+            target=self.run,
+            args=(document.toPlainText(), digest)
+        )
+        self.thread.daemon = True
+        self.thread.start()
+
+    def run(self, text, digest):
+        try:
+            spans = semantic_spans(text)
+        except (SyntaxError, ValueError, RuntimeError, MemoryError):
+            # keep the previous spans while the text is being edited.
+            return
+        self.parsed.emit((digest, spans))
+
+    def apply(self, result):
+        """ Pass the spans to the syntax highlighter
+        if the text hasn't changed since it was parsed.
+        """
+        digest, spans = result
+        if digest != self.editor.text_digest():
+            return
+        highlighter = self.editor.document().findChild(
+            QtGui.QSyntaxHighlighter,
+            'Highlight'
+        )
+        if highlighter is not None:
+            highlighter.set_semantic_spans(spans)
@@ -1,9 +1,12 @@
+import os
+import time
 import tokenize
 try:
     from StringIO import StringIO ## for Python 2
 except ImportError:
     from io import StringIO ## for Python 3
 import re
+from collections import OrderedDict
 
 from PythonEditor.ui.Qt import QtGui
 from PythonEditor.ui.Qt import QtCore
@@ -28,6 +31,7 @@ themes = {
         'instantiators': ((102, 217, 239), 'italic'),
         'exceptions': ((102, 217, 239), 'italic'),
         'methods': ((102, 217, 239), ''),
+        'imports': ((102, 217, 239), ''),
         'selected_word': ((100, 100, 100), 'bold'),
     },
     'Monokai Smooth': {
@@ -46,11 +50,225 @@ themes = {
         'instantiators': ((114, 209, 221), 'italic'),
         'exceptions': ((114, 209, 221), 'italic'),
         'methods': ((169, 220, 101), ''),
+        'imports': ((114, 209, 221), ''),
         'selected_word': ((100, 100, 100), 'bold'),
     }
 }
 
 
+# 'lexer' scans each line once. 'rules' runs the
+# original list of regular expressions over it.
+ENGINE = os.getenv('PYTHONEDITOR_HIGHLIGHTER', 'lexer')
+
+# documents longer than this are only highlighted
+# near the viewport, and the remaining blocks are
+# formatted when idle. 0 highlights everything at once.
+try:
+    LAZY_LINES = int(os.getenv(
+        'PYTHONEDITOR_LAZY_HIGHLIGHT_LINES',
+        2000
+    ))
+except ValueError:
+    LAZY_LINES = 2000
+# blocks either side of the viewport to highlight straight away.
+LAZY_MARGIN = 100
+# blocks formatted at a time, and seconds spent
+# formatting them before returning to the event loop.
+LAZY_CHUNK = 200
+LAZY_SLICE = 0.02
+
+# number of lines whose spans are kept in
+# Highlight.block_cache. 0 disables the cache.
+try:
+    CACHE_SIZE = int(os.getenv(
+        'PYTHONEDITOR_HIGHLIGHT_CACHE_SIZE',
+        50000
+    ))
+except ValueError:
+    CACHE_SIZE = 50000
+
+
+# block states for lines ending inside
+# a triple-quoted string.
+IN_TRIPLE_SINGLE = 1
+IN_TRIPLE_DOUBLE = 2
+TRIPLE_QUOTES = {
+    IN_TRIPLE_SINGLE: "'''",
+    IN_TRIPLE_DOUBLE: '"""',
+}
+TRIPLE_STATES = {
+    quote: state for state, quote in TRIPLE_QUOTES.items()
+}
+# added to the state of blocks that
+# are still waiting to be formatted.
+PENDING = 0x100
+
+TOKEN = re.compile(r"""
+    (?P<comment>\#.*)
+    |(?P<string>
+        (?P<prefix>(?<!\w)[rRbBuUfF]{1,2})?
+        (?P<quote>'{3}|"{3}|'|")
+    )
+    |(?P<number>
+        (?:0[xXoObB][0-9a-fA-F_]+
+        |[0-9][0-9_]*\.?[0-9_]*(?:[eE][+-]?[0-9]+)?
+        |\.[0-9][0-9_]*(?:[eE][+-]?[0-9]+)?
+        )[jJlL]?
+    )
+    |(?P<name>[^\W\d]\w*)
+    |(?P<operator>!=|[-+*/%=<>^|&~]+)
+    |(?P<punctuation>[()\[\]{}.,:;@])
+""", re.VERBOSE | re.UNICODE)
+
+# only what can change the state at the end of a line.
+STATE_TOKEN = re.compile(r"""
+    (?P<comment>\#)
+    |(?P<quote>'{3}|"{3}|'|")
+""", re.VERBOSE)
+
+# the rest of a single-quoted string, after its opening quote.
+STRING_END = {
+    "'": re.compile(r"[^'\\]*(?:\\.[^'\\]*)*'"),
+    '"': re.compile(r'[^"\\]*(?:\\.[^"\\]*)*"'),
+}
+
+
+class Lexer(object):
+    """ Splits a line of python into the spans to
+    highlight in a single pass, carrying the state
+    of triple-quoted strings between lines.
+
+    :param words: `dict` of names to the style
+    they should be highlighted with.
+    """
+    def __init__(self, words):
+        self.words = words
+
+    def scan(self, text, state=0):
+        """ Return the (start, length, style) spans
+        for the text, and the state to pass on
+        to the next line.
+
+        :param text: `str` a single line of text.
+        :param state: `int` the state the previous
+        line ended with.
+        """
+        spans = []
+        length = len(text)
+        pos = 0
+
+        # continue a triple-quoted string.
+        if state in TRIPLE_QUOTES:
+            end = text.find(TRIPLE_QUOTES[state])
+            if end == -1:
+                return [(0, length, 'multiline_str')], state
+            pos = end + 3
+            spans.append((0, pos, 'multiline_str'))
+
+        words = self.words
+        search = TOKEN.search
+        previous = ''
+        in_bases = False
+        while True:
+            match = search(text, pos)
+            if match is None:
+                break
+            kind = match.lastgroup
+            start = match.start()
+            pos = match.end()
+
+            if kind == 'name':
+                word = match.group()
+                following = text[pos:pos+1]
+                if previous == 'def':
+                    style = 'function_names'
+                elif previous == 'class':
+                    style = 'class_names'
+                    in_bases = following == '('
+                elif previous == '@':
+                    style = 'function_names'
+                elif in_bases and following != '=':
+                    style = 'inherited'
+                elif following == '(':
+                    if previous == '.':
+                        style = 'methods'
+                    else:
+                        style = 'function_names'
+                else:
+                    style = words.get(word)
+                if style is not None:
+                    spans.append((start, pos-start, style))
+                previous = word
+            elif kind == 'punctuation':
+                previous = match.group()
+                if previous == ')':
+                    in_bases = False
+            elif kind == 'operator':
+                spans.append((start, pos-start, 'keyword'))
+                previous = ''
+            elif kind == 'number':
+                spans.append((start, pos-start, 'numbers'))
+                previous = ''
+            elif kind == 'string':
+                quote_start = match.start('quote')
+                if quote_start != start:
+                    spans.append((start, quote_start-start, 'formatters'))
+                quote = match.group('quote')
+                if len(quote) == 3:
+                    end = text.find(quote, pos)
+                    if end == -1:
+                        spans.append(
+                            (quote_start, length-quote_start, 'multiline_str')
+                        )
+                        return spans, TRIPLE_STATES[quote]
+                    pos = end + 3
+                    style = 'multiline_str'
+                else:
+                    end = STRING_END[quote].match(text, pos)
+                    # unterminated strings run to the end of the line
+                    pos = length if end is None else end.end()
+                    style = 'string'
+                spans.append((quote_start, pos-quote_start, style))
+                previous = ''
+            elif kind == 'comment':
+                spans.append((start, length-start, 'comment'))
+                break
+
+        return spans, 0
+
+    def end_state(self, text, state=0):
+        """ Return the state the line ends with, without
+        scanning lines that can't contain the end or
+        start of a triple-quoted string.
+        """
+        pos = 0
+        if state in TRIPLE_QUOTES:
+            end = text.find(TRIPLE_QUOTES[state])
+            if end == -1:
+                return state
+            pos = end + 3
+        if '"' not in text and "'" not in text:
+            return 0
+
+        search = STATE_TOKEN.search
+        while True:
+            match = search(text, pos)
+            if match is None or match.lastgroup == 'comment':
+                return 0
+            quote = match.group()
+            pos = match.end()
+            if len(quote) == 3:
+                end = text.find(quote, pos)
+                if end == -1:
+                    return TRIPLE_STATES[quote]
+                pos = end + 3
+            else:
+                end = STRING_END[quote].match(text, pos)
+                if end is None:
+                    return 0
+                pos = end.end()
+
+
 class Highlight(QtGui.QSyntaxHighlighter):
     """ Modified, simplified version of some code
     that Wouter Gilsing found and modified when researching.
@@ -113,8 +331,26 @@ class Highlight(QtGui.QSyntaxHighlighter):
         self.editor = editor
         self.theme = themes['Monokai']
         self.set_style(self.theme)
+        self.engine = ENGINE
+        self.block_cache = OrderedDict()
+        self.cache_size = CACHE_SIZE
+        self.cache_hits = 0
+        self.cache_misses = 0
+        # line numbers to the line's text and its spans,
+        # from the SemanticHighlighter.
+        self.semantic_spans = {}
         self.make_rules()
-        self.selected_word = ''
+        self.make_lexer()
+
+        # lazy highlighting
+        self.lazy_lines = LAZY_LINES
+        self.pending_from = None
+        self.format_range = (0, -1)
+        self.window = None
+        self.idle_timer = QtCore.QTimer(self)
+        self.idle_timer.setSingleShot(True)
+        self.idle_timer.setInterval(0)
+
         self.connect_signals()
 
     def set_style(self, theme):
@@ -181,6 +417,45 @@ class Highlight(QtGui.QSyntaxHighlighter):
             for (pat, index, fmt) in rules
         ]
 
+    def make_lexer(self):
+        """ Create the Lexer used by the 'lexer' engine,
+        mapping each word list to its style.
+        """
+        words = {}
+        for names, style in (
+                (self.exceptions+self.types, 'exceptions'),
+                (self.instantiators, 'instantiators'),
+                (self.truthy, 'numbers'),
+                (self.keywords, 'keyword'),
+                (self.arguments, 'arguments'),
+            ):
+            for name in names:
+                words[name] = style
+        self.lexer = Lexer(words)
+        self.block_cache.clear()
+
+    def scan(self, text, state):
+        """ Return the lexer's spans and end state for
+        the text. Lines that have been seen before
+        following the same state (e.g. in a tab that
+        has been shown before) are taken from the
+        block_cache instead of being scanned again.
+        """
+        if not self.cache_size:
+            return self.lexer.scan(text, state)
+        key = (state, text)
+        cache = self.block_cache
+        result = cache.pop(key, None)
+        if result is None:
+            self.cache_misses += 1
+            result = self.lexer.scan(text, state)
+            if len(cache) >= self.cache_size:
+                cache.popitem(last=False)
+        else:
+            self.cache_hits += 1
+        cache[key] = result
+        return result
+
     def format(self, rgb, style=''):
         """
         Return a QtGui.QTextCharFormat
@@ -205,7 +480,188 @@ class Highlight(QtGui.QSyntaxHighlighter):
         if not block.isVisible():
             return
 
-        # apply rules
+        if self.engine == 'rules':
+            self.highlight_rules(text)
+        else:
+            number = block.blockNumber()
+            if self.is_deferred(number):
+                self.defer_block(number, text)
+                return
+            self.highlight_tokens(text)
+            self.highlight_semantics(number, text)
+
+    def previous_state(self):
+        """ Return the state of the previous
+        block, without the PENDING flag.
+        """
+        state = self.previousBlockState()
+        if state == -1:
+            return 0
+        return state & ~PENDING
+
+    def is_pending(self, block):
+        """ Return True if the block is
+        waiting to be formatted.
+        """
+        state = block.userState()
+        return state != -1 and bool(state & PENDING)
+
+    def visible_range(self):
+        """ Return the numbers of the first and last
+        blocks in the viewport, until the next
+        update request from the editor.
+        """
+        if self.window is None:
+            editor = self.editor
+            first = editor.firstVisibleBlock().blockNumber()
+            line_height = max(editor.fontMetrics().lineSpacing(), 1)
+            last = first + editor.viewport().height()//line_height
+            self.window = (first-LAZY_MARGIN, last+LAZY_MARGIN)
+        return self.window
+
+    def is_deferred(self, number):
+        """ Return True if formatting the block
+        can wait until the editor is idle.
+        """
+        if not self.lazy_lines:
+            return False
+        if self.document().blockCount() <= self.lazy_lines:
+            return False
+        start, end = self.format_range
+        if start <= number <= end:
+            return False
+        start, end = self.visible_range()
+        if start <= number <= end:
+            return False
+        return True
+
+    def defer_block(self, number, text):
+        """ Only work out the state the block ends with,
+        so that the blocks after it can be highlighted
+        correctly, and format it later.
+        """
+        state = self.previous_state()
+        cached = self.block_cache.get((state, text))
+        if cached is None:
+            state = self.lexer.end_state(text, state)
+        else:
+            state = cached[1]
+        self.setCurrentBlockState(state | PENDING)
+        if self.pending_from is None:
+            self.pending_from = number
+            self.idle_timer.start()
+        elif number < self.pending_from:
+            self.pending_from = number
+
+    def format_blocks(self, block, last):
+        """ Highlight from the block up to
+        the block numbered last, stopping
+        early at blocks already formatted.
+        """
+        # formatting makes the editor emit textChanged,
+        # which mustn't look like an edit, and an
+        # updateRequest for every block.
+        blocked = self.editor.blockSignals(True)
+        self.format_range = (block.blockNumber(), last)
+        try:
+            self.rehighlightBlock(block)
+        finally:
+            self.format_range = (0, -1)
+            self.editor.blockSignals(blocked)
+
+    @QtCore.Slot()
+    def format_pending(self):
+        """ Format deferred blocks in chunks, returning
+        to the event loop every LAZY_SLICE seconds.
+        """
+        if self.pending_from is None:
+            return
+        document = self.document()
+        block = document.findBlockByNumber(self.pending_from)
+        self.pending_from = None
+        self.idle_timer.stop()
+        deadline = time.time() + LAZY_SLICE
+        while block.isValid():
+            if not self.is_pending(block):
+                block = block.next()
+                continue
+            number = block.blockNumber()
+            if time.time() > deadline:
+                if self.pending_from is None or number < self.pending_from:
+                    self.pending_from = number
+                self.idle_timer.start()
+                return
+            self.format_blocks(block, number+LAZY_CHUNK)
+            block = document.findBlockByNumber(number+LAZY_CHUNK+1)
+
+    def format_visible(self, *args):
+        """ Format deferred blocks that
+        have been scrolled into view.
+        """
+        # the editor has scrolled or been resized.
+        self.window = None
+        if self.pending_from is None:
+            return
+        if self.format_range[1] != -1:
+            # already formatting
+            return
+        start, end = self.visible_range()
+        block = self.document().findBlockByNumber(max(start, 0))
+        while block.isValid() and block.blockNumber() <= end:
+            if self.is_pending(block):
+                self.format_blocks(block, end)
+            block = block.next()
+
+    def highlight_tokens(self, text):
+        """
+        Format the spans found by the lexer.
+        """
+        spans, state = self.scan(text, self.previous_state())
+        styles = self.styles
+        for start, length, style in spans:
+            self.setFormat(start, length, styles[style])
+        self.setCurrentBlockState(state)
+
+    def highlight_semantics(self, number, text):
+        """
+        Format the semantic spans for the line, if it
+        hasn't been changed since they were found.
+        """
+        semantic = self.semantic_spans.get(number)
+        if semantic is None:
+            return
+        line, spans = semantic
+        if line != text:
+            return
+        styles = self.styles
+        for start, length, style in spans:
+            self.setFormat(start, length, styles[style])
+
+    def set_semantic_spans(self, semantic_spans):
+        """
+        Replace the semantic spans and format
+        the lines whose spans have changed.
+        """
+        previous = self.semantic_spans
+        self.semantic_spans = semantic_spans
+        changed = set(previous) | set(semantic_spans)
+        changed = sorted(
+            number for number in changed
+            if previous.get(number) != semantic_spans.get(number)
+        )
+        document = self.document()
+        for number in changed:
+            block = document.findBlockByNumber(number)
+            if not block.isValid():
+                break
+            if self.is_pending(block):
+                continue
+            self.format_blocks(block, number)
+
+    def highlight_rules(self, text):
+        """
+        Apply each of the rules to the text.
+        """
         for expression, nth, format in self.rules:
             index = expression.indexIn(text, 0)
 
@@ -246,45 +702,6 @@ class Highlight(QtGui.QSyntaxHighlighter):
         if not in_multiline:
             in_multiline = self.match_multiline(text, *self.tri_double)
 
-        self.highlight_selected_word(text)
-
-    def highlight_selected_word(self, text):
-        """
-        Highlight other occurences of
-        the selected word in the text.
-        """
-        if not self.selected_word:
-            return
-        word = self.selected_word
-        if word not in text:
-            return
-
-        extraSelections = self.editor.extraSelections()
-        rgb, weight = self.theme['selected_word']
-        color = QtGui.QColor(*rgb)
-
-        block = self.currentBlock()
-        if not block.isVisible():
-            return
-
-        pos = block.position()
-
-        cursor = self.editor.textCursor()
-        for m in re.finditer(word, text):
-            start = m.start()+pos
-            end = m.end()+pos
-
-            selection = QtWidgets.QTextEdit.ExtraSelection()
-            cursor.setPosition(start, QtGui.QTextCursor.MoveAnchor)
-            cursor.setPosition(end, QtGui.QTextCursor.KeepAnchor)
-            selection.cursor = cursor
-
-            selection.format.setForeground(QtCore.Qt.white)
-            selection.format.setBackground(color)
-            extraSelections.append(selection)
-
-        self.editor.setExtraSelections(extraSelections)
-
     def match_multiline(self, text, delimiter, in_state, style):
         """
         Check whether highlighting requires multiple lines.
@@ -320,44 +737,5 @@ class Highlight(QtGui.QSyntaxHighlighter):
         return self.currentBlockState() == in_state
 
     def connect_signals(self):
-        # the editor will emit a "selection stopped"
-        # signal after the selection has stopped
-        # changing for a certain time period.
-        self.editor.selection_stopped.connect(
-            self.highlight_same_words
-        )
-
-    def highlight_same_words(self):
-        """When selection has changed;
-        if the selection is valid
-        and there are other similar
-        words in the text, highlight
-        those words.
-        """
-        editor = self.editor
-        cursor = editor.textCursor()
-
-        previous_selected_word = self.selected_word
-        self.selected_word = ''
-
-        if cursor.hasSelection():
-            text = cursor.selectedText()
-            if ' ' in text:
-                self.selected_word = ''
-            elif '\n' in text:
-                self.selected_word = ''
-            else:
-                words = re.findall(
-                    r'\w\w+',
-                    self.editor.toPlainText()
-                )
-                if text in words:
-                    self.selected_word = text
-
-        if not (self.selected_word or previous_selected_word):
-            return
-
-        # rehighlight the whole document, because if
-        # you try to highlight just the visible blocks as below,
-        # you'll then have to implement scrolling. this isn't that slow.
-        self.rehighlight()
+        self.idle_timer.timeout.connect(self.format_pending)
+        self.editor.updateRequest.connect(self.format_visible)
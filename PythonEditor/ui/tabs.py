@@ -4,12 +4,17 @@ and custom QWidget (TabEditor) that looks like a
 QTabWidget, the difference being that it contains
 a single Editor widget, with the text data for each
 tab being stored in its tabData.
+
+Tabs that aren't being shown may hold None in place
+of their text, in which case the text is fetched from
+the autosave store (see Tabs.tab_text).
 """
 
 import time
 import os
 import uuid
 from functools import partial
+from collections import OrderedDict
 
 from PythonEditor.ui.Qt.QtCore import (
     QSize, QEvent, QPoint, Signal,
@@ -27,11 +32,23 @@ from PythonEditor.ui.Qt.QtWidgets import (
     QVBoxLayout, QHBoxLayout, QComboBox)
 
 from PythonEditor.utils import save
+from PythonEditor.utils.digest import text_digest
 from PythonEditor.utils.debug import debug
 from PythonEditor.ui.features import autosavexml
 from PythonEditor.ui import editor
 
 
+# number of recently shown tab bodies
+# to keep in Tabs.text_cache
+try:
+    TEXT_CACHE_SIZE = int(os.getenv(
+        'PYTHONEDITOR_TAB_CACHE_SIZE',
+        16
+    ))
+except ValueError:
+    TEXT_CACHE_SIZE = 16
+
+
 TAB_STYLESHEET = """
 QTabBar::tab {
     height: 24px;
@@ -196,6 +213,15 @@ class Tabs(QTabBar):
         self.tab_pressed = False
         self.pressed_uid = ''
 
+        # uuid: (store version, text)
+        self.text_cache = OrderedDict()
+
+        # uuid: index, rebuilt after tabs are
+        # inserted, removed or moved.
+        self.uuid_index = None
+        self.layout_changes = 0
+        self.tabMoved.connect(self.invalidate_uuid_index)
+
         self.setMovable(True)
         self.setExpanding(False)
         self.setSelectionBehaviorOnRemove(QTabBar.SelectPreviousTab)
@@ -247,6 +273,52 @@ class Tabs(QTabBar):
         self.setTabData(index, data)
         self.setCurrentIndex(index)
 
+    def tabInserted(self, index):
+        super(Tabs, self).tabInserted(index)
+        self.invalidate_uuid_index()
+
+    def tabRemoved(self, index):
+        super(Tabs, self).tabRemoved(index)
+        self.invalidate_uuid_index()
+
+    def invalidate_uuid_index(self, *args):
+        """ Mark the uuid index as out of date,
+        as the position of tabs has changed.
+        """
+        self.uuid_index = None
+        self.layout_changes += 1
+
+    def setTabData(self, index, data):
+        """ Keep the uuid index up to date
+        with the data set on each tab.
+        """
+        super(Tabs, self).setTabData(index, data)
+        if self.uuid_index is None:
+            return
+        if isinstance(data, dict) and 'uuid' in data:
+            self.uuid_index[data['uuid']] = index
+
+    def index_for_uuid(self, uid):
+        """ Return the index of the tab with the
+        given uuid, or -1 if there is none.
+        """
+        if self.uuid_index is not None:
+            index = self.uuid_index.get(uid)
+            if index is None:
+                return -1
+            data = self.tabData(index)
+            if isinstance(data, dict) and data.get('uuid') == uid:
+                return index
+
+        # build (or rebuild, if the tab's
+        # uuid was changed) the index.
+        self.uuid_index = {}
+        for i in range(self.count()):
+            data = self.tabData(i)
+            if isinstance(data, dict) and 'uuid' in data:
+                self.uuid_index[data['uuid']] = i
+        return self.uuid_index.get(uid, -1)
+
     def get_current_tab_property(self, name):
         """Allow easy lookup for the current tab's data."""
         index = self.currentIndex()
@@ -287,6 +359,72 @@ class Tabs(QTabBar):
         print('Deprecated, use set_current_tab_property instead.')
         return self.set_current_tab_property(name, value)
 
+    def tab_text(self, index):
+        """ Return the text of the tab at index.
+        Tabs that aren't resident (their 'text' is None)
+        are read from the autosave store, or from their
+        path if the store has no text for them.
+        """
+        data = self.tabData(index)
+        if not isinstance(data, dict):
+            return None
+        text = data.get('text')
+        if text is not None:
+            return text
+
+        uid = data.get('uuid')
+        store = autosavexml.get_store()
+        version = store.versions.get(uid)
+        cached = self.text_cache.get(uid)
+        if cached is not None and cached[0] == version:
+            # mark as most recently used
+            del self.text_cache[uid]
+            self.text_cache[uid] = cached
+            return cached[1]
+
+        text = store.text(uid)
+        if not text:
+            path = data.get('path')
+            if path and os.path.isfile(path):
+                with open(path, 'r') as f:
+                    text = f.read()
+        if text is None:
+            text = ''
+        self.cache_text(uid, version, text)
+        return text
+
+    def cache_text(self, uid, version, text):
+        """ Remember text in the text_cache,
+        discarding the least recently used
+        entries past TEXT_CACHE_SIZE.
+        """
+        self.text_cache.pop(uid, None)
+        self.text_cache[uid] = (version, text)
+        while len(self.text_cache) > TEXT_CACHE_SIZE:
+            self.text_cache.popitem(last=False)
+
+    def release_text(self, index):
+        """ Drop the text of the tab at index from its
+        tabData, as long as the autosave store holds
+        exactly the same text. Tabs with unsaved edits
+        keep their text.
+        """
+        data = self.tabData(index)
+        if not isinstance(data, dict):
+            return
+        text = data.get('text')
+        if text is None:
+            return
+        uid = data.get('uuid')
+        store = autosavexml.get_store()
+        if store.text(uid) is None:
+            return
+        if store.digest(uid) != text_digest(text):
+            return
+        self.cache_text(uid, store.versions.get(uid), text)
+        data['text'] = None
+        self.setTabData(index, data)
+
     def tab_only_rect(self):
         """
         self.rect() without the <> buttons.
@@ -555,7 +693,7 @@ class Tabs(QTabBar):
         self.tab_renamed_signal.emit(
             data['uuid'],
             data['name'],
-            data['text'],
+            self.tab_text(index),
             str(index),
             data.get('path')
         )
@@ -584,7 +722,7 @@ class Tabs(QTabBar):
         if not isinstance(data, dict):
             return
 
-        text = data.get('text')
+        text = self.tab_text(index)
         has_text = False
         if hasattr(text, 'strip'):
             has_text = bool(text.strip())
@@ -613,6 +751,7 @@ class Tabs(QTabBar):
                     return
 
         super(Tabs, self).removeTab(index)
+        self.text_cache.pop(data['uuid'], None)
 
         self.tab_close_signal.emit(data['uuid'])
 
@@ -644,7 +783,7 @@ class Tabs(QTabBar):
         if (ret == msg_box.Save):
             data = self.tabData(index)
             path = save.save(
-                data['text'],
+                self.tab_text(index),
                 data['path']
             )
             if path is None:
@@ -692,6 +831,7 @@ class TabEditor(QWidget):
 
         self.tabs = Tabs()
         self.tab_widget_layout.addWidget(self.tabs)
+        self.active_uid = None
 
         rb = QToolButton()
         self.tab_right_button = rb
@@ -866,7 +1006,12 @@ class TabEditor(QWidget):
             # empty tab, ignore.
             return
 
-        text = data['text']
+        # only the tab being shown needs
+        # to keep its text in its tabData.
+        self.release_active_tab(data.get('uuid'))
+        self.active_uid = data.get('uuid')
+
+        text = self.tabs.tab_text(index)
 
         if text is None or not text.strip():
             path = data.get('path')
@@ -877,7 +1022,8 @@ class TabEditor(QWidget):
             else:
                 with open(path, 'r') as f:
                     text = f.read()
-                data['text'] = text
+        data['text'] = text
+        self.tabs.setTabData(index, data)
 
         # collect data before setting editor text
         cursor_pos = self.tabs.get('cursor_pos')
@@ -920,6 +1066,17 @@ class TabEditor(QWidget):
         # for the autosave check_document_modified
         self.tab_switched_signal.emit()
 
+    def release_active_tab(self, uid=None):
+        """ Let the previously shown tab drop its text,
+        unless it is also the tab with the given uid.
+        """
+        active_uid = self.active_uid
+        if active_uid is None or active_uid == uid:
+            return
+        index = self.tabs.index_for_uuid(active_uid)
+        if index != -1:
+            self.tabs.release_text(index)
+
     def store_cursor_position(self):
         editor = self.editor
         cursor = editor.textCursor()
@@ -945,19 +1102,30 @@ class TabEditor(QWidget):
         if self.tabs.count() == 0:
             self.new_tab()
 
+        text = self.editor.toPlainText()
         saved = self.tabs.get('saved')
         original_text = self.tabs.get('original_text')
         if saved and not original_text:
             # keep original text in case
             # revert is required
-            text = self.tabs.get_current_tab_property('text')
-            self.tabs.set_current_tab_property('original_text', text)
+            original_text = self.tabs.get_current_tab_property('text')
+            self.tabs.set_current_tab_property('original_text', original_text)
+            self.tabs.set_current_tab_property(
+                'original_digest', text_digest(original_text)
+            )
             self.tabs.set_current_tab_property('saved', False)
             self.tabs.repaint()
         elif original_text is not None:
-            text = self.editor.toPlainText()
-            if original_text == text:
-                self.tabs.set_current_tab_property('saved', True)
-                self.tabs.repaint()
-
-        self.tabs.set_current_tab_property('text', self.editor.toPlainText())
+            # only hash when the lengths agree
+            if len(original_text) == len(text):
+                original_digest = self.tabs.get('original_digest')
+                if original_digest is None:
+                    original_digest = text_digest(original_text)
+                    self.tabs.set_current_tab_property(
+                        'original_digest', original_digest
+                    )
+                if original_digest == self.editor.text_digest():
+                    self.tabs.set_current_tab_property('saved', True)
+                    self.tabs.repaint()
+
+        self.tabs.set_current_tab_property('text', text)
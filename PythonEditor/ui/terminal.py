@@ -2,24 +2,73 @@ from __future__ import print_function
 import os
 import re
 import sys
+import bisect
+from functools import partial
 
 from PythonEditor.core import streams
+from PythonEditor.core import background
+from PythonEditor.core.output import OutputLog
 from PythonEditor.utils.constants import DEFAULT_FONT
+from PythonEditor.utils.rotatinglog import RotatingLog
 from PythonEditor.ui.Qt.QtGui import (QFont,
+                                      QColor,
+                                      QTextCharFormat,
                                       QTextCursor,
+                                      QTextDocument,
                                       QCursor,
                                       QClipboard)
 from PythonEditor.ui.Qt.QtCore import (Qt,
                                        Signal,
                                        Slot,
                                        QTimer)
-from PythonEditor.ui.Qt.QtWidgets import QPlainTextEdit
+from PythonEditor.ui.Qt.QtWidgets import QPlainTextEdit, QLabel
 from PythonEditor.utils.debug import debug
 from PythonEditor.ui.features.actions import get_external_editor_path
 from PythonEditor.ui.features.actions import open_in_external_editor
 
 
 STARTUP = 'PYTHONEDITOR_CAPTURE_STARTUP_STREAMS'
+# output is inserted in batches, this many
+# milliseconds after the first write.
+try:
+    FLUSH_INTERVAL = int(os.getenv('PYTHONEDITOR_TERMINAL_FLUSH_INTERVAL', 30))
+except ValueError:
+    FLUSH_INTERVAL = 30
+# the most characters inserted in one batch, so
+# that a flood of output doesn't block the interface.
+try:
+    MAX_FLUSH = int(os.getenv('PYTHONEDITOR_TERMINAL_MAX_FLUSH', 200000))
+except ValueError:
+    MAX_FLUSH = 200000
+# the scrollback is trimmed from the top to at most
+# this many lines and characters. 0 means no limit.
+try:
+    MAX_LINES = int(os.getenv('PYTHONEDITOR_TERMINAL_MAX_LINES', 100000))
+except ValueError:
+    MAX_LINES = 100000
+try:
+    MAX_CHARS = int(os.getenv('PYTHONEDITOR_TERMINAL_MAX_CHARS', 10000000))
+except ValueError:
+    MAX_CHARS = 10000000
+# if set, trimmed output is written to this file, which is
+# rotated at SPILL_LOG_SIZE bytes, and can be loaded back.
+SPILL_LOG = os.getenv('PYTHONEDITOR_TERMINAL_LOG')
+SPILL_LOG_SIZE = 10*1024*1024
+# the number of lines each 'Load Older Output' adds.
+LOAD_OLDER_LINES = 1000
+# the number of executions listed in the context menu.
+MENU_EXECUTIONS = 20
+# output from threads other than the main thread is
+# shown in these colours, in the order threads first write.
+THREAD_COLOURS = (
+    (102, 217, 239),
+    (166, 226, 46),
+    (253, 151, 31),
+    (174, 129, 255),
+    (230, 219, 116),
+    (249, 38, 114),
+)
+MAIN_THREAD = 'MainThread'
 
 class Terminal(QPlainTextEdit):
     """ Output text display widget """
@@ -36,6 +85,39 @@ class Terminal(QPlainTextEdit):
         font = QFont(DEFAULT_FONT)
         font.setPointSize(10)
         self.setFont(font)
+        self.setup_running_indicator()
+
+        self.max_lines = MAX_LINES
+        self.max_chars = MAX_CHARS
+        self.spill_log = None
+        if SPILL_LOG:
+            self.spill_log = RotatingLog(SPILL_LOG, SPILL_LOG_SIZE)
+        # the number of lines at the top that were
+        # loaded back from the end of the spill log.
+        self.restored_lines = 0
+
+        # names of threads that have written output, in
+        # order, the colour index of each thread other than
+        # the main thread, and the ones whose output isn't shown.
+        self.threads = []
+        self.thread_colours = {}
+        self.hidden_threads = set()
+        self.colour_threads = True
+
+        # output as records, and the execution
+        # whose output is shown, if not all of it.
+        self.output = OutputLog()
+        self.execution_filter = None
+        self.reset_shown()
+        # off while records are shown again, as
+        # trimmed output is already in the spill log.
+        self.spilling = True
+
+        self.speaker = None
+        self.flush_timer = QTimer(self)
+        self.flush_timer.setSingleShot(True)
+        self.flush_timer.setInterval(FLUSH_INTERVAL)
+        self.flush_timer.timeout.connect(self.flush)
 
         if os.getenv(STARTUP) == '1':
             self.setup()
@@ -54,6 +136,96 @@ class Terminal(QPlainTextEdit):
             pass
         self.insertPlainText(text)
 
+    def clear(self):
+        self.clear_view()
+        self.output.clear()
+
+    def clear_view(self):
+        """ Clear the text, but not the records of it. """
+        super(Terminal, self).clear()
+        self.restored_lines = 0
+        self.reset_shown()
+
+    def reset_shown(self):
+        # the indexes of the records shown, and the line
+        # each starts on, counting lines from the first
+        # inserted. top_line is the line of the first block.
+        self.shown = []
+        self.shown_starts = []
+        self.line_count = 0
+        self.top_line = 0
+
+    def insertPlainText(self, text):
+        # with the default format, rather than
+        # that of coloured output before it.
+        cursor = self.textCursor()
+        cursor.insertText(text, QTextCharFormat())
+        self.setTextCursor(cursor)
+        self.line_count += text.count('\n')
+        self.trim()
+
+    def trim(self):
+        """
+        Remove lines from the top of the scrollback while
+        it is over max_lines or max_chars, writing them
+        to the spill log if there is one.
+        """
+        doc = self.document()
+        cut = 0
+        if self.max_lines and doc.blockCount() > self.max_lines:
+            cut = doc.blockCount() - self.max_lines
+        excess = doc.characterCount() - self.max_chars
+        if self.max_chars and excess > 0:
+            block = doc.findBlock(excess)
+            cut = max(cut, block.blockNumber() + 1)
+        if not cut:
+            return
+        cut = min(cut, doc.blockCount() - 1)
+        end = doc.findBlockByNumber(cut).position()
+
+        cursor = QTextCursor(doc)
+        cursor.setPosition(0)
+        cursor.setPosition(end, QTextCursor.KeepAnchor)
+        if self.spill_log is not None and self.spilling:
+            # restored lines are already in the log.
+            restored = min(cut, self.restored_lines)
+            self.restored_lines -= restored
+            if restored < cut:
+                lines = cursor.selection().toPlainText().splitlines(True)
+                self.spill(''.join(lines[restored:]))
+        cursor.removeSelectedText()
+
+        # forget the records that are no longer shown.
+        self.top_line += cut
+        first = bisect.bisect_right(self.shown_starts, self.top_line) - 1
+        if first > 0:
+            del self.shown[:first]
+            del self.shown_starts[:first]
+
+    def spill(self, text):
+        try:
+            self.spill_log.write(text)
+        except (IOError, OSError):
+            # keep going without the log.
+            self.spill_log = None
+
+    def load_older(self):
+        """
+        Insert the lines that were trimmed from the
+        top of the scrollback before the current ones.
+        """
+        if self.spill_log is None:
+            return
+        lines = self.spill_log.tail(LOAD_OLDER_LINES, self.restored_lines)
+        if not lines:
+            return
+        self.restored_lines += len(lines)
+        self.top_line -= len(lines)
+        cursor = QTextCursor(self.document())
+        cursor.setPosition(0)
+        cursor.insertText(''.join(lines))
+        self.moveCursor(QTextCursor.Start)
+
     def stop(self):
         for stream in sys.stdout, sys.stderr:
             if hasattr(stream, 'reset'):
@@ -64,34 +236,301 @@ class Terminal(QPlainTextEdit):
         Checks for an existing stream wrapper
         for sys.stdout and connects to it. If
         not present, creates a new one.
-        TODO:
-        The FnRedirect sys.stdout is always active.
-        With a singleton object on a thread,
-        that reads off this stream, we can make it
-        available to Python Editor even before opening
-        the panel.
-        """
-        if hasattr(sys.stdout, '_signal'):
-            self.speaker = sys.stdout._signal
+        The stream wrapper is usually created at
+        startup by nuke_menu_setup, so that output
+        from before the panel opened is shown.
+        """
+        self.connect_speaker(streams.capture())
+
+    def connect_speaker(self, speaker):
+        """
+        Insert the text written to the speaker's streams
+        in batches, instead of once per write.
+        """
+        self.speaker = speaker
+        if not hasattr(speaker, 'read'):
+            # a Speaker from before the module was reloaded.
+            speaker.emitter.connect(self.receive)
+            return
+        speaker.ready.connect(self.schedule_flush)
+        if hasattr(speaker, 'attach'):
+            speaker.attach()
+        if speaker.pending() or getattr(speaker, 'dropped', 0):
+            # output captured before the terminal
+            # existed, in a single insert.
+            self.insert_chunks(speaker.read())
+
+    def schedule_flush(self):
+        if not self.flush_timer.isActive():
+            self.flush_timer.start()
+
+    def flush(self):
+        """
+        Insert the text buffered since the last
+        flush, in the order it was written.
+        """
+        if self.speaker is None:
+            return
+        chunks = self.speaker.read(MAX_FLUSH)
+        if chunks:
+            self.insert_chunks(chunks)
+        if self.speaker.pending():
+            self.flush_timer.start()
+
+    def insert_chunks(self, chunks):
+        """
+        Add streams.Chunks of output to the records,
+        and show them.
+        """
+        first = self.output.add(chunks)
+        self.render(self.output.items(first))
+
+    def render(self, items):
+        """
+        Insert (index, record) pairs of output, leaving out
+        those from hidden threads or other executions than
+        the execution_filter, and colouring those from
+        threads other than the main thread.
+        """
+        runs = []
+        line = self.line_count
+        execution = self.execution_filter
+        colours = self.thread_colours
+        for index, record in items:
+            thread = record.thread
+            if thread not in colours:
+                self.add_thread(thread)
+            if thread in self.hidden_threads:
+                continue
+            if execution is not None and record.execution != execution:
+                continue
+            self.shown.append(index)
+            self.shown_starts.append(line)
+            line += record.text.count('\n')
+            if not self.colour_threads:
+                thread = MAIN_THREAD
+            if runs and runs[-1][0] == thread:
+                runs[-1][1].append(record.text)
+            else:
+                runs.append((thread, [record.text]))
+
+        if len(runs) == 1 and runs[0][0] == MAIN_THREAD:
+            # the usual case, in a single insert.
+            self.receive(''.join(runs[0][1]))
+            return
+        if not runs:
+            return
+
+        self.moveCursor(QTextCursor.End)
+        cursor = self.textCursor()
+        cursor.beginEditBlock()
+        for thread, texts in runs:
+            cursor.insertText(''.join(texts), self.thread_format(thread))
+        cursor.endEditBlock()
+        self.setTextCursor(cursor)
+        self.line_count = line
+        self.trim()
+
+    def record_at(self, block_number):
+        """
+        Return the index of the record shown on
+        the block, and the block's line within the
+        record's text, or (None, None).
+        """
+        line = block_number + self.top_line
+        position = bisect.bisect_right(self.shown_starts, line) - 1
+        if position < 0:
+            return None, None
+        index = self.shown[position]
+        record = self.output.get(index)
+        offset = line - self.shown_starts[position]
+        if record is None or offset > record.text.count('\n'):
+            # text inserted without a record.
+            return None, None
+        return index, offset
+
+    def block_of(self, index):
+        """
+        Return the number of the block the
+        record with the index starts on, or
+        None if it isn't shown.
+        """
+        position = bisect.bisect_left(self.shown, index)
+        if position == len(self.shown) or self.shown[position] != index:
+            return None
+        block_number = self.shown_starts[position] - self.top_line
+        if block_number < 0:
+            return None
+        return block_number
+
+    def frame_at(self, block_number):
+        """
+        Return the path:lineno of the traceback
+        frame on the block, from its record.
+        """
+        index, offset = self.record_at(block_number)
+        if index is None:
+            return None
+        for line, path, lineno in self.output.frames_of(index):
+            if line == offset:
+                return '{0}:{1}'.format(path, lineno)
+        return None
+
+    def goto_last_traceback(self):
+        """ Scroll to the start of the last traceback. """
+        index = self.output.last_traceback()
+        if index is None:
+            return
+        block_number = self.block_of(index)
+        if block_number is None:
+            return
+        block = self.document().findBlockByNumber(block_number)
+        self.setTextCursor(QTextCursor(block))
+        self.centerCursor()
+
+    def show_execution(self, execution=None):
+        """
+        Show only the output of the execution with the
+        number (see execute.EXECUTION), or all output.
+        """
+        self.execution_filter = execution
+        self.rerender()
+
+    def rerender(self):
+        """
+        Show the records again, after the threads or
+        execution they are filtered by have changed.
+        """
+        self.clear_view()
+        self.spilling = False
+        try:
+            self.render(self.output.items())
+        finally:
+            self.spilling = True
+
+    def add_thread(self, thread):
+        self.threads.append(thread)
+        index = len(self.thread_colours) - (MAIN_THREAD in self.thread_colours)
+        self.thread_colours[thread] = index % len(THREAD_COLOURS)
+
+    def thread_format(self, thread):
+        text_format = QTextCharFormat()
+        if thread != MAIN_THREAD:
+            index = self.thread_colours[thread]
+            text_format.setForeground(QColor(*THREAD_COLOURS[index]))
+        return text_format
+
+    def toggle_thread(self, thread):
+        """ Show or hide output from the thread. """
+        if thread in self.hidden_threads:
+            self.hidden_threads.discard(thread)
         else:
-            self.speaker = streams.Speaker()
-            sys.stdout = streams.SESysStdOut(sys.stdout, self.speaker)
-            sys.stderr = streams.SESysStdErr(sys.stderr, self.speaker)
+            self.hidden_threads.add(thread)
+        self.rerender()
+
+    def toggle_thread_colours(self):
+        self.colour_threads = not self.colour_threads
+        self.rerender()
+
+    def setup_running_indicator(self):
+        """
+        Show a label in the corner of the terminal
+        while a script is running in the background.
+        """
+        self.running_label = QLabel(self)
+        self.running_label.setObjectName('RunningIndicator')
+        self.running_label.setStyleSheet(
+            'background: rgba(40, 40, 40, 200);'
+            'color: rgb(230, 219, 116);'
+            'padding: 2px 6px;'
+        )
+        self.running_label.hide()
+        self.running_timer = QTimer(self)
+        self.running_timer.setInterval(500)
+        self.running_timer.timeout.connect(self.update_running_indicator)
 
-        self.speaker.emitter.connect(self.receive)
+        runner = background.runner()
+        runner.started.connect(self.show_running_indicator)
+        runner.finished.connect(self.hide_running_indicator)
+        if runner.is_running():
+            self.show_running_indicator()
+
+    def show_running_indicator(self):
+        self.update_running_indicator()
+        self.running_label.show()
+        self.running_timer.start()
+
+    def hide_running_indicator(self, *args):
+        self.running_timer.stop()
+        self.running_label.hide()
+
+    def update_running_indicator(self):
+        seconds = background.runner().elapsed()
+        label = self.running_label
+        label.setText('Running... {0:.0f}s'.format(seconds))
+        label.adjustSize()
+        x = self.viewport().width() - label.width() - 4
+        label.move(max(x, 0), 4)
 
     def contextMenuEvent(self, event):
         menu = self.createStandardContextMenu()
-        path_in_line = self.path_in_line(
-            self.line_from_event(event)
-        )
+        block_number = self.cursorForPosition(event.pos()).blockNumber()
+        path_in_line = self.frame_at(block_number)
+        if path_in_line is None:
+            # text that isn't from a record.
+            path_in_line = self.path_in_line(
+                self.line_from_event(event)
+            )
         if path_in_line:
             def _goto():
                 goto(path_in_line)
             menu.addAction('Goto {0}'.format(path_in_line), _goto)
         menu.addAction('Parse Last Traceback', self.parse_last_traceback)
+        if self.output.last_traceback() is not None:
+            menu.addAction('Go To Last Traceback', self.goto_last_traceback)
+        if len(self.output.executions) > 1 or self.execution_filter is not None:
+            self.add_execution_menu(menu)
+        if self.spill_log is not None:
+            menu.addAction('Load Older Output', self.load_older)
+        if len(self.threads) > 1:
+            colours = menu.addAction(
+                'Colour Output By Thread',
+                self.toggle_thread_colours
+            )
+            colours.setCheckable(True)
+            colours.setChecked(self.colour_threads)
+            threads = menu.addMenu('Show Output From')
+            for thread in self.threads:
+                action = threads.addAction(
+                    thread,
+                    partial(self.toggle_thread, thread)
+                )
+                action.setCheckable(True)
+                action.setChecked(thread not in self.hidden_threads)
+        if background.runner().is_running():
+            menu.addAction(
+                'Cancel Execution',
+                background.runner().cancel
+            )
         menu.exec_(QCursor().pos())
 
+    def add_execution_menu(self, menu):
+        executions = menu.addMenu('Show Output From Execution')
+        action = executions.addAction('All Executions', self.show_execution)
+        action.setCheckable(True)
+        action.setChecked(self.execution_filter is None)
+        for execution in list(self.output.executions)[-MENU_EXECUTIONS:]:
+            if execution:
+                name = 'Execution {0}'.format(execution)
+            else:
+                name = 'Outside Executions'
+            action = executions.addAction(
+                name,
+                partial(self.show_execution, execution)
+            )
+            action.setCheckable(True)
+            action.setChecked(self.execution_filter == execution)
+
     def line_from_event(self, event):
         pos = event.pos()
         cursor = self.cursorForPosition(pos)
@@ -113,7 +552,30 @@ class Terminal(QPlainTextEdit):
         return None
 
     def parse_last_traceback(self):
-        tb = self.toPlainText().split('Traceback')[-1]
+        index = self.output.last_traceback()
+        if index is not None:
+            # from the frames parsed when it was written.
+            text = ''
+            for path, lineno in self.output.traceback_frames(index):
+                if path.startswith('<'):
+                    # not a file, such as the editor's contents.
+                    continue
+                text += 'sublime {0}:{1}\n'.format(path, lineno)
+            print(text)
+            QClipboard().setText(text)
+            return
+
+        # search back from the end rather
+        # than splitting the whole scrollback.
+        doc = self.document()
+        end = QTextCursor(doc)
+        end.movePosition(QTextCursor.End)
+        found = doc.find('Traceback', end, QTextDocument.FindBackward)
+        if found.isNull():
+            tb = self.toPlainText()
+        else:
+            found.movePosition(QTextCursor.End, QTextCursor.KeepAnchor)
+            tb = found.selection().toPlainText()
         pattern = re.compile(r'(File ")([\w\.\/]+)(", line )(\d+)')
         text = ''
         for _, fp, _, lineno in re.findall(pattern, tb):
@@ -0,0 +1,25 @@
+""" Content digests used to compare editor, tab and
+autosave text without comparing whole strings.
+"""
+import hashlib
+
+from PythonEditor import six
+
+
+def text_digest(text):
+    """ Return a hex digest of the given text.
+    None is treated as an empty string so that
+    missing text and empty text compare equal.
+
+    :param text: `str` or `bytes`
+    :return: `str` hex digest
+    """
+    if text is None:
+        text = ''
+    if isinstance(text, six.text_type):
+        try:
+            text = text.encode('utf-8')
+        except UnicodeEncodeError:
+            # lone surrogates can come from Qt
+            text = text.encode('utf-8', 'surrogatepass')
+    return hashlib.sha1(text).hexdigest()
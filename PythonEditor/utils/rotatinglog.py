@@ -0,0 +1,75 @@
+""" A text log on disk that rotates to numbered backups
+(log.1, log.2, ...) when it grows past a size, used to keep
+output that no longer fits in the Terminal's scrollback.
+"""
+import io
+import os
+
+
+class RotatingLog(object):
+    """
+    :param path: `str` path of the current log file.
+    :param max_bytes: `int` size after which the log is rotated.
+    :param backups: `int` number of rotated files to keep.
+    """
+    def __init__(self, path, max_bytes=10*1024*1024, backups=3):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backups = backups
+
+    def paths(self):
+        """ Return the log's files, newest first. """
+        paths = [self.path]
+        for index in range(1, self.backups+1):
+            paths.append('{0}.{1}'.format(self.path, index))
+        return paths
+
+    def write(self, text):
+        """ Append text to the log, rotating it first
+        if it has grown past max_bytes.
+        """
+        if not text:
+            return
+        folder = os.path.dirname(self.path)
+        if folder and not os.path.isdir(folder):
+            os.makedirs(folder)
+        try:
+            size = os.path.getsize(self.path)
+        except OSError:
+            size = 0
+        if size and size + len(text) > self.max_bytes:
+            self.rotate()
+        with io.open(self.path, 'a', encoding='utf-8') as f:
+            f.write(text)
+
+    def rotate(self):
+        paths = self.paths()
+        if os.path.isfile(paths[-1]):
+            os.remove(paths[-1])
+        for index in range(len(paths)-1, 0, -1):
+            if os.path.isfile(paths[index-1]):
+                os.rename(paths[index-1], paths[index])
+
+    def tail(self, count, skip=0):
+        """ Return up to count lines that came before the
+        last skip lines of the log, oldest first.
+        """
+        wanted = count + skip
+        lines = []
+        for path in self.paths():
+            if len(lines) >= wanted:
+                break
+            try:
+                with io.open(path, 'r', encoding='utf-8') as f:
+                    lines = f.read().splitlines(True) + lines
+            except (IOError, OSError):
+                break
+        end = len(lines) - skip
+        if end <= 0:
+            return []
+        return lines[max(0, end-count):end]
+
+    def clear(self):
+        for path in self.paths():
+            if os.path.isfile(path):
+                os.remove(path)
@@ -102,7 +102,7 @@ def save_tab(folder, name, tabs, tab_index):
     path = os.path.join(folder, file)
     data['path'] = path
     tabs.setTabData(tab_index, data)
-    save(data['text'], path)
+    save(tabs.tab_text(tab_index), path)
     return path
 
 
@@ -153,11 +153,10 @@ def export_all_tabs_to_external_editor(tabs):
     folder = os.path.dirname(path)
 
     for i in range(tabs.count()):
-        data = tabs.tabData(i)
         name = tabs.tabText(i)
         filename = name.split('.')[0] + '.py'
         path = os.path.join(folder, filename)
-        text = data['text']
+        text = tabs.tab_text(i)
         if not text:
             print('No text found for tab %s, it will not be saved' % name)
             continue
@@ -0,0 +1,239 @@
+"""
+Headless benchmarks for the autosave.
+
+A synthetic history of N tabs of M KB each (a fraction of
+which only point to files on disk) is written to a temporary
+PythonEditorHistory.xml, and the main AutoSaveManager
+operations are timed against it. Results are printed (or
+written) as JSON.
+
+Usage (from the repository root):
+    QT_QPA_PLATFORM=offscreen python -m tests.benchmarks.autosave \
+        --tabs 200 --size 16 --output autosave.json
+
+With --compare, timings are checked against the results
+of a previous run and the exit code is 1 if any of them
+are more than --threshold times slower.
+"""
+from __future__ import print_function
+
+import os
+import sys
+import json
+import shutil
+import argparse
+import platform
+import tempfile
+
+from tests.benchmarks.common import timed, compare
+
+
+LINE = 'node_{0} = nuke.createNode("Blur", "size {0}")  # {1}\n'
+
+
+def synthetic_text(index, size):
+    """ Return about size bytes of python-ish text. """
+    lines = []
+    length = 0
+    i = 0
+    while length < size:
+        line = LINE.format(i, index)
+        lines.append(line)
+        length += len(line)
+        i += 1
+    return ''.join(lines)
+
+
+def write_history(autosavexml, folder, tabs, size, paths):
+    """ Write a history of tabs subscripts, with every
+    tab whose index is a multiple of 1/paths pointing
+    to a file instead of holding text.
+    """
+    ETree = autosavexml.ETree
+    root = ETree.Element('script')
+    step = int(round(1.0/paths)) if paths else 0
+    for i in range(tabs):
+        attrib = {
+            'uuid'      : 'tab-{0}'.format(i),
+            'name'      : 'Tab {0}'.format(i),
+            'tab_index' : str(i),
+        }
+        sub = ETree.SubElement(root, 'subscript', attrib)
+        text = synthetic_text(i, size)
+        if step and i % step == 0:
+            path = os.path.join(folder, 'tab_{0}.py'.format(i))
+            with open(path, 'w') as f:
+                f.write(text)
+            sub.attrib['path'] = path
+        else:
+            sub.text = text
+    element = ETree.SubElement(root, 'current_index')
+    element.text = '0'
+    autosavexml.writexml(root, autosavexml.AUTOSAVE_FILE)
+
+
+def run(tabs=100, size=16, paths=0.25, repeat=5):
+    """ Run the benchmarks and return a dictionary of results.
+    Expects PYTHONEDITOR_AUTOSAVE_FILE to have been set
+    before PythonEditor was imported.
+    """
+    from PythonEditor.ui.Qt import QtWidgets
+    from PythonEditor.ui.features import autosavexml
+    from PythonEditor.ui import tabs as tabs_module
+
+    app = QtWidgets.QApplication.instance()
+    if app is None:
+        app = QtWidgets.QApplication(sys.argv)
+
+    folder = os.path.dirname(autosavexml.AUTOSAVE_FILE)
+    write_history(autosavexml, folder, tabs, size*1024, paths)
+    results = {}
+
+    def load():
+        autosavexml.AutoSaveStore(autosavexml.AUTOSAVE_FILE)
+    timed(results, 'load', load, repeat)
+
+    state = {}
+    def new_manager():
+        tabeditor = tabs_module.TabEditor()
+        state['tabeditor'] = tabeditor
+        state['manager'] = autosavexml.AutoSaveManager(tabeditor)
+    timed(results, 'readautosave', new_manager, repeat)
+
+    manager = state['manager']
+    tab_bar = manager.tabs
+    store = manager.store
+
+    def save_all():
+        for i in range(tab_bar.count()):
+            data = tab_bar.tabData(i)
+            manager.save_by_uuid(
+                data['uuid'],
+                data['name'],
+                synthetic_text(i, size*1024) + '# edit\n',
+                str(i),
+                data.get('path')
+            )
+    timed(results, 'save_by_uuid', save_all, repeat)
+    results['save_by_uuid']['calls'] = tab_bar.count()
+    timed(results, 'flush', store.writer.flush, 1)
+
+    def shift_indices():
+        for uid, sub in store.subscripts.items():
+            index = int(sub.attrib.get('tab_index', 0))
+            sub.attrib['tab_index'] = str(index+1)
+        # as if the tabs had been moved.
+        tab_bar.invalidate_uuid_index()
+    timed(
+        results,
+        'sync_tab_indices',
+        manager.sync_tab_indices,
+        repeat,
+        setup=shift_indices
+    )
+
+    # time the usual case, where the
+    # current tab matches the autosave.
+    uid = tab_bar.get_current_tab_property('uuid')
+    manager.editor.setPlainText(store.text(uid))
+    timed(
+        results,
+        'check_autosave_modified',
+        manager.check_autosave_modified,
+        repeat
+    )
+    timed(results, 'remove_empty', manager.remove_empty, repeat)
+
+    def compact():
+        store.compact()
+        store.writer.flush()
+    timed(results, 'compact', compact, repeat)
+
+    broken_path = os.path.join(folder, 'broken.xml')
+    def copy_broken():
+        shutil.copyfile(autosavexml.AUTOSAVE_FILE, broken_path)
+    timed(
+        results,
+        'fix_broken_xml',
+        lambda: autosavexml.fix_broken_xml(broken_path),
+        repeat,
+        setup=copy_broken
+    )
+
+    from PythonEditor.ui.Qt import __binding__, __qt_version__
+    return {
+        'python'  : platform.python_version(),
+        'binding' : __binding__,
+        'qt'      : __qt_version__,
+        'params'  : {
+            'tabs'   : tabs,
+            'size'   : size,
+            'paths'  : paths,
+            'repeat' : repeat,
+        },
+        'results' : results,
+        'stats'   : store.stats(),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Benchmark the PythonEditor autosave.'
+    )
+    parser.add_argument('--tabs', type=int, default=100,
+                        help='number of tabs in the history.')
+    parser.add_argument('--size', type=int, default=16,
+                        help='size of each tab in KB.')
+    parser.add_argument('--paths', type=float, default=0.25,
+                        help='fraction of tabs backed by a file.')
+    parser.add_argument('--repeat', type=int, default=5,
+                        help='number of times to run each benchmark.')
+    parser.add_argument('--output',
+                        help='write the results to this json file.')
+    parser.add_argument('--compare',
+                        help='json file of results to compare against.')
+    parser.add_argument('--threshold', type=float, default=1.5,
+                        help='allowed slowdown when comparing.')
+    args = parser.parse_args(argv)
+
+    folder = tempfile.mkdtemp(prefix='pythoneditor_benchmark_')
+    os.environ['PYTHONEDITOR_AUTOSAVE_FILE'] = os.path.join(
+        folder, 'PythonEditorHistory.xml'
+    )
+    if 'PythonEditor.ui.features.autosavexml' in sys.modules:
+        raise RuntimeError(
+            'The autosave must be benchmarked in a new process.'
+        )
+
+    try:
+        report = run(
+            tabs=args.tabs,
+            size=args.size,
+            paths=args.paths,
+            repeat=args.repeat,
+        )
+    finally:
+        from PythonEditor.ui.features import autosavexml
+        autosavexml.flush_stores()
+        shutil.rmtree(folder, ignore_errors=True)
+
+    data = json.dumps(report, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(data)
+    else:
+        print(data)
+
+    if args.compare:
+        with open(args.compare, 'r') as f:
+            baseline = json.load(f)
+        regressions = compare(report, baseline, args.threshold)
+        for message in regressions:
+            print('Slower than baseline:', message)
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
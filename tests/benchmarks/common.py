@@ -0,0 +1,39 @@
+""" Helpers shared by the benchmarks. """
+from timeit import default_timer
+
+
+def timed(results, name, func, repeat, setup=None):
+    """ Call func repeat times and store the min,
+    mean and max durations (in seconds) in results.
+    """
+    times = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        start = default_timer()
+        func()
+        times.append(default_timer() - start)
+    results[name] = {
+        'min'  : min(times),
+        'mean' : sum(times)/len(times),
+        'max'  : max(times),
+        'runs' : len(times),
+    }
+
+
+def compare(report, baseline, threshold):
+    """ Return a list of messages for results that are
+    more than threshold times slower than the baseline.
+    """
+    regressions = []
+    for name, result in baseline.get('results', {}).items():
+        current = report['results'].get(name)
+        if current is None:
+            continue
+        if current['min'] > result['min']*threshold:
+            regressions.append(
+                '{0}: {1:.4f}s (baseline {2:.4f}s)'.format(
+                    name, current['min'], result['min']
+                )
+            )
+    return regressions
@@ -0,0 +1,200 @@
+"""
+Headless benchmarks for the syntax highlighter.
+
+The package's own source files are repeated up to the
+requested number of lines, and highlighted with both the
+'rules' engine (one regular expression per keyword and
+operator) and the single-pass 'lexer' engine, and with the
+lexer only highlighting near the viewport until idle
+('lazy'). cached_set_text shows the same text again, as when
+switching back to a tab, with the lexer's results cached.
+Results are printed (or written) as JSON.
+
+Usage (from the repository root):
+    QT_QPA_PLATFORM=offscreen python -m tests.benchmarks.highlight \
+        --lines 10000 --output highlight.json
+
+With --compare, timings are checked against the results
+of a previous run and the exit code is 1 if any of them
+are more than --threshold times slower.
+"""
+from __future__ import print_function
+
+import os
+import sys
+import json
+import argparse
+import platform
+
+from tests.benchmarks.common import timed, compare
+
+
+FOLDER = os.path.dirname(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+)
+ENGINES = ('rules', 'lexer')
+
+
+def source_text(lines):
+    """ Return about the given number of lines
+    of python, taken from the package itself.
+    """
+    package = os.path.join(FOLDER, 'PythonEditor')
+    sources = []
+    for folder, _, files in sorted(os.walk(package)):
+        for name in sorted(files):
+            if not name.endswith('.py'):
+                continue
+            with open(os.path.join(folder, name), 'r') as f:
+                sources.extend(f.read().splitlines())
+    text = []
+    while len(text) < lines:
+        text.extend(sources[:lines-len(text)])
+    return '\n'.join(text)
+
+
+def run(lines=10000, repeat=3):
+    """ Run the benchmarks and return a dictionary of results.
+    """
+    from PythonEditor.ui.Qt import QtWidgets
+    from PythonEditor.ui import editor as editor_module
+    from PythonEditor.ui.features import syntaxhighlighter
+
+    app = QtWidgets.QApplication.instance()
+    if app is None:
+        app = QtWidgets.QApplication(sys.argv)
+
+    text = source_text(lines)
+    editor = editor_module.Editor(init_features=False)
+    results = {}
+
+    # the lexer on its own, without Qt.
+    highlighter = syntaxhighlighter.Highlight(editor.document(), editor)
+    scan = highlighter.lexer.scan
+    split_lines = text.splitlines()
+    def scan_all():
+        state = 0
+        for line in split_lines:
+            spans, state = scan(line, state)
+    timed(results, 'lexer_scan', scan_all, repeat)
+
+    def clear():
+        editor.clear()
+        highlighter.block_cache.clear()
+    def set_text():
+        editor.setPlainText(text)
+
+    for engine in ENGINES:
+        highlighter.engine = engine
+        highlighter.lazy_lines = 0
+        timed(
+            results,
+            '{0}_set_text'.format(engine),
+            set_text,
+            repeat,
+            setup=clear
+        )
+        timed(
+            results,
+            '{0}_rehighlight'.format(engine),
+            highlighter.rehighlight,
+            repeat,
+            setup=highlighter.block_cache.clear
+        )
+
+    # the cache is left from the last run.
+    timed(
+        results,
+        'cached_set_text',
+        set_text,
+        repeat,
+        setup=editor.clear
+    )
+
+    # the blocks outside the viewport are
+    # left for format_pending to finish.
+    highlighter.engine = 'lexer'
+    highlighter.lazy_lines = 1
+    timed(
+        results,
+        'lazy_set_text',
+        set_text,
+        repeat,
+        setup=clear
+    )
+    def finish():
+        while highlighter.pending_from is not None:
+            highlighter.format_pending()
+    def set_text_lazily():
+        clear()
+        set_text()
+    timed(
+        results,
+        'lazy_finish',
+        finish,
+        repeat,
+        setup=set_text_lazily
+    )
+
+    speedup = {}
+    for name in ('set_text', 'rehighlight'):
+        rules = results['rules_{0}'.format(name)]['min']
+        lexer = results['lexer_{0}'.format(name)]['min']
+        speedup[name] = rules/lexer if lexer else None
+    rules = results['rules_set_text']['min']
+    for name in ('lazy_set_text', 'cached_set_text'):
+        seconds = results[name]['min']
+        speedup[name] = rules/seconds if seconds else None
+
+    from PythonEditor.ui.Qt import __binding__, __qt_version__
+    return {
+        'python'  : platform.python_version(),
+        'binding' : __binding__,
+        'qt'      : __qt_version__,
+        'params'  : {
+            'lines'  : lines,
+            'repeat' : repeat,
+        },
+        'results' : results,
+        'speedup' : speedup,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Benchmark the PythonEditor syntax highlighter.'
+    )
+    parser.add_argument('--lines', type=int, default=10000,
+                        help='number of lines to highlight.')
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='number of times to run each benchmark.')
+    parser.add_argument('--output',
+                        help='write the results to this json file.')
+    parser.add_argument('--compare',
+                        help='json file of results to compare against.')
+    parser.add_argument('--threshold', type=float, default=1.5,
+                        help='allowed slowdown when comparing.')
+    args = parser.parse_args(argv)
+
+    report = run(lines=args.lines, repeat=args.repeat)
+
+    data = json.dumps(report, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(data)
+    else:
+        print(data)
+
+    if args.compare:
+        with open(args.compare, 'r') as f:
+            baseline = json.load(f)
+        regressions = compare(report, baseline, args.threshold)
+        for message in regressions:
+            print('Slower than baseline:', message)
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
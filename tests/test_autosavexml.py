@@ -6,6 +6,7 @@ import pytest
 from xml.etree import cElementTree, ElementTree
 
 from PythonEditor.ui.features import autosavexml
+from PythonEditor.utils.digest import text_digest
 
 @pytest.fixture
 def setup_and_teardown_autosave_file():
@@ -120,3 +121,351 @@ def test_parsexml(setup_and_teardown_autosave_file):
         "update_tab_index
         "handle_document_save"
 """
+
+
+# --- AutoSaveStore: incremental journal on top of the xml
+
+@pytest.fixture
+def store_path(tmp_path):
+    path = str(tmp_path / 'PythonEditorHistory.xml')
+    autosavexml.create_empty_autosave(path)
+    return path
+
+
+def test_store_journals_single_subscript(store_path):
+    """Test that updates are appended to the journal and the xml is untouched."""
+    with open(store_path, 'r') as fd:
+        original_xml = fd.read()
+
+    store = autosavexml.AutoSaveStore(store_path)
+    store.update('a', {'name': 'Tab 1', 'tab_index': '0'}, text='print(1)')
+    store.update('b', {'name': 'Tab 2', 'tab_index': '1'}, text='print(2)')
+    store.update('a', {'tab_index': '1'})
+    store.remove('b')
+    store.writer.flush()
+
+    with open(store_path, 'r') as fd:
+        assert fd.read() == original_xml
+    assert os.path.isfile(store_path + autosavexml.JOURNAL_SUFFIX)
+
+    # a fresh store replays the journal on top of the xml.
+    new_store = autosavexml.AutoSaveStore(store_path)
+    assert list(new_store.subscripts.keys()) == ['a']
+    subscript = new_store.subscripts['a']
+    assert subscript.text == 'print(1)'
+    assert subscript.attrib['name'] == 'Tab 1'
+    assert subscript.attrib['tab_index'] == '1'
+
+
+def test_store_compact(store_path):
+    """Test that compacting writes the xml and empties the journal."""
+    store = autosavexml.AutoSaveStore(store_path)
+    store.update('a', {'name': 'Tab 1'}, text='x = 1')
+    store.set_element('current_index', '0')
+    store.compact()
+    store.writer.flush()
+
+    assert not os.path.isfile(store_path + autosavexml.JOURNAL_SUFFIX)
+    root, elements = autosavexml.parsexml('subscript', path=store_path)
+    assert [e.text for e in elements] == ['x = 1']
+    assert root.find('current_index').text == '0'
+
+
+def test_store_ignores_incomplete_record(store_path):
+    """Test that a record cut short by a crash is skipped on load."""
+    store = autosavexml.AutoSaveStore(store_path)
+    store.update('a', {'name': 'Tab 1'}, text='x = 1')
+    store.writer.flush()
+    with open(store.journal_path, 'ab') as fd:
+        fd.write(b'{"op": "update", "uuid": "a", "te')
+
+    new_store = autosavexml.AutoSaveStore(store_path)
+    assert new_store.subscripts['a'].text == 'x = 1'
+
+
+def test_store_export_import(store_path, tmp_path):
+    """Test that the store contents round trip through a standalone xml file."""
+    store = autosavexml.AutoSaveStore(store_path)
+    store.update('a', {'name': 'Tab 1'}, text='x = 1')
+    export_path = str(tmp_path / 'export.xml')
+    store.export_xml(export_path)
+
+    other_path = str(tmp_path / 'other.xml')
+    autosavexml.create_empty_autosave(other_path)
+    other_store = autosavexml.AutoSaveStore(other_path)
+    assert other_store.import_xml(export_path) == ['a']
+    assert other_store.subscripts['a'].text == 'x = 1'
+
+
+def test_writer_coalesces_records(store_path):
+    """Test that queued updates to the same subscript become one record."""
+    store = autosavexml.AutoSaveStore(store_path)
+    writer = store.writer
+    # hold the lock so the writer thread can't take the records yet.
+    with writer.condition:
+        store.update('a', {'name': 'Tab 1', 'tab_index': '0'}, text='x = 1')
+        store.update('a', {'tab_index': '1'}, text='x = 2')
+        store.set_element('current_index', '0')
+        store.set_element('current_index', '1')
+        assert writer.queue_depth() == 2
+    writer.flush()
+
+    with open(store.journal_path, 'rb') as fd:
+        lines = fd.read().splitlines()
+    assert len(lines) == 2
+    assert store.stats()['coalesced'] == 2
+
+    new_store = autosavexml.AutoSaveStore(store_path)
+    subscript = new_store.subscripts['a']
+    assert subscript.text == 'x = 2'
+    assert subscript.attrib['name'] == 'Tab 1'
+    assert subscript.attrib['tab_index'] == '1'
+    assert new_store.element_text('current_index') == '1'
+
+
+def test_replace_file_is_atomic(tmp_path):
+    """Test that replace_file leaves no temporary files behind."""
+    path = str(tmp_path / 'file.xml')
+    autosavexml.replace_file(path, b'first')
+    autosavexml.replace_file(path, b'second')
+    with open(path, 'rb') as fd:
+        assert fd.read() == b'second'
+    assert os.listdir(str(tmp_path)) == ['file.xml']
+
+
+def test_store_refresh_uses_cache(store_path):
+    """Test that the store is only reparsed when another instance writes."""
+    store = autosavexml.AutoSaveStore(store_path)
+    store.update('a', {'name': 'Tab 1'}, text='x = 1')
+    store.writer.flush()
+    misses = store.cache_misses
+
+    # our own writes don't invalidate the cache.
+    assert not store.refresh()
+    assert store.cache_hits == 1
+    assert store.cache_misses == misses
+
+    # another instance's writes are merged
+    # from the end of the journal.
+    other_store = autosavexml.AutoSaveStore(store_path)
+    other_store.update('a', {'name': 'Tab 1'}, text='x = 2')
+    other_store.writer.flush()
+    assert store.refresh()
+    assert store.cache_misses == misses
+    assert store.merges == 1
+    assert store.subscripts['a'].text == 'x = 2'
+    assert 'a' in store.changed_by_others
+
+    # the store's own records aren't reported as changes.
+    store.changed_by_others.clear()
+    store.update('b', {'name': 'Tab 2'}, text='y = 1')
+    other_store.update('a', {'name': 'Tab 1'}, text='x = 3')
+    other_store.writer.flush()
+    assert store.refresh()
+    assert store.changed_by_others == {'a'}
+    assert store.subscripts['a'].text == 'x = 3'
+    store.writer.flush()
+    assert other_store.refresh()
+    assert other_store.subscripts['b'].text == 'y = 1'
+    assert 'a' not in other_store.changed_by_others
+
+
+def test_store_refresh_interleaved_writes(store_path):
+    """Test that merging keeps the order records were written in."""
+    store = autosavexml.AutoSaveStore(store_path)
+    other_store = autosavexml.AutoSaveStore(store_path)
+    store.update('a', {'name': 'Tab 1'}, text='v1')
+    store.writer.flush()
+    assert other_store.refresh()
+
+    # the other instance writes, then this one writes newer text.
+    other_store.update('a', {'name': 'Tab 1'}, text='v2')
+    other_store.writer.flush()
+    store.update('a', {'name': 'Tab 1'}, text='v3')
+    store.writer.flush()
+    assert store.refresh()
+    assert store.subscripts['a'].text == 'v3'
+    assert 'a' not in store.changed_by_others
+
+    # compacting keeps the newest text.
+    store.compact()
+    store.writer.flush()
+    reloaded = autosavexml.AutoSaveStore(store_path)
+    assert reloaded.subscripts['a'].text == 'v3'
+    assert other_store.refresh()
+    assert other_store.subscripts['a'].text == 'v3'
+    assert 'a' in other_store.changed_by_others
+
+
+def test_store_refresh_does_not_wait_for_writes(store_path):
+    """Test that refresh keeps our queued writes without flushing them."""
+    store = autosavexml.AutoSaveStore(store_path)
+    other_store = autosavexml.AutoSaveStore(store_path)
+    other_store.update('a', {'name': 'Tab 1'}, text='v1')
+    other_store.writer.flush()
+
+    # holding the writer's lock keeps it from writing.
+    with store.writer.condition:
+        store.update('a', {'name': 'Tab 1'}, text='v2')
+        assert store.refresh()
+        assert store.subscripts['a'].text == 'v2'
+        assert 'a' not in store.changed_by_others
+        assert store.writer.pending_records()
+    store.writer.flush()
+    assert other_store.refresh()
+    assert other_store.subscripts['a'].text == 'v2'
+
+
+def test_store_compaction_in_background(store_path):
+    """Test that compaction snapshots the tree and writes it later."""
+    store = autosavexml.AutoSaveStore(store_path)
+    store.update('a', {'name': 'Tab 1'}, text='v1')
+    store.writer.flush()
+
+    # holding the writer's lock keeps it from writing.
+    with store.writer.condition:
+        store.compact()
+        store.update('a', {'name': 'Tab 1'}, text='v2')
+        assert os.path.isfile(store.journal_path)
+        assert store.subscripts['a'].text == 'v2'
+    store.writer.flush()
+    assert store.writer.conflicts == 0
+    reloaded = autosavexml.AutoSaveStore(store_path)
+    assert reloaded.subscripts['a'].text == 'v2'
+
+
+def test_store_compaction_keeps_other_writes(store_path):
+    """Test that compacting doesn't lose another instance's writes."""
+    store = autosavexml.AutoSaveStore(store_path)
+    other_store = autosavexml.AutoSaveStore(store_path)
+    store.update('a', {'name': 'Tab 1'}, text='x = 1')
+    store.writer.flush()
+
+    # written after store last read the files,
+    # so its compaction must not go ahead.
+    other_store.update('b', {'name': 'Tab 2'}, text='y = 1')
+    other_store.writer.flush()
+    store.writer.replace(autosavexml.snapshot(store.root))
+    store.writer.flush()
+    assert store.writer.conflicts == 1
+
+    # compact() catches up first.
+    store.compact()
+    store.writer.flush()
+    assert store.writer.conflicts == 1
+    assert not os.path.isfile(store.journal_path)
+    reloaded = autosavexml.AutoSaveStore(store_path)
+    assert reloaded.subscripts['a'].text == 'x = 1'
+    assert reloaded.subscripts['b'].text == 'y = 1'
+
+    # the other instance notices the compaction.
+    assert other_store.refresh()
+    assert other_store.subscripts['a'].text == 'x = 1'
+
+
+def test_store_digest_follows_text(store_path):
+    """Test that subscript digests are updated with their text."""
+    store = autosavexml.AutoSaveStore(store_path)
+    assert store.digest('a') is None
+    store.update('a', {'name': 'Tab 1'}, text='x = 1')
+    assert store.digest('a') == text_digest('x = 1')
+    store.update('a', {'tab_index': '0'})
+    assert store.digest('a') == text_digest('x = 1')
+    store.update('a', {'name': 'Tab 1'}, text='x = 2')
+    assert store.digest('a') == text_digest('x = 2')
+    store.remove('a')
+    assert store.digest('a') is None
+
+
+def test_store_versions_change_with_text(store_path):
+    """Test that subscript versions only change when the text might."""
+    store = autosavexml.AutoSaveStore(store_path)
+    store.update('a', {'name': 'Tab 1'}, text='x = 1')
+    version = store.versions['a']
+    assert store.text('a') == 'x = 1'
+
+    store.update('a', {'tab_index': '0'})
+    assert store.versions['a'] == version
+
+    store.update('a', {'name': 'Tab 1'}, text='x = 2')
+    assert store.versions['a'] > version
+
+    # versions are not reused after a reload.
+    version = store.versions['a']
+    store.load()
+    assert store.versions['a'] > version
+    assert store.text('a') == 'x = 2'
+
+
+def test_store_spills_large_text(store_path, monkeypatch):
+    """Test that large texts are kept in compressed blobs."""
+    monkeypatch.setattr(autosavexml, 'BLOB_EXPIRY', 0)
+    store = autosavexml.AutoSaveStore(store_path)
+    store.spill_size = 100
+    text = 'print("large")\n' * 100
+    store.update('a', {'name': 'Tab 1'}, text=text)
+    store.update('b', {'name': 'Tab 2'}, text='x = 1')
+    assert store.text('a') == text
+    assert store.digest('a') == text_digest(text)
+    store.writer.flush()
+
+    with open(store.journal_path, 'r') as fd:
+        assert 'large' not in fd.read()
+    blobs = os.listdir(store.blob_path)
+    assert len(blobs) == 1
+    assert store.stats()['bytes_written'] < len(text)
+
+    new_store = autosavexml.AutoSaveStore(store_path)
+    assert new_store.text('a') == text
+    assert new_store.text('b') == 'x = 1'
+
+    # exported files include the text of blobs.
+    export_path = store_path + '.export.xml'
+    store.export_xml(export_path)
+    with open(export_path, 'r') as fd:
+        assert 'large' in fd.read()
+
+    # once the text is small again, the blob
+    # is removed on compaction.
+    store.update('a', {'name': 'Tab 1'}, text='x = 2')
+    assert store.text('a') == 'x = 2'
+    store.compact()
+    store.writer.flush()
+    assert os.listdir(store.blob_path) == []
+    new_store = autosavexml.AutoSaveStore(store_path)
+    assert new_store.text('a') == 'x = 2'
+
+
+def test_sanitize_file_in_chunks(tmp_path):
+    """Test that control characters are removed across chunk boundaries."""
+    path = str(tmp_path / 'broken.xml')
+    dst = str(tmp_path / 'fixed.xml')
+    text = u'<script>\r\n<subscript>a\x00b\x1bcé\r\n\x7f</subscript>\r</script>'
+    with open(path, 'wb') as fd:
+        fd.write(text.encode('utf-8'))
+
+    calls = []
+    removed = autosavexml.sanitize_file(
+        path, dst,
+        progress=lambda done, total: calls.append((done, total)),
+        chunk_size=3
+    )
+    assert removed == 3
+    with open(dst, 'rb') as fd:
+        fixed = fd.read().decode('utf-8')
+    assert fixed == u'<script>\n<subscript>abcé\n</subscript>\n</script>'
+    assert calls[-1] == (len(text.encode('utf-8')),)*2
+    assert fixed == autosavexml.sanitize(
+        text.replace(u'\r\n', u'\n').replace(u'\r', u'\n')
+    )
+
+
+def test_fix_broken_xml_streams(tmp_path):
+    """Test that fix_broken_xml repairs a file with control characters."""
+    path = str(tmp_path / 'broken.xml')
+    with open(path, 'wb') as fd:
+        fd.write(b'<script><subscript uuid="a">x\x01 = 1</subscript></script>')
+    autosavexml.fix_broken_xml(path, progress=lambda done, total: None)
+    root, elements = autosavexml.parsexml('subscript', path=path)
+    assert elements[0].text == 'x = 1'
+    assert os.listdir(str(tmp_path)) == ['broken.xml']
@@ -0,0 +1,51 @@
+# tests that the benchmarks still run.
+
+import os
+import sys
+import json
+import subprocess
+
+FOLDER = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_autosave_benchmark(tmp_path):
+    """Run the autosave benchmark on a tiny history in a new process."""
+    output = str(tmp_path / 'autosave.json')
+    env = os.environ.copy()
+    env.setdefault('QT_QPA_PLATFORM', 'offscreen')
+    subprocess.check_call([
+        sys.executable, '-m', 'tests.benchmarks.autosave',
+        '--tabs', '8', '--size', '1', '--repeat', '1',
+        '--output', output,
+    ], cwd=FOLDER, env=env)
+    with open(output, 'r') as fd:
+        report = json.load(fd)
+    results = report['results']
+    for name in (
+            'readautosave',
+            'save_by_uuid',
+            'sync_tab_indices',
+            'check_autosave_modified',
+            'remove_empty',
+            'fix_broken_xml',
+        ):
+        assert results[name]['runs'] == 1
+    assert report['stats']['subscripts'] == 8
+
+
+def test_highlight_benchmark(tmp_path):
+    """Run the highlighter benchmark on a few lines in a new process."""
+    output = str(tmp_path / 'highlight.json')
+    env = os.environ.copy()
+    env.setdefault('QT_QPA_PLATFORM', 'offscreen')
+    subprocess.check_call([
+        sys.executable, '-m', 'tests.benchmarks.highlight',
+        '--lines', '200', '--repeat', '1',
+        '--output', output,
+    ], cwd=FOLDER, env=env)
+    with open(output, 'r') as fd:
+        report = json.load(fd)
+    results = report['results']
+    for engine in ('rules', 'lexer'):
+        for name in ('set_text', 'rehighlight'):
+            assert results['{0}_{1}'.format(engine, name)]['runs'] == 1
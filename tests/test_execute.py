@@ -0,0 +1,46 @@
+import sys
+import traceback
+
+from PythonEditor.core import execute
+
+
+def error_line(code):
+    """ Return the line number an exception
+    raised by running the code reports.
+    """
+    try:
+        exec(code, {})
+    except ZeroDivisionError:
+        return traceback.extract_tb(sys.exc_info()[2])[-1][1]
+
+
+def test_code_cache():
+    cache = execute.CodeCache(size=2)
+    text = '\n'*3 + 'x = 1/0'
+    code = cache.compile(text, 'exec')
+    assert cache.compile(text, 'exec') is code
+    assert cache.stats()['hits'] == 1
+    assert cache.stats()['misses'] == 1
+    assert error_line(code) == 4
+
+    # the line offset and mode are part of the key.
+    assert cache.compile(text[1:], 'exec') is not code
+    assert cache.compile(text, 'single') is not code
+    assert cache.stats()['entries'] == 2
+    # the least recently used code was dropped.
+    assert cache.compile(text, 'exec') is not code
+    assert cache.stats()['misses'] == 4
+
+
+def test_line_offset(capsys):
+    code = execute.compile_code('x = 1\ny = 1/0', 'exec', line_offset=500)
+    assert error_line(code) == 502
+
+    whole_text = '\n' + '\n'.join('# {0}'.format(i) for i in range(600))
+    errors = execute.mainexec('x = 1\ny = 1/0', whole_text, line_offset=500)
+    assert errors == [502]
+    errors = execute.mainexec('x = (', whole_text, line_offset=500)
+    assert errors == [501]
+    out = capsys.readouterr().out
+    assert '# 501' in out
+    assert 'execute.py' not in out
@@ -0,0 +1,40 @@
+from collections import namedtuple
+
+from PythonEditor.core import output
+
+
+Chunk = namedtuple('Chunk', 'sequence time thread stream text execution')
+
+
+def chunks(texts, execution):
+    return [
+        Chunk(i, 0.0, 'MainThread', 'stdout', text, execution)
+        for i, text in enumerate(texts)
+    ]
+
+
+def test_output_log():
+    log = output.OutputLog(max_records=10)
+    log.add(chunks(['# Result: \n', 'hello\n'], 1))
+    first = log.add(chunks([
+        'Traceback (most recent call last):\n',
+        '  File "/a/b.py", line 3, in f\n    g()\n'
+        '  File "/a/c.py", line 7, in g\n',
+        'ValueError\n',
+    ], 2))
+    assert first == 2
+    assert log.execution(2) == [2, 3, 4]
+    assert log.last_traceback() == 2
+    assert log.frames_of(3) == ((0, '/a/b.py', 3), (2, '/a/c.py', 7))
+    assert log.traceback_frames(2) == [('/a/b.py', 3), ('/a/c.py', 7)]
+
+    # the oldest records are dropped, keeping their indexes.
+    log.add(chunks(['{0}\n'.format(i) for i in range(7)], 3))
+    assert len(log) == 10
+    assert log.start == 2
+    assert log.get(0) is None
+    assert log.get(2).execution == 2
+    assert 1 not in log.executions
+    log.add(chunks(['x\n', 'y\n'], 3))
+    assert log.last_traceback() is None
+    assert log.execution(3)[0] == 5
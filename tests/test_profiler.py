@@ -0,0 +1,30 @@
+from PythonEditor.core import profiler
+
+
+CODE = '''
+def slow(n):
+    total = 0
+    for i in range(n):
+        total += i*i
+    return total
+
+for i in range(3):
+    slow(100000)
+'''
+
+
+def test_profile_exec():
+    result = profiler.profile_exec(CODE, '\n'+CODE, line_offset=10)
+    assert result.errors is None
+    functions = dict(
+        (row['function'], row) for row in result.rows
+    )
+    # functions defined in the document have its line numbers.
+    assert functions['slow']['line'] == 12
+    assert functions['slow']['calls'] == 3
+    # the code that compiles and runs it is left out.
+    assert 'mainexec' not in functions
+    # the loop is the slowest line.
+    slowest = max(result.line_times, key=result.line_times.get)
+    assert slowest in (14, 15, 19)
+    assert 'slow (line 12)' in result.report()
@@ -0,0 +1,76 @@
+import time
+import threading
+
+from pytestqt import qtbot
+from PythonEditor.core import background
+from PythonEditor.ui import terminal
+
+
+def test_background_execution(qtbot):
+    runner = background.Runner()
+    errors = []
+    with qtbot.waitSignal(runner.finished, timeout=5000) as blocker:
+        runner.execute('x = 1\n1/0\n', '\nx = 1\n1/0\n', callback=errors.append)
+    assert blocker.args == [[2]]
+    assert errors == [[2]]
+    assert not runner.is_running()
+
+
+def test_cancel_execution(qtbot):
+    runner = background.Runner()
+    term = terminal.Terminal()
+    qtbot.addWidget(term)
+    runner.started.connect(term.show_running_indicator)
+    runner.finished.connect(term.hide_running_indicator)
+
+    code = 'import time\nwhile True:\n    time.sleep(0.01)\n'
+    runner.execute(code, '\n'+code)
+    assert runner.is_running()
+    assert not term.running_label.isHidden()
+    time.sleep(0.1)
+    with qtbot.waitSignal(runner.finished, timeout=5000):
+        assert runner.cancel()
+    assert not runner.is_running()
+    assert term.running_label.isHidden()
+
+
+def test_cancel_after_execution(qtbot):
+    runner = background.Runner()
+    done = runner.done
+    cancelled = []
+
+    class LateCancel(object):
+        # cancels after the code has returned,
+        # just before done is emitted.
+        def emit(self, error_line_numbers):
+            cancelled.append(runner.cancel())
+            for _ in range(10000):
+                pass
+            done.emit(error_line_numbers)
+
+    runner.done = LateCancel()
+    with qtbot.waitSignal(runner.finished, timeout=5000):
+        runner.execute('x = 1\n', '\nx = 1\n')
+    assert cancelled == [False]
+    assert not runner.is_running()
+
+    # later executions aren't refused.
+    runner.done = done
+    with qtbot.waitSignal(runner.finished, timeout=5000):
+        assert runner.execute('x = 2\n', '\nx = 2\n')
+
+
+def test_run_in_main_thread(qtbot):
+    runner = background.Runner()
+    code = (
+        'import threading\n'
+        'from PythonEditor.core.background import run_in_main_thread\n'
+        '_background_result = (threading.current_thread().name, '
+        'run_in_main_thread(lambda: threading.current_thread().name))\n'
+    )
+    with qtbot.waitSignal(runner.finished, timeout=5000):
+        runner.execute(code, '\n'+code)
+    import __main__
+    worker, main = __main__.__dict__.pop('_background_result')
+    assert worker == 'PythonEditorExecution'
+    assert main == threading.main_thread().name
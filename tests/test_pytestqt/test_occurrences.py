@@ -0,0 +1,35 @@
+from pytestqt import qtbot
+from PythonEditor.ui import editor
+from PythonEditor.ui.features import occurrences
+
+
+def occurrence_texts(ed):
+    return [
+        s.cursor.selectedText() for s in ed.extraSelections()
+        if s.format.hasProperty(occurrences.OCCURRENCE)
+    ]
+
+
+def test_highlight_same_words(qtbot):
+    ed = editor.Editor(handle_shortcuts=False)
+    qtbot.addWidget(ed)
+    ed.setPlainText('node = 1\nnodes = node + 1\nprint(node)\n')
+
+    cursor = ed.textCursor()
+    cursor.setPosition(0)
+    cursor.setPosition(4, cursor.KeepAnchor)
+    ed.setTextCursor(cursor)
+    ed.occurrences.highlight_same_words()
+    # whole words only.
+    assert occurrence_texts(ed) == ['node', 'node', 'node']
+
+    # kept when the current line highlight
+    # replaces the extra selections.
+    cursor.clearSelection()
+    ed.setTextCursor(cursor)
+    assert len(occurrence_texts(ed)) == 3
+    assert len(ed.extraSelections()) == 4
+
+    ed.occurrences.highlight_same_words()
+    assert occurrence_texts(ed) == []
+    assert len(ed.extraSelections()) == 1
@@ -0,0 +1,58 @@
+from pytestqt import qtbot
+from PythonEditor.core import pool
+
+
+def test_subprocess_execution(qtbot, capsys):
+    workers = pool.WorkerPool(size=2)
+    try:
+        code = 'print("hello")\nx = 1\n1/0\n'
+        with qtbot.waitSignal(workers.finished, timeout=10000) as blocker:
+            workers.submit(code, '\n'+code)
+        job = blocker.args[0]
+        # same line numbers as in the main interpreter.
+        assert job['errors'] == [3]
+        out = capsys.readouterr()
+        assert 'hello' in out.out
+        assert 'ZeroDivisionError' in out.out
+
+        # workers are reused, and run jobs in parallel.
+        process = workers.workers[0].process
+        finished = []
+        workers.finished.connect(finished.append)
+        for i in range(3):
+            workers.submit('import time\ntime.sleep(0.2)\n', '')
+        assert len(workers.workers) == 2
+        assert workers.busy() == 3
+        qtbot.waitUntil(lambda: len(finished) == 3, timeout=10000)
+        assert workers.workers[0].process is process
+
+        # a crashing job only takes its worker down.
+        with qtbot.waitSignal(workers.finished, timeout=10000):
+            workers.submit('import os\nos._exit(3)\n', '')
+        with qtbot.waitSignal(workers.finished, timeout=10000) as blocker:
+            workers.submit('x = 1', '\nx = 1')
+        assert blocker.args[0]['errors'] is None
+    finally:
+        workers.stop()
+
+
+def test_find_python(monkeypatch, tmp_path, capsys):
+    # inside a host application, the python next to it is used.
+    host = tmp_path / 'Nuke13.2'
+    python = tmp_path / 'python'
+    host.write_text(u'')
+    python.write_text(u'')
+    monkeypatch.delenv('PYTHONEDITOR_SUBPROCESS_PYTHON', raising=False)
+    monkeypatch.setattr(pool.sys, 'executable', str(host))
+    monkeypatch.setattr(pool.sys, '_base_executable', str(host), raising=False)
+    monkeypatch.setattr(pool.sys, 'platform', 'linux')
+    monkeypatch.setenv('PATH', '')
+    assert pool.find_python() == str(python)
+
+    # without one, no workers are started.
+    python.unlink()
+    assert pool.find_python() is None
+    workers = pool.WorkerPool(executable=None)
+    assert workers.submit('x = 1', '\nx = 1') is None
+    assert workers.workers == []
+    assert 'PYTHONEDITOR_SUBPROCESS_PYTHON' in capsys.readouterr().out
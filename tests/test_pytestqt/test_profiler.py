@@ -0,0 +1,31 @@
+from pytestqt import qtbot
+from PythonEditor.ui import editor
+from PythonEditor.ui.features import actions
+
+
+def test_exec_with_profiler(qtbot):
+    ed = editor.Editor(handle_shortcuts=False)
+    qtbot.addWidget(ed)
+    ed.setPlainText(
+        'import time\n'
+        'def wait():\n'
+        '    time.sleep(0.05)\n'
+        'wait()\n'
+    )
+    act = actions.Actions(editor=ed)
+    act.exec_with_profiler()
+
+    table = act.hotspots
+    qtbot.addWidget(table)
+    area = ed.findChild(actions.QtWidgets.QWidget, 'LineNumberArea')
+    assert area.line_times.get(3, 0) > 0.01
+
+    rows = [table.topLevelItem(i) for i in range(table.topLevelItemCount())]
+    item = [row for row in rows if row.text(0) == 'wait'][0]
+    assert item.text(1) == 'line 2'
+    table.goto_item(item)
+    assert ed.textCursor().blockNumber() == 1
+
+    # line numbers change, so the times are cleared.
+    ed.appendPlainText('\n')
+    assert area.line_times == {}
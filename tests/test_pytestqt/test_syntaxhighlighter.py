@@ -0,0 +1,80 @@
+from pytestqt import qtbot
+from PythonEditor.ui import editor
+from PythonEditor.ui.features import syntaxhighlighter
+from PythonEditor.ui.Qt import QtGui
+
+
+def test_lazy_highlighting(qtbot):
+    ed = editor.Editor(init_features=False)
+    qtbot.addWidget(ed)
+    highlighter = syntaxhighlighter.Highlight(ed.document(), ed)
+    highlighter.lazy_lines = 100
+    lines = ['x = %i' % i for i in range(1000)]
+    lines[10] = 'doc = """start'
+    lines[900] = 'end"""'
+    ed.setPlainText('\n'.join(lines))
+
+    # blocks far from the viewport only know their state.
+    document = ed.document()
+    block = document.findBlockByNumber(800)
+    assert highlighter.is_pending(block)
+    IN_DOUBLE = syntaxhighlighter.IN_TRIPLE_DOUBLE
+    assert block.userState() == IN_DOUBLE | syntaxhighlighter.PENDING
+    assert not block.layout().formats()
+
+    # formatting isn't an edit.
+    ed.setTextChanged(False)
+    while highlighter.pending_from is not None:
+        highlighter.format_pending()
+
+    block = document.findBlockByNumber(800)
+    assert not highlighter.is_pending(block)
+    assert block.userState() == IN_DOUBLE
+    assert block.layout().formats()
+    block = document.findBlockByNumber(950)
+    assert block.userState() == 0
+    assert not ed._changed
+
+
+def block_formats(ed):
+    return [
+        [(r.start, r.length, r.format.foreground().color().name())
+         for r in block.layout().formats()]
+        for block in
+        (ed.document().findBlockByNumber(i) for i in range(4))
+    ]
+
+
+def test_block_cache(qtbot):
+    ed = editor.Editor(init_features=False)
+    qtbot.addWidget(ed)
+    highlighter = syntaxhighlighter.Highlight(ed.document(), ed)
+    text = 'x = 1\ny = """\nx = 1\n"""\n'
+    ed.setPlainText(text)
+    # the second 'x = 1' follows a different state.
+    assert highlighter.cache_misses == 5
+    formats = block_formats(ed)
+
+    # as if switching back to a tab.
+    ed.setPlainText('')
+    hits = highlighter.cache_hits
+    ed.setPlainText(text)
+    assert highlighter.cache_misses == 5
+    assert highlighter.cache_hits >= hits + 5
+    assert formats == block_formats(ed)
+
+
+def test_semantic_highlighting(qtbot):
+    ed = editor.Editor(handle_shortcuts=False)
+    qtbot.addWidget(ed)
+    highlighter = ed.document().findChild(QtGui.QSyntaxHighlighter, 'Highlight')
+    ed.setPlainText('def run(path):\n    return path\n')
+    qtbot.waitUntil(lambda: 1 in highlighter.semantic_spans, timeout=5000)
+
+    # the parameter is formatted where it's used.
+    colour = highlighter.styles['arguments'].foreground().color().name()
+    block = ed.document().findBlockByNumber(1)
+    assert (11, 4, colour) in [
+        (r.start, r.length, r.format.foreground().color().name())
+        for r in block.layout().formats()
+    ]
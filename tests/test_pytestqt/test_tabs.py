@@ -0,0 +1,26 @@
+from pytestqt import qtbot
+from PythonEditor.ui import tabs
+
+
+def test_index_for_uuid(qtbot):
+    tab_bar = tabs.Tabs()
+    qtbot.addWidget(tab_bar)
+    for i in range(4):
+        tab_bar.new_tab(tab_data={'uuid': 'tab-%i' % i})
+    assert [tab_bar.index_for_uuid('tab-%i' % i) for i in range(4)] == [0, 1, 2, 3]
+    assert tab_bar.index_for_uuid('missing') == -1
+
+    tab_bar.moveTab(0, 3)
+    assert tab_bar.index_for_uuid('tab-0') == 3
+    assert tab_bar.index_for_uuid('tab-1') == 0
+
+    tab_bar.removeTab(0)
+    assert tab_bar.index_for_uuid('tab-1') == -1
+    assert tab_bar.index_for_uuid('tab-0') == 2
+
+    data = tab_bar.tabData(1)
+    data['uuid'] = 'renamed'
+    tab_bar.setTabData(1, data)
+    assert tab_bar.index_for_uuid('renamed') == 1
+    assert tab_bar.index_for_uuid('tab-3') == -1
+    assert tab_bar.index_for_uuid('tab-2') == 0
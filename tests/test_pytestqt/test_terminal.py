@@ -0,0 +1,186 @@
+import threading
+
+from pytestqt import qtbot
+from PythonEditor.core import streams
+from PythonEditor.ui import terminal
+
+
+def test_batched_output(qtbot, monkeypatch):
+    monkeypatch.setattr(terminal, 'MAX_FLUSH', 5000)
+    speaker = streams.Speaker()
+    term = terminal.Terminal()
+    qtbot.addWidget(term)
+    # after the terminal has connected to sys.stdout.
+    qtbot.waitUntil(lambda: term.speaker is not None)
+    term.connect_speaker(speaker)
+
+    inserts = []
+    receive = term.receive
+    def count_receive(text):
+        inserts.append(len(text))
+        receive(text)
+    monkeypatch.setattr(term, 'receive', count_receive)
+
+    expected = []
+    for i in range(2000):
+        name = 'stderr' if i % 3 == 0 else 'stdout'
+        line = '{0} {1}\n'.format(name, i)
+        speaker.write(line, name)
+        expected.append(line)
+    assert term.toPlainText() == ''
+
+    qtbot.waitUntil(lambda: not speaker.pending(), timeout=5000)
+    qtbot.waitUntil(lambda: sum(inserts) == len(''.join(expected)))
+    # in order, in a few inserts of at most about MAX_FLUSH.
+    assert term.toPlainText() == ''.join(expected)
+    assert 1 < len(inserts) < 10
+
+
+def test_bounded_scrollback(qtbot, tmp_path):
+    term = terminal.Terminal()
+    qtbot.addWidget(term)
+    term.max_lines = 100
+    term.spill_log = terminal.RotatingLog(str(tmp_path / 'terminal.log'))
+
+    term.receive(''.join('line {0}\n'.format(i) for i in range(250)))
+    assert term.document().blockCount() == 100
+    assert term.document().firstBlock().text() == 'line 151'
+    assert term.spill_log.tail(2) == ['line 149\n', 'line 150\n']
+
+    # older lines are loaded back, and aren't
+    # written to the log again when trimmed.
+    term.load_older()
+    assert term.document().firstBlock().text() == 'line 0'
+    term.receive('line 250\n')
+    assert term.document().firstBlock().text() == 'line 152'
+    assert term.spill_log.tail(3) == ['line 149\n', 'line 150\n', 'line 151\n']
+
+
+def test_thread_tagging(qtbot):
+    speaker = streams.Speaker()
+    term = terminal.Terminal()
+    qtbot.addWidget(term)
+    qtbot.waitUntil(lambda: term.speaker is not None)
+    term.connect_speaker(speaker)
+
+    def work():
+        for i in range(3):
+            speaker.write('worker {0}\n'.format(i))
+    thread = threading.Thread(target=work, name='Worker')
+    speaker.write('main 0\n')
+    thread.start()
+    thread.join()
+    speaker.write('main 1\n', 'stderr')
+
+    chunks = speaker.read()
+    assert [c.thread for c in chunks] == ['MainThread'] + ['Worker']*3 + ['MainThread']
+    assert [c.stream for c in chunks][-1] == 'stderr'
+    assert chunks == sorted(chunks, key=lambda c: c.sequence)
+    # the dead thread's empty queue is dropped.
+    assert len(speaker.queues) == 1
+
+    term.insert_chunks(chunks)
+    assert term.toPlainText() == 'main 0\nworker 0\nworker 1\nworker 2\nmain 1\n'
+    worker_block = term.document().findBlockByNumber(1)
+    main_block = term.document().findBlockByNumber(4)
+    colour = worker_block.begin().fragment().charFormat().foreground().color()
+    assert colour.getRgb()[:3] == terminal.THREAD_COLOURS[0]
+    main_format = main_block.begin().fragment().charFormat()
+    assert not main_format.hasProperty(main_format.ForegroundBrush)
+
+    # output already shown is filtered and coloured again.
+    term.toggle_thread('Worker')
+    assert term.toPlainText() == 'main 0\nmain 1\n'
+    term.toggle_thread('Worker')
+    term.toggle_thread_colours()
+    assert term.toPlainText() == 'main 0\nworker 0\nworker 1\nworker 2\nmain 1\n'
+    worker_block = term.document().findBlockByNumber(1)
+    worker_format = worker_block.begin().fragment().charFormat()
+    assert not worker_format.hasProperty(worker_format.ForegroundBrush)
+
+    term.clear()
+    term.toggle_thread('Worker')
+    term.insert_chunks(chunks)
+    assert term.toPlainText() == 'main 0\nmain 1\n'
+
+
+def test_startup_capture(qtbot):
+    # output written before any terminal exists is kept,
+    # up to max_chunks per thread, dropping the oldest.
+    speaker = streams.Speaker(max_chunks=5)
+    for i in range(8):
+        speaker.write('startup {0}\n'.format(i))
+    assert speaker.pending()
+
+    term = terminal.Terminal()
+    qtbot.addWidget(term)
+    qtbot.waitUntil(lambda: term.speaker is not None)
+    # replayed as soon as the terminal connects,
+    # saying how much was dropped.
+    term.connect_speaker(speaker)
+    assert not speaker.pending()
+    lines = term.toPlainText().splitlines()
+    assert lines[0].startswith('# 3 chunks of output were dropped')
+    assert lines[1:] == ['startup {0}'.format(i) for i in range(3, 8)]
+
+    # once attached, nothing is dropped however much is queued.
+    for i in range(20):
+        speaker.write('{0}\n'.format(i))
+    chunks = speaker.read()
+    assert [c.text for c in chunks] == ['{0}\n'.format(i) for i in range(20)]
+
+
+def test_output_records(qtbot):
+    term = terminal.Terminal()
+    qtbot.addWidget(term)
+    qtbot.waitUntil(lambda: term.speaker is not None)
+    term.max_lines = 20
+
+    def chunk(text, execution):
+        return streams.Chunk(0, 0.0, 'MainThread', 'stderr', text, execution)
+
+    term.insert_chunks([chunk('{0}\n'.format(i), 1) for i in range(30)])
+    term.insert_chunks([
+        chunk('Traceback (most recent call last):\n'
+              '  File "/a/b.py", line 3, in f\n', 2),
+        chunk('ValueError\n', 2),
+    ])
+    term.receive('plain\n')
+    doc = term.document()
+    assert doc.blockCount() == 20
+
+    # tracebacks and frames are found from the records.
+    block = doc.findBlockByNumber(term.block_of(term.output.last_traceback()))
+    assert block.text().startswith('Traceback')
+    assert term.frame_at(block.blockNumber() + 1) == '/a/b.py:3'
+    assert term.frame_at(block.blockNumber() + 3) is None
+    term.goto_last_traceback()
+    assert term.textCursor().block().text().startswith('Traceback')
+
+    # including output trimmed from the scrollback.
+    term.show_execution(1)
+    assert term.toPlainText() == ''.join('{0}\n'.format(i) for i in range(11, 30))
+    term.show_execution(2)
+    assert term.toPlainText().splitlines()[-1] == 'ValueError'
+    assert term.frame_at(1) == '/a/b.py:3'
+    term.show_execution()
+    assert doc.blockCount() == 20
+
+
+def test_rerender_does_not_spill(qtbot, tmp_path):
+    term = terminal.Terminal()
+    qtbot.addWidget(term)
+    qtbot.waitUntil(lambda: term.speaker is not None)
+    term.max_lines = 50
+    term.spill_log = terminal.RotatingLog(str(tmp_path / 'terminal.log'))
+
+    term.insert_chunks([
+        streams.Chunk(i, 0.0, 'MainThread', 'stdout', '{0}\n'.format(i), 0)
+        for i in range(100)
+    ])
+    spilled = term.spill_log.tail(1000)
+    assert len(spilled) == 51
+    term.show_execution(0)
+    term.show_execution()
+    assert term.spill_log.tail(1000) == spilled
+    assert term.toPlainText().splitlines()[-1] == '99'
@@ -0,0 +1,13 @@
+from PythonEditor.utils.rotatinglog import RotatingLog
+
+
+def test_rotating_log(tmp_path):
+    log = RotatingLog(str(tmp_path / 'out.log'), max_bytes=100, backups=2)
+    for i in range(50):
+        log.write('line {0:02d}\n'.format(i))
+    assert log.tail(3) == ['line 47\n', 'line 48\n', 'line 49\n']
+    assert log.tail(2, skip=20) == ['line 28\n', 'line 29\n']
+    # three files of up to 100 bytes, so the oldest lines are gone.
+    lines = log.tail(100)
+    assert lines[0] == 'line 24\n'
+    assert len(lines) == 26
@@ -0,0 +1,87 @@
+# tests the single-pass syntax highlighter.
+
+from PythonEditor.ui.features import syntaxhighlighter
+
+
+def styles(line, state=0):
+    """Return the words of the line with their styles, and the end state."""
+    H = syntaxhighlighter.Highlight
+    words = {}
+    for names, style in (
+            (H.keywords, 'keyword'),
+            (H.instantiators, 'instantiators'),
+            (H.arguments, 'arguments'),
+        ):
+        for name in names:
+            words[name] = style
+    lexer = syntaxhighlighter.Lexer(words)
+    spans, state = lexer.scan(line, state)
+    return [(line[s:s+l], style) for s, l, style in spans], state
+
+
+def test_lexer_styles():
+    """Test that a line is split into the expected spans."""
+    assert styles('class Node(base.Base):') == ([
+        ('class', 'instantiators'),
+        ('Node', 'class_names'),
+        ('base', 'inherited'),
+        ('Base', 'inherited'),
+    ], 0)
+    assert styles('    def run(self, x=1):  # go "now"') == ([
+        ('def', 'instantiators'),
+        ('run', 'function_names'),
+        ('self', 'arguments'),
+        ('=', 'keyword'),
+        ('1', 'numbers'),
+        ('# go "now"', 'comment'),
+    ], 0)
+    assert styles("x = r'a # b' + self.go(x)") == ([
+        ('=', 'keyword'),
+        ('r', 'formatters'),
+        ("'a # b'", 'string'),
+        ('+', 'keyword'),
+        ('self', 'arguments'),
+        ('go', 'methods'),
+    ], 0)
+
+
+def test_lexer_triple_quotes():
+    """Test that triple-quoted strings carry over between lines."""
+    IN_DOUBLE = syntaxhighlighter.IN_TRIPLE_DOUBLE
+    assert styles('x = """doc # not a comment') == ([
+        ('=', 'keyword'),
+        ('"""doc # not a comment', 'multiline_str'),
+    ], IN_DOUBLE)
+    assert styles("it's still # open", IN_DOUBLE) == ([
+        ("it's still # open", 'multiline_str'),
+    ], IN_DOUBLE)
+    assert styles('end""" # done', IN_DOUBLE) == ([
+        ('end"""', 'multiline_str'),
+        ('# done', 'comment'),
+    ], 0)
+
+
+def test_semantic_spans():
+    """Test that definitions, parameters and imports are found."""
+    from PythonEditor.ui.features import semantics
+    text = (
+        'import os\n'
+        'def run(path, call):\n'
+        '    name = os.path.basename(path)\n'
+        '    return call(name)\n'
+    )
+    lines = text.split('\n')
+    spans = semantics.semantic_spans(text)
+    found = {
+        number: [(line[s:s+l], style) for s, l, style in sorted(line_spans)]
+        for number, (line, line_spans) in spans.items()
+    }
+    assert found == {
+        0: [('os', 'imports')],
+        1: [('run', 'function_names'),
+            ('path', 'arguments'),
+            ('call', 'arguments')],
+        2: [('os', 'imports'), ('path', 'arguments')],
+        3: [('call', 'arguments')],
+    }
+    assert spans[2][0] == lines[2]